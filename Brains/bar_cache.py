@@ -0,0 +1,339 @@
+"""In-memory ring buffers of recent price bars and their indicator state, fronting the SQLite bar store."""
+
+import math
+from collections import deque
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'tao_in', 'alpha_in', 'tick_count')
+_DTYPES = {'bar_time': np.int64, 'tick_count': np.int64}
+
+
+class RollingWindow:
+    """Min, max, mean and variance of the closed bars in a sliding window.
+
+    Covers bars [first, last) by absolute index, oldest first. Monotonic
+    deques of (index, close) give the window's extremes from their fronts,
+    and Welford's running mean and sum of squared deviations take both adds
+    and removals. Each bar is pushed and dropped once, so keeping the window
+    current is amortized O(1) per bar. The open bar, whose close still moves,
+    is never pushed; BarRing folds it in at query time.
+    """
+
+    __slots__ = ('first', 'last', 'highs', 'lows', 'count', 'mean', 'm2', 'removed')
+
+    def __init__(self, first: int):
+        self.first = first
+        self.last = first
+        self.highs = deque()
+        self.lows = deque()
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.removed = 0
+
+    def push(self, price: float):
+        highs, lows = self.highs, self.lows
+        while highs and highs[-1][1] <= price:
+            highs.pop()
+        highs.append((self.last, price))
+        while lows and lows[-1][1] >= price:
+            lows.pop()
+        lows.append((self.last, price))
+        self.last += 1
+        self.count += 1
+        delta = price - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (price - self.mean)
+
+    def drop(self, price: float):
+        """Remove the oldest bar, whose close is price."""
+        if self.highs and self.highs[0][0] == self.first:
+            self.highs.popleft()
+        if self.lows and self.lows[0][0] == self.first:
+            self.lows.popleft()
+        self.first += 1
+        self.removed += 1
+        self.count -= 1
+        if self.count == 0:
+            self.mean = 0.0
+            self.m2 = 0.0
+            return
+        previous_mean = self.mean
+        self.mean = previous_mean + (previous_mean - price) / self.count
+        self.m2 -= (price - previous_mean) * (price - self.mean)
+
+
+class BarRing:
+    """Bars for one subnet, oldest first, held in per-column NumPy arrays.
+
+    Live bars occupy [start, end) of every array, so any window that ends at
+    the newest bar is a contiguous slice: series() returns a view, not a copy.
+    When an append reaches the end of the arrays the live bars are moved back
+    to the front (doubling the arrays if they are more than half full), which
+    keeps appends amortized O(1). prune() only advances start.
+
+    Views are valid until the next fold() or prune(); callers use them within
+    a tick and do not keep them.
+
+    For each EMA span it has been asked about, the ring also streams a
+    zero-seeded EMA of close alongside the bars: appending a bar extends it
+    by one step, and re-folding the open bar redoes only that last step. Any
+    windowed EMA with the semantics of signals.ema() (seeded at the window's
+    first close) then follows in O(1) from the stream values at the window's
+    first and last bar, whatever bar the stream started from.
+
+    Rolling min/max/variance windows, keyed by their lookback, work the same
+    way: each RollingWindow slides forward over closed bars as the cutoff and
+    the newest bar advance, and the open bar is folded in per query.
+    """
+
+    __slots__ = ('columns', 'emas', 'windows', 'base', 'start', 'end')
+
+    def __init__(self, capacity: int = 512):
+        capacity = max(1, int(capacity))
+        self.columns = {
+            field: np.zeros(capacity, dtype=_DTYPES.get(field, np.float64))
+            for field in ('bar_time',) + BAR_FIELDS
+        }
+        self.emas: Dict[int, np.ndarray] = {}
+        self.windows: Dict[Hashable, RollingWindow] = {}
+        self.base = 0  # absolute index of array slot 0, advanced by _compact()
+        self.start = 0
+        self.end = 0
+
+    @classmethod
+    def from_rows(cls, rows: List[Tuple]) -> 'BarRing':
+        """Build a ring from (bar_time, open, high, low, close, tao_in, alpha_in, tick_count) rows."""
+        ring = cls(capacity=max(512, 2 * len(rows)))
+        if rows:
+            for index, column in enumerate(zip(*rows)):
+                name = 'bar_time' if index == 0 else BAR_FIELDS[index - 1]
+                ring.columns[name][:len(rows)] = column
+            ring.end = len(rows)
+        return ring
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    @property
+    def earliest(self) -> Optional[int]:
+        return int(self.columns['bar_time'][self.start]) if len(self) else None
+
+    @property
+    def latest(self) -> Optional[int]:
+        return int(self.columns['bar_time'][self.end - 1]) if len(self) else None
+
+    def _offset(self, cutoff: Optional[int]) -> int:
+        """Index of the first live bar with bar_time >= cutoff."""
+        if cutoff is None:
+            return self.start
+        times = self.columns['bar_time'][self.start:self.end]
+        return self.start + int(np.searchsorted(times, cutoff, side='left'))
+
+    def series(self, field: str, cutoff: Optional[int] = None) -> np.ndarray:
+        """View of one column for bars at or after cutoff."""
+        return self.columns[field][self._offset(cutoff):self.end]
+
+    def count(self, cutoff: Optional[int] = None) -> int:
+        return self.end - self._offset(cutoff)
+
+    def rows(self, cutoff: Optional[int] = None) -> List[Tuple]:
+        """Bars at or after cutoff as (bar_time, open, high, low, close, tao_in, alpha_in, tick_count)."""
+        first = self._offset(cutoff)
+        columns = [self.columns['bar_time'][first:self.end].tolist()]
+        columns.extend(self.columns[field][first:self.end].tolist() for field in BAR_FIELDS)
+        return list(zip(*columns))
+
+    def fold(self, bar_time: int, price: float, tao_in: float, alpha_in: float) -> bool:
+        """Fold one tick into the newest bar or open a new one.
+
+        Mirrors the SQLite upsert in PriceBarStore.record_ticks(). Returns
+        False for a tick older than the newest bar, which the caller handles
+        by reloading the subnet from the database.
+        """
+        latest = self.latest
+        if latest is not None and bar_time < latest:
+            return False
+        columns = self.columns
+        if latest == bar_time:
+            last = self.end - 1
+            columns['high'][last] = max(columns['high'][last], price)
+            columns['low'][last] = min(columns['low'][last], price)
+            columns['close'][last] = price
+            columns['tao_in'][last] = tao_in
+            columns['alpha_in'][last] = alpha_in
+            columns['tick_count'][last] += 1
+            self._step_emas(last)
+            return True
+        if self.end == len(columns['bar_time']):
+            self._compact()
+        slot = self.end
+        columns['bar_time'][slot] = bar_time
+        for field in ('open', 'high', 'low', 'close'):
+            columns[field][slot] = price
+        columns['tao_in'][slot] = tao_in
+        columns['alpha_in'][slot] = alpha_in
+        columns['tick_count'][slot] = 1
+        self._step_emas(slot)
+        self.end += 1
+        return True
+
+    def _step_ema(self, span: int, stream: np.ndarray, slot: int):
+        k = 2.0 / (span + 1)
+        previous = stream[slot - 1] if slot > self.start else 0.0
+        stream[slot] = self.columns['close'][slot] * k + previous * (1.0 - k)
+
+    def _step_emas(self, slot: int):
+        for span, stream in self.emas.items():
+            self._step_ema(span, stream, slot)
+
+    def _ema_stream(self, span: int) -> np.ndarray:
+        """The zero-seeded EMA of close for span, started from the oldest live bar on first use."""
+        stream = self.emas.get(span)
+        if stream is None:
+            stream = self.emas[span] = np.zeros(len(self.columns['close']))
+            for slot in range(self.start, self.end):
+                self._step_ema(span, stream, slot)
+        return stream
+
+    def ema(self, span: int, cutoff: Optional[int] = None, skip_last: int = 0) -> Optional[float]:
+        """signals.ema(closes[:-skip_last] or closes, span) over bars at or after cutoff."""
+        first = self._offset(cutoff)
+        last = self.end - 1 - skip_last
+        if last < first:
+            return None
+        close = self.columns['close']
+        if last == first:
+            return float(close[first])
+        stream = self._ema_stream(span)
+        decay = (1.0 - 2.0 / (span + 1)) ** (last - first)
+        return float(close[first] * decay + stream[last] - stream[first] * decay)
+
+    def ema_slope(self, span: int, lookback: int, cutoff: Optional[int] = None) -> float:
+        """signals.ema_slope() over the closes of bars at or after cutoff."""
+        if self.count(cutoff) < lookback + 1 or lookback <= 0:
+            return 0.0
+        ema_now = self.ema(span, cutoff)
+        ema_then = self.ema(span, cutoff, skip_last=lookback)
+        if ema_now is None or ema_then is None or ema_then == 0:
+            return 0.0
+        return (ema_now - ema_then) / ema_then
+
+    def _window(self, key: Hashable, cutoff: Optional[int]) -> RollingWindow:
+        """The RollingWindow for key, slid to cover the closed bars at or after cutoff."""
+        first = self._offset(cutoff) + self.base
+        closed_end = self.end - 1 + self.base
+        window = self.windows.get(key)
+        if (
+            window is None
+            or first < window.first  # cutoff moved back
+            or first > window.last  # jumped past everything pushed
+            or window.first < self.base + self.start  # its oldest bars were pruned
+            or window.removed > max(window.count, 64)  # re-anchor Welford sums once per turnover
+        ):
+            window = self.windows[key] = RollingWindow(first)
+        close = self.columns['close']
+        while window.last < closed_end:
+            window.push(float(close[window.last - self.base]))
+        while window.first < first:
+            window.drop(float(close[window.first - self.base]))
+        return window
+
+    def range_position(self, key: Hashable, cutoff: Optional[int] = None) -> float:
+        """signals.range_position() over the closes of bars at or after cutoff."""
+        if self.count(cutoff) < 2:
+            return 0.5
+        window = self._window(key, cutoff)
+        price = self.columns['close'][self.end - 1]
+        high = max(window.highs[0][1], price) if window.highs else price
+        low = min(window.lows[0][1], price) if window.lows else price
+        if high == low:
+            return 0.5
+        return float((price - low) / (high - low))
+
+    def volatility(self, key: Hashable, cutoff: Optional[int] = None) -> float:
+        """signals.volatility() over the closes of bars at or after cutoff."""
+        total = self.count(cutoff)
+        if total < 2:
+            return 0.0
+        window = self._window(key, cutoff)
+        price = float(self.columns['close'][self.end - 1])
+        delta = price - window.mean
+        mean = window.mean + delta / total
+        m2 = window.m2 + delta * (price - mean)
+        if mean == 0:
+            return 0.0
+        return math.sqrt(max(0.0, m2) / total) / mean
+
+    def _compact(self):
+        live = len(self)
+        capacity = len(self.columns['bar_time'])
+        if live * 2 > capacity:
+            capacity *= 2
+        for arrays in (self.columns, self.emas):
+            for key, column in arrays.items():
+                moved = np.zeros(capacity, dtype=column.dtype)
+                moved[:live] = column[self.start:self.end]
+                arrays[key] = moved
+        self.base += self.start
+        self.start = 0
+        self.end = live
+
+    def prune(self, cutoff: int):
+        """Drop bars older than cutoff."""
+        self.start = self._offset(cutoff)
+
+
+class BarCache:
+    """Per-netuid BarRings mirroring the price_bars table.
+
+    PriceBarStore hydrates it once from SQLite, folds every recorded tick
+    into it after the write commits and serves its bar reads from it, so the
+    database is only touched for persistence. It assumes the store is the
+    only writer of the table.
+    """
+
+    def __init__(self):
+        self._rings: Dict[int, BarRing] = {}
+
+    def __contains__(self, netuid: int) -> bool:
+        return netuid in self._rings
+
+    def netuids(self) -> List[int]:
+        return sorted(self._rings)
+
+    def ring(self, netuid: int) -> Optional[BarRing]:
+        return self._rings.get(netuid)
+
+    def load(self, rows: Iterable[Tuple], netuids: Optional[Iterable[int]] = None):
+        """Replace rings from (bar_time, netuid, open, ..., tick_count) rows ordered by bar_time.
+
+        With netuids, only those subnets are replaced (and dropped if they
+        have no rows); otherwise the whole cache is.
+        """
+        grouped: Dict[int, List[Tuple]] = {}
+        for row in rows:
+            grouped.setdefault(row[1], []).append((row[0],) + tuple(row[2:]))
+        if netuids is None:
+            self._rings = {}
+            netuids = grouped.keys()
+        for netuid in list(netuids):
+            if netuid in grouped:
+                self._rings[netuid] = BarRing.from_rows(grouped[netuid])
+            else:
+                self._rings.pop(netuid, None)
+
+    def fold(self, netuid: int, bar_time: int, price: float, tao_in: float, alpha_in: float) -> bool:
+        ring = self._rings.get(netuid)
+        if ring is None:
+            ring = self._rings[netuid] = BarRing()
+        return ring.fold(bar_time, price, tao_in, alpha_in)
+
+    def prune(self, cutoff: int):
+        for netuid in list(self._rings):
+            ring = self._rings[netuid]
+            ring.prune(cutoff)
+            if not len(ring):
+                del self._rings[netuid]
@@ -6,7 +6,7 @@ import os
 import time
 from datetime import datetime, timezone
 from dataclasses import replace
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
 
 from Brains import config
 from Brains.models import ThresholdPatch, FillRecord, SubnetState
@@ -146,6 +146,10 @@ class StrategyEngine:
         self.runtime_netuids: Set[int] = set()
         self.buy_roster_netuids: Set[int] = set()
         self.runtime_ordered_netuids: List[int] = []
+        # Per-subnet bar time already recorded and last signal snapshot, so
+        # subnets whose pools did not change can skip both on the next tick.
+        self._recorded_bar_times: Dict[int, int] = {}
+        self._signal_cache: Dict[int, Tuple] = {}
         self.refresh_runtime_settings(bagbot_settings)
 
         # Telegram notifications via stub logger (Arbos handles actual Telegram UI)
@@ -316,16 +320,21 @@ class StrategyEngine:
                 runtime_grids[netuid] = dict(self.dynamic_subnet_grids[netuid])
         return runtime_grids
 
-    def on_tick(self, stats: Dict, subnet_grids: Dict, stake_info: Dict, balance: float):
+    def on_tick(self, stats: Dict, subnet_grids: Dict, stake_info: Dict, balance: float,
+                dirty_netuids: Optional[Set[int]] = None):
         """Called each bot tick after refresh_stats().
 
         Records price bars for all observed subnets, computes strategy
         patches for a dynamic roster built from all observed subnets.
+        dirty_netuids lists the subnets whose pools changed since the last
+        tick (None = all); clean subnets skip re-recording an already-open
+        bar and reuse their last signal snapshot.
         """
         self.refresh_strategy_config()
         self.taostats_flow_cache.maybe_refresh()
         now = time.time()
         preset = get_preset(self.risk_mode)
+        current_bar_time = self.bar_store.bar_time(now, self.bar_minutes)
 
         # Compute portfolio value for turnover limits
         portfolio_value = balance
@@ -335,16 +344,23 @@ class StrategyEngine:
                 if stake_obj and float(stake_obj.stake) > 0 and netuid in stats:
                     portfolio_value += float(stake_obj.stake) * stats[netuid]['price']
 
-        # Record price bars for ALL observed subnets
+        # Record price bars for ALL observed subnets, in one transaction
+        bar_rows = []
         for netuid, sdata in stats.items():
             price = sdata.get('price', 0)
             tao_in = sdata.get('tao_in', 0)
             alpha_in = sdata.get('alpha_in', 0)
             if price > 0:
-                self.bar_store.record_tick(
-                    netuid, price, tao_in, alpha_in,
-                    timestamp=now, bar_minutes=self.bar_minutes,
-                )
+                if (
+                    dirty_netuids is not None
+                    and netuid not in dirty_netuids
+                    and self._recorded_bar_times.get(netuid) == current_bar_time
+                ):
+                    continue
+                bar_rows.append((netuid, price, tao_in, alpha_in))
+        self.bar_store.record_ticks(bar_rows, timestamp=now, bar_minutes=self.bar_minutes)
+        for netuid, _, _, _ in bar_rows:
+            self._recorded_bar_times[netuid] = current_bar_time
 
         held_netuids: Set[int] = set()
         for hotkey in stake_info:
@@ -395,19 +411,33 @@ class StrategyEngine:
                 logger.debug(f'Brains sn{netuid}: skipped - {reason}')
                 continue
 
-            # Compute signals
-            snap = compute_signals(
-                netuid=netuid,
-                spot_price=sdata['price'],
-                tao_in=sdata.get('tao_in', 0),
-                alpha_in=sdata.get('alpha_in', 0),
-                current_alpha=current_alpha,
-                max_alpha=max_alpha,
-                max_buy_tao=max_buy_tao,
-                bar_store=self.bar_store,
-                now=now,
-                cfg=self.cfg,
+            # Compute signals (reused while the pool and its bar window are unchanged)
+            signal_key = (
+                current_bar_time, self.bar_minutes, current_alpha, max_alpha, max_buy_tao,
+                tuple(sorted(self.cfg.get('lookbacks', {}).items())),
             )
+            cached = self._signal_cache.get(netuid)
+            if (
+                dirty_netuids is not None
+                and netuid not in dirty_netuids
+                and cached is not None
+                and cached[0] == signal_key
+            ):
+                snap = cached[1]
+            else:
+                snap = compute_signals(
+                    netuid=netuid,
+                    spot_price=sdata['price'],
+                    tao_in=sdata.get('tao_in', 0),
+                    alpha_in=sdata.get('alpha_in', 0),
+                    current_alpha=current_alpha,
+                    max_alpha=max_alpha,
+                    max_buy_tao=max_buy_tao,
+                    bar_store=self.bar_store,
+                    now=now,
+                    cfg=self.cfg,
+                )
+                self._signal_cache[netuid] = (signal_key, snap)
             if flow_snapshot is not None:
                 snap = replace(snap, **flow_snapshot)
 
@@ -532,12 +562,14 @@ class StrategyEngine:
 
         # Prune old bars periodically
         self.bar_store.prune(max_hours=96)
+        self.bar_store.maybe_checkpoint()
 
     def on_fill(self, netuid: int, side: str, tao_amount: float,
-                alpha_amount: float, price: float, tx_hash: str = ''):
+                alpha_amount: float, price: float, tx_hash: str = '') -> int:
         """Called after a confirmed trade execution.
 
-        Updates cost basis, daily turnover, and trade cooldowns.
+        Updates cost basis, daily turnover, and trade cooldowns. Returns the
+        fill id to hand to reconcile_fill() once the realized amounts are known.
         """
         now = time.time()
         fill = FillRecord(
@@ -547,7 +579,7 @@ class StrategyEngine:
         )
 
         # Record in SQLite
-        self.bar_store.record_fill(fill)
+        fill_id = self.bar_store.record_fill(fill)
 
         # Update cost basis
         self.state_store.update_cost_basis(netuid, fill)
@@ -568,6 +600,33 @@ class StrategyEngine:
                    f'{alpha_amount:.2f} alpha @ {price:.6f}')
             self.telegram.send_async(msg)
 
+        return fill_id
+
+    def reconcile_fill(self, fill_id: int, tao_amount: float, alpha_amount: float,
+                       price: float, fee_tao: float = 0.0, tx_hash: str = '',
+                       block_number: int = 0):
+        """Replace an estimated fill with the amounts its on-chain events report.
+
+        Rewrites the fills row and corrects the cost basis by the difference
+        between the estimate booked in on_fill() and the realized amounts.
+        """
+        estimated = self.bar_store.get_fill(fill_id)
+        if estimated is None or estimated.reconciled:
+            return
+        realized = FillRecord(
+            netuid=estimated.netuid, side=estimated.side, tao_amount=tao_amount,
+            alpha_amount=alpha_amount, price=price, timestamp=estimated.timestamp,
+            tx_hash=tx_hash, fee_tao=fee_tao, block_number=block_number, reconciled=True,
+        )
+        self.bar_store.reconcile_fill(fill_id, realized)
+        self.state_store.reconcile_cost_basis(estimated.netuid, estimated, realized)
+        logger.info(
+            f'Brains sn{estimated.netuid}: fill reconciled - {estimated.side} '
+            f'{estimated.tao_amount:.4f} -> {tao_amount:.4f} TAO / '
+            f'{estimated.alpha_amount:.2f} -> {alpha_amount:.2f} alpha @ {price:.6f}, '
+            f'fee {fee_tao:.6f} TAO ({tx_hash} in block {block_number})'
+        )
+
     def get_patch(self, netuid: int) -> Optional[ThresholdPatch]:
         """Get the current strategy patch for a subnet, or None."""
         return self.patches.get(netuid)
@@ -82,3 +82,6 @@ class FillRecord:
     price: float        # effective price
     timestamp: float
     tx_hash: str = ''
+    fee_tao: float = 0.0
+    block_number: int = 0
+    reconciled: bool = False  # amounts decoded from chain events rather than estimated
@@ -197,7 +197,9 @@ def evaluate_config(
     min_trade_tao: float,
     netuids: Optional[List[int]] = None,
 ) -> ReplayResult:
-    source_store = PriceBarStore(db_path)
+    if not os.path.exists(db_path):
+        raise RuntimeError(f"No price bars found in {db_path}")
+    source_store = PriceBarStore(db_path, read_only=True)
     try:
         latest_bar_time = source_store.get_latest_bar_time()
         if latest_bar_time is None:
@@ -8,13 +8,13 @@ def ema(prices: List[float], span_bars: int) -> Optional[float]:
     """Compute exponential moving average over a list of close prices.
 
     Args:
-        prices: List of close prices, oldest first.
+        prices: Close prices (list or NumPy array), oldest first.
         span_bars: EMA span in number of bars.
 
     Returns:
         EMA value, or None if prices is empty.
     """
-    if not prices:
+    if len(prices) == 0:
         return None
     if len(prices) == 1:
         return prices[0]
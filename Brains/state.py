@@ -5,8 +5,13 @@ import os
 import sqlite3
 import time
 import logging
-from typing import List, Dict, Optional, Tuple
+from pathlib import Path
+from typing import Iterable, List, Dict, Optional, Tuple
 
+import numpy as np
+
+from Brains import signals
+from Brains.bar_cache import BAR_FIELDS, BarCache
 from Brains.models import SubnetState, FillRecord
 
 logger = logging.getLogger(__name__)
@@ -16,16 +21,80 @@ _STATE_DIR = os.path.join(os.path.dirname(__file__), 'state')
 _STATE_PATH = os.path.join(_STATE_DIR, 'threshold_farm_state.json')
 
 
-class PriceBarStore:
-    """SQLite store for 15-minute OHLC price bars per subnet."""
+_FILL_COLUMNS = (
+    'timestamp, netuid, side, tao_amount, alpha_amount, price, tx_hash, '
+    'fee_tao, block_number, reconciled'
+)
+
 
-    def __init__(self, db_path=None):
+def _fill_from_row(r) -> FillRecord:
+    return FillRecord(
+        timestamp=r[0], netuid=r[1], side=r[2], tao_amount=r[3],
+        alpha_amount=r[4], price=r[5], tx_hash=r[6],
+        fee_tao=r[7], block_number=r[8], reconciled=bool(r[9]),
+    )
+
+
+class PriceBarStore:
+    """SQLite store for 15-minute OHLC price bars per subnet.
+
+    The writer (the trading loop) keeps the database in WAL mode with
+    synchronous=NORMAL, so readers never block its commits and a commit is
+    not an fsync. Consumers such as the research harness open it with
+    read_only=True, which uses a query-only connection that cannot take the
+    write lock. maybe_checkpoint() folds the WAL back periodically with a
+    PASSIVE checkpoint, which skips pages still held by a long reader
+    instead of waiting for it.
+
+    A writer also keeps every subnet's bars in an in-memory BarCache,
+    hydrated at open and updated by record_ticks(), and answers the bar reads
+    used for signals from it; get_series() and get_close_prices() return
+    zero-copy NumPy views, get_ema()/get_ema_slope() come from EMA state the
+    cache streams bar by bar, and get_range_position()/get_volatility() from
+    rolling windows kept per lookback, instead of rescanning each window.
+    Read-only stores query SQLite directly, since another process owns the
+    writes.
+    """
+
+    CHECKPOINT_INTERVAL_SECONDS = 300
+
+    def __init__(self, db_path=None, read_only=False, busy_timeout_ms=5000):
         self.db_path = db_path or _DB_PATH
+        self.read_only = read_only
+        self.busy_timeout_ms = busy_timeout_ms
         self._conn = None
-        self._init_db()
+        self._last_checkpoint_at = time.monotonic()
+        self._bars: Optional[BarCache] = None
+        if read_only:
+            self._open_read_only()
+        else:
+            self._init_db()
+            self._bars = BarCache()
+            self._hydrate_bars()
+
+    def _open_read_only(self):
+        # mode=ro never creates the file; say so plainly instead of sqlite's
+        # "unable to open database file".
+        if not os.path.exists(self.db_path):
+            raise FileNotFoundError(f'No price history database at {self.db_path}')
+        uri = Path(os.path.abspath(self.db_path)).as_uri()  # percent-encodes '?', '#' and '%'
+        self._conn = sqlite3.connect(
+            f'{uri}?mode=ro', uri=True, timeout=self.busy_timeout_ms / 1000.0,
+        )
+        self._conn.execute('PRAGMA query_only = ON')
+        self._conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+
+    def _configure_writer(self):
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        self._conn.execute('PRAGMA cache_size = -16000')  # KiB
+        self._conn.execute('PRAGMA temp_store = MEMORY')
+        self._conn.execute('PRAGMA journal_size_limit = 67108864')  # cap the WAL file at 64 MiB once reset
 
     def _init_db(self):
-        self._conn = sqlite3.connect(self.db_path)
+        self._conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000.0)
+        self._configure_writer()
         self._conn.execute('''
             CREATE TABLE IF NOT EXISTS price_bars (
                 bar_time INTEGER NOT NULL,
@@ -49,9 +118,21 @@ class PriceBarStore:
                 tao_amount REAL NOT NULL,
                 alpha_amount REAL NOT NULL,
                 price REAL NOT NULL,
-                tx_hash TEXT DEFAULT ''
+                tx_hash TEXT DEFAULT '',
+                fee_tao REAL NOT NULL DEFAULT 0,
+                block_number INTEGER NOT NULL DEFAULT 0,
+                reconciled INTEGER NOT NULL DEFAULT 0
             )
         ''')
+        # Databases created before fill reconciliation lack the realized-fill columns.
+        fill_columns = {row[1] for row in self._conn.execute('PRAGMA table_info(fills)')}
+        for column, ddl in (
+            ('fee_tao', 'REAL NOT NULL DEFAULT 0'),
+            ('block_number', 'INTEGER NOT NULL DEFAULT 0'),
+            ('reconciled', 'INTEGER NOT NULL DEFAULT 0'),
+        ):
+            if column not in fill_columns:
+                self._conn.execute(f'ALTER TABLE fills ADD COLUMN {column} {ddl}')
         self._conn.execute(
             'CREATE INDEX IF NOT EXISTS idx_bars_netuid_time ON price_bars(netuid, bar_time)'
         )
@@ -65,6 +146,38 @@ class PriceBarStore:
             self._conn.close()
             self._conn = None
 
+    def checkpoint(self) -> Tuple[int, int, int]:
+        """Run a PASSIVE WAL checkpoint; returns (busy, wal_pages, checkpointed_pages)."""
+        self._last_checkpoint_at = time.monotonic()
+        return tuple(self._conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone())
+
+    def maybe_checkpoint(self, interval_seconds: float = None) -> bool:
+        """Checkpoint if the last one is older than interval_seconds. Never waits on readers."""
+        if self.read_only:
+            return False
+        interval = self.CHECKPOINT_INTERVAL_SECONDS if interval_seconds is None else interval_seconds
+        if time.monotonic() - self._last_checkpoint_at < interval:
+            return False
+        busy, wal_pages, checkpointed = self.checkpoint()
+        if wal_pages > 0 and checkpointed < wal_pages:
+            logger.debug(f'WAL checkpoint left {wal_pages - checkpointed} of {wal_pages} pages behind active readers')
+        return True
+
+    def _hydrate_bars(self, netuids: Optional[Iterable[int]] = None):
+        """Load bars from SQLite into the cache, for all subnets or just netuids."""
+        query = 'SELECT bar_time, netuid, open, high, low, close, tao_in, alpha_in, tick_count FROM price_bars'
+        params: Tuple = ()
+        if netuids is not None:
+            netuids = sorted(set(netuids))
+            query += f' WHERE netuid IN ({",".join("?" for _ in netuids)})'
+            params = tuple(netuids)
+        rows = self._conn.execute(query + ' ORDER BY bar_time ASC', params).fetchall()
+        self._bars.load(rows, netuids)
+
+    def _cutoff(self, hours: float, now: float = None) -> int:
+        now = now or time.time()
+        return int(now - (hours * 3600))
+
     def bar_time(self, timestamp: float, bar_minutes: int = 15) -> int:
         """Round a timestamp down to the nearest bar boundary."""
         bar_seconds = bar_minutes * 60
@@ -73,52 +186,110 @@ class PriceBarStore:
     def record_tick(self, netuid: int, price: float, tao_in: float, alpha_in: float,
                     timestamp: float = None, bar_minutes: int = 15):
         """Record a price tick, aggregating into the current bar."""
-        ts = timestamp or time.time()
-        bt = self.bar_time(ts, bar_minutes)
+        self.record_ticks([(netuid, price, tao_in, alpha_in)], timestamp=timestamp, bar_minutes=bar_minutes)
 
-        existing = self._conn.execute(
-            'SELECT open, high, low, close, tao_in, alpha_in, tick_count '
-            'FROM price_bars WHERE bar_time = ? AND netuid = ?',
-            (bt, netuid)
-        ).fetchone()
+    def record_ticks(self, snapshot: Iterable[Tuple[int, float, float, float]],
+                     timestamp: float = None, bar_minutes: int = 15) -> int:
+        """Record one tick for many subnets in a single transaction.
 
-        if existing:
-            o, h, l, c, ti, ai, tc = existing
-            self._conn.execute(
-                'UPDATE price_bars SET high = ?, low = ?, close = ?, '
-                'tao_in = ?, alpha_in = ?, tick_count = ? '
-                'WHERE bar_time = ? AND netuid = ?',
-                (max(h, price), min(l, price), price, tao_in, alpha_in, tc + 1, bt, netuid)
-            )
-        else:
-            self._conn.execute(
+        snapshot yields (netuid, price, tao_in, alpha_in). Each row is upserted
+        into its current bar, with high/low/close and tick_count folded in by
+        SQLite, so a block costs one executemany and one commit however many
+        subnets are observed. Returns the number of rows written.
+        """
+        ts = timestamp or time.time()
+        bt = self.bar_time(ts, bar_minutes)
+        rows = [
+            (bt, netuid, price, price, price, price, tao_in, alpha_in)
+            for netuid, price, tao_in, alpha_in in snapshot
+        ]
+        if not rows:
+            return 0
+        with self._conn:
+            self._conn.executemany(
                 'INSERT INTO price_bars (bar_time, netuid, open, high, low, close, tao_in, alpha_in, tick_count) '
-                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)',
-                (bt, netuid, price, price, price, price, tao_in, alpha_in)
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1) '
+                'ON CONFLICT (bar_time, netuid) DO UPDATE SET '
+                'high = max(high, excluded.high), low = min(low, excluded.low), close = excluded.close, '
+                'tao_in = excluded.tao_in, alpha_in = excluded.alpha_in, tick_count = tick_count + 1',
+                rows,
             )
-        self._conn.commit()
+        if self._bars is not None:
+            stale = {
+                netuid for bt, netuid, price, _, _, _, tao_in, alpha_in in rows
+                if not self._bars.fold(netuid, bt, price, tao_in, alpha_in)
+            }
+            if stale:
+                self._hydrate_bars(stale)
+        return len(rows)
 
     def get_bars(self, netuid: int, hours: float, now: float = None) -> List[Tuple]:
         """Get price bars for a subnet over the last N hours.
 
         Returns list of (bar_time, open, high, low, close, tao_in, alpha_in, tick_count).
         """
-        now = now or time.time()
-        cutoff = now - (hours * 3600)
+        cutoff = self._cutoff(hours, now)
+        if self._bars is not None:
+            ring = self._bars.ring(netuid)
+            return ring.rows(cutoff) if ring is not None else []
         rows = self._conn.execute(
             'SELECT bar_time, open, high, low, close, tao_in, alpha_in, tick_count '
             'FROM price_bars WHERE netuid = ? AND bar_time >= ? ORDER BY bar_time ASC',
-            (netuid, int(cutoff))
+            (netuid, cutoff)
         ).fetchall()
         return rows
 
-    def get_close_prices(self, netuid: int, hours: float, now: float = None) -> List[float]:
+    def get_series(self, netuid: int, field: str, hours: float, now: float = None) -> np.ndarray:
+        """Get one bar column (close, tao_in, ...) for a subnet over the last N hours, oldest first."""
+        if field not in BAR_FIELDS:
+            raise ValueError(f'Unknown bar field: {field}')
+        cutoff = self._cutoff(hours, now)
+        if self._bars is not None:
+            ring = self._bars.ring(netuid)
+            return ring.series(field, cutoff) if ring is not None else np.empty(0)
+        rows = self._conn.execute(
+            f'SELECT {field} FROM price_bars WHERE netuid = ? AND bar_time >= ? ORDER BY bar_time ASC',
+            (netuid, cutoff)
+        ).fetchall()
+        return np.array([row[0] for row in rows], dtype=np.float64)
+
+    def get_close_prices(self, netuid: int, hours: float, now: float = None) -> np.ndarray:
         """Get just close prices for a subnet over the last N hours."""
-        bars = self.get_bars(netuid, hours, now)
-        return [b[4] for b in bars]  # index 4 = close
+        return self.get_series(netuid, 'close', hours, now)
+
+    def get_ema(self, netuid: int, span_bars: int, hours: float, now: float = None) -> Optional[float]:
+        """signals.ema() of the close prices over the last N hours."""
+        if self._bars is not None:
+            ring = self._bars.ring(netuid)
+            return ring.ema(span_bars, self._cutoff(hours, now)) if ring is not None else None
+        return signals.ema(self.get_close_prices(netuid, hours, now), span_bars)
+
+    def get_ema_slope(self, netuid: int, span_bars: int, lookback_bars: int,
+                      hours: float, now: float = None) -> float:
+        """signals.ema_slope() of the close prices over the last N hours."""
+        if self._bars is not None:
+            ring = self._bars.ring(netuid)
+            return ring.ema_slope(span_bars, lookback_bars, self._cutoff(hours, now)) if ring is not None else 0.0
+        return signals.ema_slope(self.get_close_prices(netuid, hours, now), span_bars, lookback_bars)
+
+    def get_range_position(self, netuid: int, hours: float, now: float = None) -> float:
+        """signals.range_position() of the close prices over the last N hours."""
+        if self._bars is not None:
+            ring = self._bars.ring(netuid)
+            return ring.range_position(hours, self._cutoff(hours, now)) if ring is not None else 0.5
+        return signals.range_position(self.get_close_prices(netuid, hours, now))
+
+    def get_volatility(self, netuid: int, hours: float, now: float = None) -> float:
+        """signals.volatility() of the close prices over the last N hours."""
+        if self._bars is not None:
+            ring = self._bars.ring(netuid)
+            return ring.volatility(hours, self._cutoff(hours, now)) if ring is not None else 0.0
+        return signals.volatility(self.get_close_prices(netuid, hours, now))
 
     def list_netuids(self) -> List[int]:
         """Return all netuids present in the price history store."""
+        if self._bars is not None:
+            return self._bars.netuids()
         rows = self._conn.execute(
             'SELECT DISTINCT netuid FROM price_bars ORDER BY netuid ASC'
         ).fetchall()
@@ -149,6 +320,11 @@ class PriceBarStore:
 
     def get_bar_count(self, netuid: int, hours: float = None, now: float = None) -> int:
         """Count available bars for a subnet."""
+        if self._bars is not None:
+            ring = self._bars.ring(netuid)
+            if ring is None:
+                return 0
+            return ring.count(None if hours is None else self._cutoff(hours, now))
         now = now or time.time()
         if hours is None:
             row = self._conn.execute(
@@ -164,6 +340,9 @@ class PriceBarStore:
 
     def get_earliest_bar_time(self, netuid: int) -> Optional[float]:
         """Get the earliest bar timestamp for a subnet."""
+        if self._bars is not None:
+            ring = self._bars.ring(netuid)
+            return ring.earliest if ring is not None else None
         row = self._conn.execute(
             'SELECT MIN(bar_time) FROM price_bars WHERE netuid = ?', (netuid,)
         ).fetchone()
@@ -171,6 +350,10 @@ class PriceBarStore:
 
     def get_latest_bar_time(self, netuid: Optional[int] = None) -> Optional[float]:
         """Get the latest recorded bar timestamp."""
+        if self._bars is not None:
+            rings = [self._bars.ring(n) for n in ([netuid] if netuid is not None else self._bars.netuids())]
+            latest = [ring.latest for ring in rings if ring is not None]
+            return max(latest) if latest else None
         if netuid is None:
             row = self._conn.execute('SELECT MAX(bar_time) FROM price_bars').fetchone()
         else:
@@ -188,19 +371,39 @@ class PriceBarStore:
         now = now or time.time()
         return (now - earliest) / 3600.0
 
-    def prune(self, max_hours: int = 96):
+    def prune(self, max_hours: int = 96, now: float = None):
         """Remove bars older than max_hours."""
-        cutoff = time.time() - (max_hours * 3600)
-        self._conn.execute('DELETE FROM price_bars WHERE bar_time < ?', (int(cutoff),))
+        cutoff = self._cutoff(max_hours, now)
+        self._conn.execute('DELETE FROM price_bars WHERE bar_time < ?', (cutoff,))
+        self._conn.commit()
+        if self._bars is not None:
+            self._bars.prune(cutoff)
+
+    def record_fill(self, fill: FillRecord) -> int:
+        """Record a confirmed trade execution. Returns the fill's row id."""
+        cursor = self._conn.execute(
+            'INSERT INTO fills (timestamp, netuid, side, tao_amount, alpha_amount, price, tx_hash, '
+            'fee_tao, block_number, reconciled) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (fill.timestamp, fill.netuid, fill.side, fill.tao_amount,
+             fill.alpha_amount, fill.price, fill.tx_hash,
+             fill.fee_tao, fill.block_number, int(fill.reconciled))
+        )
         self._conn.commit()
+        return cursor.lastrowid
 
-    def record_fill(self, fill: FillRecord):
-        """Record a confirmed trade execution."""
+    def get_fill(self, fill_id: int) -> Optional[FillRecord]:
+        row = self._conn.execute(
+            'SELECT ' + _FILL_COLUMNS + ' FROM fills WHERE id = ?', (fill_id,)
+        ).fetchone()
+        return _fill_from_row(row) if row else None
+
+    def reconcile_fill(self, fill_id: int, realized: FillRecord):
+        """Overwrite an estimated fill with the amounts decoded from its on-chain events."""
         self._conn.execute(
-            'INSERT INTO fills (timestamp, netuid, side, tao_amount, alpha_amount, price, tx_hash) '
-            'VALUES (?, ?, ?, ?, ?, ?, ?)',
-            (fill.timestamp, fill.netuid, fill.side, fill.tao_amount,
-             fill.alpha_amount, fill.price, fill.tx_hash)
+            'UPDATE fills SET tao_amount = ?, alpha_amount = ?, price = ?, tx_hash = ?, '
+            'fee_tao = ?, block_number = ?, reconciled = 1 WHERE id = ?',
+            (realized.tao_amount, realized.alpha_amount, realized.price, realized.tx_hash,
+             realized.fee_tao, realized.block_number, fill_id)
         )
         self._conn.commit()
 
@@ -209,14 +412,11 @@ class PriceBarStore:
         now = now or time.time()
         cutoff = now - (hours * 3600)
         rows = self._conn.execute(
-            'SELECT timestamp, netuid, side, tao_amount, alpha_amount, price, tx_hash '
+            'SELECT ' + _FILL_COLUMNS + ' '
             'FROM fills WHERE netuid = ? AND timestamp >= ? ORDER BY timestamp ASC',
             (netuid, cutoff)
         ).fetchall()
-        return [FillRecord(
-            timestamp=r[0], netuid=r[1], side=r[2], tao_amount=r[3],
-            alpha_amount=r[4], price=r[5], tx_hash=r[6]
-        ) for r in rows]
+        return [_fill_from_row(r) for r in rows]
 
     def get_daily_turnover(self, netuid: int, now: float = None) -> Tuple[float, float]:
         """Get total buy and sell TAO turnover in the last 24h."""
@@ -303,3 +503,27 @@ class StrategyStateStore:
                     state.avg_entry_price = None
         state.last_trade_at = fill.timestamp
         self.save()
+
+    def reconcile_cost_basis(self, netuid: int, estimated: FillRecord, realized: FillRecord):
+        """Correct the cost basis booked from an estimated fill to its realized amounts."""
+        state = self.get(netuid)
+        if estimated.side == 'buy':
+            state.total_cost_basis_tao = max(0.0, state.total_cost_basis_tao + realized.tao_amount - estimated.tao_amount)
+            state.total_alpha_bought = max(0.0, state.total_alpha_bought + realized.alpha_amount - estimated.alpha_amount)
+        elif estimated.side == 'sell' and state.total_alpha_bought > 0:
+            # A sell only moves cost basis through the alpha it removed.
+            extra_alpha = realized.alpha_amount - estimated.alpha_amount
+            if extra_alpha > 0:
+                sell_fraction = min(extra_alpha / state.total_alpha_bought, 1.0)
+                state.total_cost_basis_tao *= (1.0 - sell_fraction)
+                state.total_alpha_bought = max(0, state.total_alpha_bought - extra_alpha)
+            elif extra_alpha < 0 and state.avg_entry_price:
+                state.total_cost_basis_tao += -extra_alpha * state.avg_entry_price
+                state.total_alpha_bought += -extra_alpha
+        else:
+            return
+        if state.total_alpha_bought > 0:
+            state.avg_entry_price = state.total_cost_basis_tao / state.total_alpha_bought
+        else:
+            state.avg_entry_price = None
+        self.save()
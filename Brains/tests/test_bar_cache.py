@@ -0,0 +1,153 @@
+"""Tests for the in-memory bar cache against the SQLite reads and signals it replaces."""
+
+import math
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from Brains import signals
+from Brains.state import PriceBarStore
+from Brains.threshold_farm import compute_signals
+
+
+SIGNAL_CFG = {'bar_size_minutes': 15}
+
+
+class TestBarCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, 'bars.sqlite')
+        self.bar_store = PriceBarStore(self.db_path)
+
+    def tearDown(self):
+        self.bar_store.close()
+        self.tmpdir.cleanup()
+
+    def test_bar_cache_serves_the_same_windows_as_sqlite(self):
+        now = 1_700_000_000 // 900 * 900
+        for idx in range(600):
+            timestamp = now - (600 - idx) * 900
+            self.bar_store.record_ticks(
+                [(11, 1.0 + idx * 0.001, 500.0 + idx, 500.0), (22, 2.0 - idx * 0.001, 700.0, 350.0 + idx)],
+                timestamp=timestamp,
+            )
+            self.bar_store.record_tick(11, 0.5 + idx * 0.002, 501.0 + idx, 499.0, timestamp=timestamp + 60)
+        self.bar_store.record_tick(22, 9.0, 1.0, 1.0, timestamp=now - 300 * 900)  # out-of-order tick
+        self.bar_store.prune(max_hours=120, now=now)
+        reader = PriceBarStore(self.db_path, read_only=True)
+        try:
+            for netuid in (11, 22, 33):
+                for hours in (6.25, 24, 72, 200):
+                    close = self.bar_store.get_close_prices(netuid, hours, now)
+                    self.assertEqual(close.tolist(), reader.get_close_prices(netuid, hours, now).tolist())
+                    self.assertEqual(self.bar_store.get_bars(netuid, hours, now), reader.get_bars(netuid, hours, now))
+                    self.assertEqual(self.bar_store.get_bar_count(netuid, hours, now), reader.get_bar_count(netuid, hours, now))
+                self.assertEqual(self.bar_store.get_earliest_bar_time(netuid), reader.get_earliest_bar_time(netuid))
+            self.assertEqual(self.bar_store.get_latest_bar_time(), reader.get_latest_bar_time())
+            self.assertEqual(self.bar_store.list_netuids(), [11, 22])
+
+            window = self.bar_store.get_close_prices(11, 24, now)
+            self.assertTrue(window.base is not None and window.base is self.bar_store.get_close_prices(11, 72, now).base)
+            with patch.object(self.bar_store, '_conn', wraps=self.bar_store._conn) as conn:
+                compute_signals(11, 1.5, 1100.0, 500.0, 0.0, 10.0, 0.1, self.bar_store, now=now, cfg=SIGNAL_CFG)
+            conn.execute.assert_not_called()
+
+            hydrated = PriceBarStore(self.db_path)
+            try:
+                self.assertEqual(hydrated.get_bars(22, 200, now), reader.get_bars(22, 200, now))
+            finally:
+                hydrated.close()
+        finally:
+            reader.close()
+
+    def test_streamed_ema_matches_windowed_recompute(self):
+        start = 1_700_000_000 // 900 * 900
+        reader = PriceBarStore(self.db_path, read_only=True)
+        try:
+            for idx in range(700):
+                now = start + idx * 900
+                price = 1.0 + 0.3 * math.sin(idx / 17.0) + idx * 0.0005
+                self.bar_store.record_tick(11, price, 500.0, 500.0, timestamp=now)
+                self.bar_store.record_tick(11, price * 1.01, 500.0, 500.0, timestamp=now + 300)  # open bar moves
+                if idx % 50 == 0:
+                    self.bar_store.prune(max_hours=96, now=now)
+                if idx % 97 == 0 or idx == 699:
+                    with patch('Brains.signals.ema', wraps=signals.ema) as mock_ema:
+                        streamed = [
+                            self.bar_store.get_ema(11, 288, 72, now),
+                            self.bar_store.get_ema(11, 48, 72, now),
+                            self.bar_store.get_ema_slope(11, 288, 96, 72, now),
+                            self.bar_store.get_ema_slope(11, 48, 24, 72, now),
+                        ]
+                    mock_ema.assert_not_called()
+                    recomputed = [
+                        reader.get_ema(11, 288, 72, now),
+                        reader.get_ema(11, 48, 72, now),
+                        reader.get_ema_slope(11, 288, 96, 72, now),
+                        reader.get_ema_slope(11, 48, 24, 72, now),
+                    ]
+                    for got, expected in zip(streamed, recomputed):
+                        self.assertAlmostEqual(got, expected, places=12)
+        finally:
+            reader.close()
+
+        self.assertIsNone(self.bar_store.get_ema(33, 288, 72, now))
+        self.assertEqual(self.bar_store.get_ema_slope(33, 288, 96, 72, now), 0.0)
+
+    def test_rolling_range_and_volatility_match_full_window_scans(self):
+        start = 1_700_000_000 // 900 * 900
+        reader = PriceBarStore(self.db_path, read_only=True)
+        try:
+            for idx in range(600):
+                now = start + idx * 900
+                price = 0.02 * (1.0 + 0.2 * math.sin(idx / 23.0) + 0.05 * math.cos(idx * 1.7))
+                self.bar_store.record_ticks([(11, price, 500.0, 500.0), (22, 0.5, 500.0, 500.0)], timestamp=now)
+                self.bar_store.record_tick(11, price * 0.97, 500.0, 500.0, timestamp=now + 300)  # open bar moves
+                if idx % 50 == 0:
+                    self.bar_store.prune(max_hours=96, now=now)
+                checks = [now] + ([now - 40 * 900] if idx % 211 == 0 else [])  # including a cutoff moved back
+                for at in checks:
+                    for hours in (6, 24, 72):
+                        self.assertEqual(
+                            self.bar_store.get_range_position(11, hours, at),
+                            reader.get_range_position(11, hours, at),
+                        )
+                        self.assertAlmostEqual(
+                            self.bar_store.get_volatility(11, hours, at),
+                            reader.get_volatility(11, hours, at),
+                            places=12,
+                        )
+        finally:
+            reader.close()
+
+        self.assertEqual(self.bar_store.get_volatility(22, 24, now), 0.0)
+        self.assertEqual(self.bar_store.get_range_position(22, 24, now), 0.5)
+        self.assertEqual(self.bar_store.get_range_position(33, 24, now), 0.5)
+        self.assertEqual(self.bar_store.get_volatility(33, 24, now), 0.0)
+
+
+    def test_rolling_window_left_unqueried_across_a_compaction_is_rebuilt(self):
+        start = 1_700_000_000 // 900 * 900
+        reader = PriceBarStore(self.db_path, read_only=True)
+        try:
+            for idx in range(900):
+                now = start + idx * 900
+                price = 1.0 + 0.3 * math.sin(idx / 11.0) + 0.1 * math.cos(idx * 0.7)
+                self.bar_store.record_tick(11, price, 500.0, 500.0, timestamp=now)
+                self.bar_store.prune(max_hours=96, now=now)
+                if idx in (400, 401, 560, 561, 800, 899):  # 40h and 60h gaps between queries
+                    self.assertEqual(
+                        self.bar_store.get_range_position(11, 72, now),
+                        reader.get_range_position(11, 72, now),
+                    )
+                    self.assertAlmostEqual(
+                        self.bar_store.get_volatility(11, 72, now),
+                        reader.get_volatility(11, 72, now),
+                        places=12,
+                    )
+        finally:
+            reader.close()
+
+if __name__ == '__main__':
+    unittest.main()
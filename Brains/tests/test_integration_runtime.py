@@ -8,6 +8,7 @@ from types import SimpleNamespace
 from unittest.mock import patch
 
 from Brains.integration import StrategyEngine, TaoStatsFlowCache
+from Brains.threshold_farm import compute_signals
 from Brains.state import PriceBarStore, StrategyStateStore
 
 
@@ -108,6 +109,22 @@ class TestStrategyRuntimeRoster(unittest.TestCase):
         with patch('Brains.config.load_config', return_value=TEST_CFG):
             engine.on_tick(stats, self.settings.SUBNET_SETTINGS, stake_info=stake_info, balance=balance)
 
+    def test_reconcile_fill_replaces_estimate_and_cost_basis(self):
+        engine = self._make_engine()
+
+        fill_id = engine.on_fill(netuid=11, side='buy', tao_amount=1.0, alpha_amount=100.0, price=0.01)
+        engine.reconcile_fill(fill_id, tao_amount=1.0, alpha_amount=95.0, price=1.0 / 95.0,
+                              fee_tao=0.0005, tx_hash='0xabc', block_number=4321)
+        engine.reconcile_fill(fill_id, tao_amount=1.0, alpha_amount=90.0, price=1.0 / 90.0)
+
+        fill = self.bar_store.get_fill(fill_id)
+        state = self.state_store.get(11)
+        self.assertTrue(fill.reconciled)
+        self.assertEqual((fill.alpha_amount, fill.tx_hash, fill.block_number), (95.0, '0xabc', 4321))
+        self.assertAlmostEqual(fill.fee_tao, 0.0005)
+        self.assertAlmostEqual(state.total_alpha_bought, 95.0)
+        self.assertAlmostEqual(state.avg_entry_price, 1.0 / 95.0)
+
     def test_dynamic_candidate_can_replace_seed_roster(self):
         engine = self._make_engine()
         self._seed_history(engine)
@@ -195,6 +212,26 @@ class TestStrategyRuntimeRoster(unittest.TestCase):
         self.assertEqual(list(runtime_grids.keys()), [22])
         self.assertIn(22, restarted.buy_roster_netuids)
 
+    def test_clean_subnets_skip_bar_record_and_reuse_signals(self):
+        engine = self._make_engine()
+        self._seed_history(engine)
+
+        stats = {
+            11: {'price': 1.00, 'tao_in': 5000.0, 'alpha_in': 5000.0},
+            22: {'price': 0.90, 'tao_in': 7000.0, 'alpha_in': 7000.0},
+        }
+
+        with patch('Brains.config.load_config', return_value=TEST_CFG):
+            engine.on_tick(stats, self.settings.SUBNET_SETTINGS, stake_info={}, balance=10.0, dirty_netuids={11, 22})
+            with patch('Brains.integration.compute_signals', wraps=compute_signals) as mock_signals, \
+                 patch.object(engine.bar_store, 'record_ticks', wraps=engine.bar_store.record_ticks) as mock_record:
+                engine.on_tick(stats, self.settings.SUBNET_SETTINGS, stake_info={}, balance=10.0, dirty_netuids={22})
+
+        mock_record.assert_called_once()
+        self.assertEqual([row[0] for row in mock_record.call_args.args[0]], [22])
+        self.assertEqual([call.kwargs['netuid'] for call in mock_signals.call_args_list], [22])
+        self.assertEqual(engine.runtime_ordered_netuids, [22])
+
     def test_positive_chain_buy_pressure_can_promote_dynamic_subnet(self):
         engine = self._make_engine()
         self._seed_equal_history(engine)
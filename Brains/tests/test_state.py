@@ -0,0 +1,98 @@
+"""Tests for the SQLite price bar and fill store."""
+
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from Brains.state import PriceBarStore
+
+
+class TestPriceBarStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, 'bars.sqlite')
+        self.bar_store = PriceBarStore(self.db_path)
+
+    def tearDown(self):
+        self.bar_store.close()
+        self.tmpdir.cleanup()
+
+    def test_record_ticks_folds_each_subnet_into_its_bar(self):
+        bar_start = 1_700_000_100 // 900 * 900
+        self.bar_store.record_ticks([(11, 1.00, 500.0, 500.0), (22, 2.00, 700.0, 350.0)], timestamp=bar_start + 10)
+        self.bar_store.record_ticks([(11, 1.20, 510.0, 425.0), (22, 1.50, 690.0, 460.0)], timestamp=bar_start + 20)
+        self.bar_store.record_tick(11, 0.90, 505.0, 560.0, timestamp=bar_start + 30)
+        written = self.bar_store.record_ticks([], timestamp=bar_start + 40)
+
+        bars = self.bar_store.get_bars_between(bar_start, bar_start)
+
+        self.assertEqual(written, 0)
+        self.assertEqual(bars, [
+            (bar_start, 11, 1.00, 1.20, 0.90, 0.90, 505.0, 560.0, 3),
+            (bar_start, 22, 2.00, 2.00, 1.50, 1.50, 690.0, 460.0, 2),
+        ])
+
+    def test_writer_uses_wal_and_readers_do_not_block_it(self):
+        self.bar_store.record_tick(11, 1.0, 500.0, 500.0, timestamp=1_700_000_000)
+        reader = PriceBarStore(self.db_path, read_only=True)
+        try:
+            reader._conn.execute('BEGIN')
+            reader._conn.execute('SELECT COUNT(*) FROM price_bars').fetchone()
+            self.bar_store.record_tick(22, 2.0, 700.0, 350.0, timestamp=1_700_000_000)
+
+            journal_mode = self.bar_store._conn.execute('PRAGMA journal_mode').fetchone()[0]
+            self.assertEqual(journal_mode, 'wal')
+            with self.assertRaises(sqlite3.OperationalError):
+                reader._conn.execute('DELETE FROM price_bars')
+            reader._conn.execute('COMMIT')
+            self.assertEqual(reader.list_netuids(), [11, 22])
+            self.assertFalse(reader.maybe_checkpoint(interval_seconds=0))
+            self.assertTrue(self.bar_store.maybe_checkpoint(interval_seconds=0))
+            self.assertFalse(self.bar_store.maybe_checkpoint())
+        finally:
+            reader.close()
+
+    def test_fill_table_from_older_database_gains_reconciliation_columns(self):
+        self.bar_store.close()
+        legacy_path = os.path.join(self.tmpdir.name, 'legacy.sqlite')
+        conn = sqlite3.connect(legacy_path)
+        conn.execute(
+            "CREATE TABLE fills (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL NOT NULL, "
+            "netuid INTEGER NOT NULL, side TEXT NOT NULL, tao_amount REAL NOT NULL, "
+            "alpha_amount REAL NOT NULL, price REAL NOT NULL, tx_hash TEXT DEFAULT '')"
+        )
+        conn.execute("INSERT INTO fills (timestamp, netuid, side, tao_amount, alpha_amount, price) VALUES (?, 11, 'buy', 1.0, 100.0, 0.01)", (time.time(),))
+        conn.commit()
+        conn.close()
+
+        self.bar_store = PriceBarStore(legacy_path)
+        fills = self.bar_store.get_fills(11)
+
+        self.assertEqual(len(fills), 1)
+        self.assertFalse(fills[0].reconciled)
+        self.assertEqual(fills[0].fee_tao, 0.0)
+
+
+    def test_read_only_store_quotes_its_path_and_requires_an_existing_database(self):
+        odd_dir = os.path.join(self.tmpdir.name, 'runs #1 ?50%')
+        os.makedirs(odd_dir)
+        odd_path = os.path.join(odd_dir, 'bars.sqlite')
+        writer = PriceBarStore(odd_path)
+        writer.record_tick(11, 1.0, 500.0, 500.0, timestamp=1_700_000_000)
+        writer.close()
+
+        reader = PriceBarStore(odd_path, read_only=True)
+        try:
+            self.assertEqual(reader.list_netuids(), [11])
+        finally:
+            reader.close()
+
+        missing_path = os.path.join(self.tmpdir.name, 'missing.sqlite')
+        with self.assertRaises(FileNotFoundError):
+            PriceBarStore(missing_path, read_only=True)
+        self.assertFalse(os.path.exists(missing_path))
+
+if __name__ == '__main__':
+    unittest.main()
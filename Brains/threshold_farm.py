@@ -77,17 +77,12 @@ def compute_signals(
     ideal_range_med_bars = int(range_med_h * bars_per_hour)
     ideal_mom_bars = int(mom_short_h * bars_per_hour)
 
-    # Get price data
-    ema_prices = bar_store.get_close_prices(netuid, ema_hours, now)
-    vol_prices = bar_store.get_close_prices(netuid, vol_hours, now)
-    range_short_prices = bar_store.get_close_prices(netuid, range_short_h, now)
-    range_med_prices = bar_store.get_close_prices(netuid, range_med_h, now)
+    # Get price data (views over the store's in-memory bars)
     mom_history_hours = mom_short_h + (bar_minutes / 60.0)
     mom_prices = bar_store.get_close_prices(netuid, mom_history_hours, now)
 
     # Get bars for tao_in data
-    bars_all = bar_store.get_bars(netuid, ema_hours, now)
-    tao_in_values = [b[5] for b in bars_all]  # index 5 = tao_in
+    tao_in_values = bar_store.get_series(netuid, 'tao_in', ema_hours, now)
 
     # Confidence based on available vs ideal bars
     available_bars = bar_store.get_bar_count(netuid, ema_hours, now)
@@ -95,11 +90,11 @@ def compute_signals(
 
     # Compute EMA - span is in bars
     ema_span = int(ema_hours * bars_per_hour)
-    ema_val = signals.ema(ema_prices, ema_span)
+    ema_val = bar_store.get_ema(netuid, ema_span, ema_hours, now)
     if ema_val is None:
         ema_val = spot_price  # absolute fallback
     ema_fast_span = max(1, int(ema_fast_hours * bars_per_hour))
-    ema_fast_val = signals.ema(ema_prices, ema_fast_span)
+    ema_fast_val = bar_store.get_ema(netuid, ema_fast_span, ema_hours, now)
     if ema_fast_val is None:
         ema_fast_val = spot_price
 
@@ -112,11 +107,11 @@ def compute_signals(
         spot_price=spot_price,
         ema_72h=ema_val,
         ema_distance=signals.ema_distance(spot_price, ema_val),
-        ema_slope_24h=signals.ema_slope(ema_prices, ema_span, slope_lookback),
-        range_pos_24h=signals.range_position(range_short_prices),
-        range_pos_72h=signals.range_position(range_med_prices),
+        ema_slope_24h=bar_store.get_ema_slope(netuid, ema_span, slope_lookback, ema_hours, now),
+        range_pos_24h=bar_store.get_range_position(netuid, range_short_h, now),
+        range_pos_72h=bar_store.get_range_position(netuid, range_med_h, now),
         momentum_6h=signals.momentum(mom_prices, ideal_mom_bars),
-        volatility_24h=signals.volatility(vol_prices),
+        volatility_24h=bar_store.get_volatility(netuid, vol_hours, now),
         volume_score=signals.volume_score(tao_in_values),
         inventory_ratio=signals.inventory_ratio(current_alpha, max_alpha),
         est_slippage_pct=signals.estimate_slippage_pct(max_buy_tao, tao_in),
@@ -125,7 +120,7 @@ def compute_signals(
         alpha_in_pool=alpha_in,
         ema_fast=ema_fast_val,
         ema_fast_distance=signals.ema_distance(spot_price, ema_fast_val),
-        ema_fast_slope_6h=signals.ema_slope(ema_prices, ema_fast_span, fast_slope_lookback),
+        ema_fast_slope_6h=bar_store.get_ema_slope(netuid, ema_fast_span, fast_slope_lookback, ema_hours, now),
         ema_fast_slow_spread=signals.ema_distance(ema_fast_val, ema_val),
     )
 
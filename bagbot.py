@@ -6,13 +6,19 @@ import os
 import websockets
 import traceback
 import json
+import functools
 from typing import List, Dict, Tuple
 
 import bittensor as bt
-from bittensor.core.async_subtensor import get_async_subtensor
+from bittensor.core.types import ExtrinsicResponse
 import async_substrate_interface
+import numpy as np
 
 import printHelpers
+import chainHelpers
+import poolHelpers
+import tradeHelpers
+import portfolioHelpers
 from decimal import Decimal, getcontext
 getcontext().prec = 14 #Precision for price stuff
 
@@ -168,24 +174,17 @@ def parseArgs():
 rao_to_tao = lambda rao : int(rao)/1000000000.0
 
 
-async def my_async_subtensor(*args, **kwargs):
-    attempts = 0
-    while attempts < 20:
-        try:
-            return await get_async_subtensor(*args, **kwargs)
-        except (websockets.exceptions.InvalidStatus, AttributeError, asyncio.exceptions.TimeoutError) as e:
-            logger.error(f'Invalid status err {str(e)}, retrying')
-            attempts += 1
-            if attempts >= 19:
-                raise
-            await asyncio.sleep(attempts*2)
-
 class BittensorUtility():
 
 
     def __init__(self, args):
         self.args = args
         self.current_stake_info = {}
+        self.state_version = 0
+        self.portfolio = None
+        self.trade_plan = None
+        self.stats = {}
+        self.balance = 0.0
         self.tick = 0
         self.gridLoaded = False
         self.settings_signature = None
@@ -193,6 +192,49 @@ class BittensorUtility():
         self.subnet_grids = {}
         self.last_runtime_subnet_grids = {}
         self.execution_blocked_subnets = {}
+        self.connection = chainHelpers.SubtensorPool(
+            getattr(bagbot_settings, 'SUBTENSOR_ENDPOINTS', None) or ['finney'],
+            submit_endpoint=getattr(bagbot_settings, 'SUBTENSOR_SUBMIT_ENDPOINT', None),
+        )
+        self.scheduler = chainHelpers.BlockScheduler(self.connection)
+        self.current_block = None
+        self.read_cache = chainHelpers.BlockReadCache()
+        self.pool_reader = poolHelpers.PoolStateReader()
+        self.pool_snapshot = None
+        self.pool_watcher = poolHelpers.PoolWatcher(self.pool_reader)
+        self.dirty_subnets = set()
+        self.rotation_quotes = {}
+        # When self.stats was read, and when single pools were re-quoted since (monotonic seconds).
+        self.stats_quoted_at = None
+        self.quote_times = {}
+        # Held by the tick's trading phase and by trigger-fired trades so they never overlap.
+        self.trade_lock = asyncio.Lock()
+        self.trigger_filled_netuids = set()
+        self.trade_triggers = tradeHelpers.TriggerEngine(self._dispatch_trigger, self._quote_spot_price)
+        self.pool_watcher.listeners.append(self.trade_triggers.notify)
+        # Pipelined submissions still waiting to land: their subnets and the TAO their buys will spend.
+        self.submission_pipeline = None
+        self.inflight_subnets = set()
+        self.inflight_buy_tao = 0.0
+        self.fill_reconciler = None
+        # Extrinsics signed while waiting for the next block, and the task preparing them.
+        self.prepared_extrinsics = []
+        self.presign_task = None
+
+
+    @property
+    def sub(self):
+        return self.connection.sub
+
+
+    @sub.setter
+    def sub(self, value):
+        self.connection.attach(value)
+
+
+    @property
+    def submit_sub(self):
+        return self.connection.submit_sub
 
 
     def get_subnet_setting(self, subnet_netuid, setting_name, default_value):
@@ -212,67 +254,6 @@ class BittensorUtility():
         return default_value
 
 
-    async def discover_all_validators_with_stake(self):
-        """
-        Query the blockchain to find ALL validators where this coldkey has stake.
-
-        Returns:
-            List of validator hotkeys that have stake from this coldkey, or None if discovery fails
-        """
-        try:
-            # Try to get comprehensive stake info
-            stake_info_list = await asyncio.wait_for(
-                self.sub.get_stake_info_for_coldkey(
-                    coldkey_ss58=self.wallet.coldkey.ss58_address
-                ),
-                timeout=30.0
-            )
-
-            validators = set()
-
-            # Handle different return types
-            if stake_info_list is None:
-                logger.warning('get_stake_info_for_coldkey returned None')
-                return None
-
-            # If it's a list, iterate and extract hotkeys
-            if isinstance(stake_info_list, list):
-                for stake_info in stake_info_list:
-                    hotkey = None
-                    # Try different attribute names
-                    if hasattr(stake_info, 'hotkey_ss58'):
-                        hotkey = stake_info.hotkey_ss58
-                    elif hasattr(stake_info, 'hotkey'):
-                        hotkey = stake_info.hotkey
-
-                    if hotkey:
-                        validators.add(hotkey)
-                        logger.debug(f'Found stake on validator {hotkey}')
-            else:
-                logger.warning(f'Unexpected return type from get_stake_info_for_coldkey: {type(stake_info_list)}')
-                return None
-
-            if len(validators) > 0:
-                logger.info(f'Discovered {len(validators)} validators with stake from blockchain: {list(validators)}')
-                return list(validators)
-            else:
-                logger.warning('No validators found with stake, falling back to configured validators')
-                return None
-
-        except (AttributeError, TypeError) as e:
-            logger.warning(f'Error parsing stake info structure: {e}')
-            logger.warning('Falling back to configured validators only')
-            return None
-        except asyncio.TimeoutError:
-            logger.warning('Timeout discovering validators from blockchain')
-            logger.warning('Falling back to configured validators only')
-            return None
-        except Exception as e:
-            logger.warning(f'Could not discover validators from blockchain: {e}')
-            logger.warning(traceback.format_exc())
-            logger.warning('Falling back to configured validators only')
-            return None
-
     def get_all_validators(self):
         """
         Collect all unique validator hotkeys from global setting and per-subnet overrides.
@@ -303,8 +284,9 @@ class BittensorUtility():
     async def setupSubtensor(self):
         while True:
             try:
-                self.sub = await get_async_subtensor("finney")
-
+                await self.connection.connect()
+                self.connection.start_keepalive()
+                self.scheduler.start()
                 break
             except (asyncio.exceptions.TimeoutError, ConnectionResetError) as e:
                 logger.error(e)
@@ -312,6 +294,36 @@ class BittensorUtility():
                 await asyncio.sleep(3)
 
 
+    async def _recover_subtensor(self, reason, sub=None):
+        """Health-check the endpoint that failed, failing over or reconnecting only if it is broken."""
+        self.connection.mark_unhealthy(reason, sub=sub)
+        await self.connection.ensure_healthy()
+
+
+    def _tick_block_hash(self):
+        return self.current_block['block_hash'] if self.current_block else None
+
+
+    async def read_at_block(self, method, block_hash=None, **kwargs):
+        """
+        Call a subtensor read pinned to a block hash, through the per-block cache.
+
+        Args:
+            method: Name of the AsyncSubtensor read method (e.g. 'all_subnets')
+            block_hash: Block to read at (default: the block the current tick started on)
+            **kwargs: Arguments for the read method
+
+        Returns:
+            The read method's result
+        """
+        block_hash = block_hash or self._tick_block_hash()
+        sub = self.sub
+        return await self.read_cache.get(
+            method, kwargs, block_hash,
+            lambda: getattr(sub, method)(block_hash=block_hash, **kwargs),
+        )
+
+
     async def setup(self):
         await self.setupWallet()
         await self.setupSubtensor()
@@ -336,6 +348,7 @@ class BittensorUtility():
             for netuid, config in getattr(bagbot_settings, 'SUBNET_SETTINGS', {}).items()
         }
         self.subnet_grids = dict(self.static_subnet_grids) or previous_runtime_grids
+        self._state_changed()
         self.validateGrid()
         self.gridLoaded = True
 
@@ -434,12 +447,39 @@ class BittensorUtility():
             _strategy_engine.telegram.send_async(msg)
 
 
-    async def get_subnet_stats(self) -> Tuple[Dict[int, Dict], Dict[int, int]]:
+    async def get_subnet_stats(self, block_hash=None) -> Tuple[Dict[int, Dict], Dict[int, int]]:
+        subscription_mode = getattr(bagbot_settings, 'POOL_SUBSCRIPTION_MODE', False)
+        tick_block = self.current_block['block'] if self.current_block else None
+        if (
+            subscription_mode
+            and block_hash is None
+            and self.stats
+            and self.pool_watcher.running
+            and not self.pool_watcher.needs_resync(tick_block)
+        ):
+            stats, _ = await self.pool_watcher.apply(self.sub, self.stats, self._tick_block_hash())
+            return stats
+
+        if getattr(bagbot_settings, 'FAST_POOL_STATE', True):
+            block_hash = block_hash or self._tick_block_hash()
+            sub = self.sub
+            try:
+                self.pool_snapshot = await self.read_cache.get(
+                    'pool_state', {}, block_hash,
+                    lambda: self.pool_reader.read(sub, block_hash),
+                )
+                if subscription_mode or self._trade_triggers_enabled():
+                    self.pool_watcher.seed(self.pool_snapshot, tick_block)
+                    self.pool_watcher.start(self.connection, self.pool_snapshot.netuids)
+                return self.pool_snapshot.to_stats()
+            except Exception as e:
+                logger.warning(f'Fast pool-state read failed ({type(e).__name__}: {e}); falling back to all_subnets')
+
         all_subnets = None
         attempts = 0
         while all_subnets is None:
             try:
-                all_subnets = await self.sub.all_subnets()
+                all_subnets = await self.read_at_block('all_subnets', block_hash=block_hash)
             except (AttributeError, websockets.exceptions.InvalidStatus):
                 if attempts > 5:
                     self.sendNotification(errMsg)
@@ -448,12 +488,7 @@ class BittensorUtility():
                 logger.error(errMsg)
 
                 await asyncio.sleep(3)
-
-                try:
-                    await self.sub.close()
-                except asyncio.exceptions.TimeoutError:
-                    logger.error('Closing subtensor timeout')
-                self.sub = await my_async_subtensor("finney")
+                await self._recover_subtensor(errMsg)
                 attempts += 1
 
         stats = {}
@@ -474,53 +509,87 @@ class BittensorUtility():
 
 
 
-    async def get_stake_for_hotkey(self, hotkey):
-        attempts = 10
-        for i in range(attempts):
-            try:
-                retval = await asyncio.wait_for(
-                            self.sub.get_stake_for_coldkey_and_hotkey(
-                                hotkey_ss58=hotkey,
-                                coldkey_ss58=self.wallet.coldkey.ss58_address
-                            ),
-                            timeout=20.0
-                        )
-                return retval
-            except asyncio.exceptions.TimeoutError:
-                logger.info('Timeout fetching hotkey stake')
-                await asyncio.sleep(10)
-        raise InternetIssueException("Too many attempts to refresh stats")
+    def _stake_info_by_hotkey(self, stake_info_list):
+        """Group the coldkey-wide stake list into {hotkey: {netuid: StakeInfo}}.
 
+        Configured validators are always present (possibly empty) so hotkey
+        selection still sees them when they currently hold no stake.
+        """
+        stake_by_hotkey = {hotkey: {} for hotkey in self.get_all_validators()}
+        for stake_info in stake_info_list or []:
+            hotkey = getattr(stake_info, 'hotkey_ss58', None) or getattr(stake_info, 'hotkey', None)
+            if not hotkey:
+                continue
+            stake_by_hotkey.setdefault(hotkey, {})[stake_info.netuid] = stake_info
+        return stake_by_hotkey
 
-    async def refresh_stats(self, hotkeys):
+
+    async def fetch_portfolio_snapshot(self, block_hash=None):
+        """
+        Fetch subnet stats, coldkey-wide stake and free balance in one concurrent round-trip.
+
+        Args:
+            block_hash: Block to read at (default: the block the current tick started on)
+
+        Returns:
+            Tuple of (stats, stake_info_by_hotkey, balance)
+        """
+        coldkey_ss58 = self.wallet.coldkey.ss58_address
+        stats, stake_info_list, balance = await asyncio.gather(
+            asyncio.wait_for(self.get_subnet_stats(block_hash=block_hash), timeout=30.0),
+            asyncio.wait_for(self.read_at_block('get_stake_info_for_coldkey', block_hash=block_hash, coldkey_ss58=coldkey_ss58), timeout=30.0),
+            asyncio.wait_for(self.read_at_block('get_balance', block_hash=block_hash, address=coldkey_ss58), timeout=20.0),
+        )
+        if not isinstance(stake_info_list, list):
+            # Reading it as "no stake" would make every position look sold; fail the tick so it is retried.
+            raise async_substrate_interface.errors.SubstrateRequestException(
+                f'Unexpected return type from get_stake_info_for_coldkey: {type(stake_info_list)}'
+            )
+        return stats, self._stake_info_by_hotkey(stake_info_list), float(balance)
+
+
+    def _mark_dirty_subnets(self, previous_stats, stats):
+        """Flag each subnet whose pool price or reserves changed since the previous snapshot."""
+        dirty = set()
+        for netuid, entry in stats.items():
+            previous = (previous_stats or {}).get(netuid)
+            entry['dirty'] = previous is None or any(
+                previous.get(field) != entry.get(field)
+                for field in ('price', 'tao_in', 'alpha_in')
+            )
+            if entry['dirty']:
+                dirty.add(netuid)
+        return dirty
+
+
+    async def refresh_stats(self, block_hash=None):
 
         try:
-            logger.info('Fetching subnet stats')
-            self.stats = await asyncio.wait_for(self.get_subnet_stats(), timeout=30.0)
+            logger.info('Fetching portfolio snapshot')
+            previous_stats = self.stats
+            self.stats, self.current_stake_info, self.balance = await self.fetch_portfolio_snapshot(block_hash=block_hash)
+            self._state_changed()
+            self.stats_quoted_at = time.monotonic()
+            self.quote_times = {}
+            self.dirty_subnets = self._mark_dirty_subnets(previous_stats, self.stats)
+            self.rotation_quotes = {
+                key: quote for key, quote in self.rotation_quotes.items()
+                if not ({key[0], key[1]} & self.dirty_subnets)
+            }
         except asyncio.TimeoutError:
-            logger.error('Timeout fetching subnet stats after 30s')
+            logger.error('Timeout fetching portfolio snapshot')
             raise
         except Exception as e:
             logger.error(traceback.format_exc())
             raise
 
-        for hotkey in hotkeys:
-            logger.info(f'Fetching stake info for {hotkey}')
-            self.current_stake_info[hotkey] = await self.get_stake_for_hotkey(hotkey)
-
-        logger.info('Fetching wallet balance')
-        self.balance = float(await asyncio.wait_for(
-            self.sub.get_balance(address=self.wallet.coldkey.ss58_address),
-            timeout=20.0
-        ))
-
         sumStakedValue = 0
         tickLog = []
 
-        for hotkey in hotkeys:
-            for subnet_netuid in self.current_stake_info[hotkey]:
-                if subnet_netuid in self.current_stake_info[hotkey] and self.current_stake_info[hotkey][subnet_netuid].stake.rao == 0: continue
-                stake_tao = rao_to_tao(self.current_stake_info[hotkey][subnet_netuid].stake.rao)
+        for hotkey, subnet_stakes in self.current_stake_info.items():
+            for subnet_netuid, stake_obj in subnet_stakes.items():
+                if stake_obj.stake.rao == 0 or subnet_netuid not in self.stats: continue
+                stake_tao = rao_to_tao(stake_obj.stake.rao)
                 if self._ignore_non_configured_legacy_dust(hotkey, subnet_netuid, stake_tao):
                     continue
                 sumStakedValue += stake_tao * self.stats[subnet_netuid]['price']
@@ -530,29 +599,82 @@ class BittensorUtility():
 
 
 
+    async def refresh_subnets(self, netuids, block_hash=None):
+        """
+        Re-read the free balance and only these subnets' pools and stake, keeping the rest of the snapshot.
+
+        Used after our own trade lands mid-tick: instead of re-fetching every subnet and the
+        whole coldkey stake map, it reads one price and two reserves per subnet, and the stake
+        of each hotkey that holds or is configured for those subnets. Stats and stake maps are
+        replaced (not mutated) so the portfolio snapshot and trade plan rebuild.
+
+        Args:
+            netuids: Subnets touched by the trade
+            block_hash: Block to read at (default: the block the current tick started on)
+        """
+        netuids = sorted(set(netuids))
+        block_hash = block_hash or self._tick_block_hash()
+        coldkey_ss58 = self.wallet.coldkey.ss58_address
+        hotkeys = sorted(
+            {hotkey for hotkey, subnet_stakes in self.current_stake_info.items() if any(netuid in subnet_stakes for netuid in netuids)}
+            | {self.get_subnet_setting(netuid, 'stake_on_validator', bagbot_settings.STAKE_ON_VALIDATOR) for netuid in netuids}
+        )
+        pools, balance, *stakes = await asyncio.gather(
+            asyncio.wait_for(self.pool_reader.read_subnets(self.sub, netuids, block_hash=block_hash), timeout=20.0),
+            asyncio.wait_for(self.read_at_block('get_balance', block_hash=block_hash, address=coldkey_ss58), timeout=20.0),
+            *(
+                asyncio.wait_for(self.read_at_block(
+                    'get_stake_for_coldkey_and_hotkey', block_hash=block_hash,
+                    coldkey_ss58=coldkey_ss58, hotkey_ss58=hotkey, netuids=netuids,
+                ), timeout=20.0)
+                for hotkey in hotkeys
+            ),
+        )
+
+        stats = dict(self.stats)
+        for netuid, pool in pools.items():
+            if pool['price'] > 0:
+                stats[netuid] = dict(stats.get(netuid, {'name': ''}), **pool)
+        stake_info = {hotkey: dict(subnet_stakes) for hotkey, subnet_stakes in self.current_stake_info.items()}
+        for hotkey, stake_by_netuid in zip(hotkeys, stakes):
+            subnet_stakes = stake_info.setdefault(hotkey, {})
+            for netuid in netuids:
+                stake_obj = (stake_by_netuid or {}).get(netuid)
+                if stake_obj is not None and stake_obj.stake.rao > 0:
+                    subnet_stakes[netuid] = stake_obj
+                else:
+                    subnet_stakes.pop(netuid, None)
+
+        previous_stats = self.stats
+        self.stats, self.current_stake_info, self.balance = stats, stake_info, float(balance)
+        self._state_changed()
+        self.quote_times.update({netuid: time.monotonic() for netuid in pools})
+        refreshed = {netuid: stats[netuid] for netuid in netuids if netuid in stats}
+        changed = self._mark_dirty_subnets({netuid: previous_stats.get(netuid) for netuid in refreshed}, refreshed)
+        self.dirty_subnets |= changed
+        self.rotation_quotes = {
+            key: quote for key, quote in self.rotation_quotes.items()
+            if not ({key[0], key[1]} & changed)
+        }
+        logger.info(f'Refreshed sn{netuids} and balance {self.balance:.4f} at {block_hash}')
+
+
     async def run(self):
         await self.setup()
         await self.refresh_subnet_grid()  # Load subnet settings before first tick
 
         while True:
             self.tick += 1
-            start = time.time()
             try:
-                logger.info(f'Starting tick {self.tick}')
+                self.current_block = await self.scheduler.next_tick()
+                start = time.time()
+                logger.info(
+                    f"Starting tick {self.tick} at block {self.current_block['block']} "
+                    f"(spanned {self.current_block['blocks_spanned']}, head age {self.current_block['head_age_seconds']:.2f}s)"
+                )
+                await self.connection.ensure_healthy()
                 await self.refresh_subnet_grid()
-                # Try to discover ALL validators with stake from blockchain
-                discovered_validators = await self.discover_all_validators_with_stake()
-
-                if discovered_validators:
-                    # Use discovered validators for comprehensive stake info
-                    all_validators = discovered_validators
-                    logger.info(f'Using discovered validators for stake queries: {all_validators}')
-                else:
-                    # Fall back to configured validators only
-                    all_validators = self.get_all_validators()
-                    logger.info(f'Using configured validators for stake queries: {all_validators}')
-
-                await self.refresh_stats(all_validators)
+                await self.refresh_stats()
 
                 # Brains strategy tick: record bars, compute patches
                 runtime_grids = None
@@ -561,7 +683,8 @@ class BittensorUtility():
                     try:
                         _strategy_engine.on_tick(
                             self.stats, self.static_subnet_grids,
-                            self.current_stake_info, self.balance
+                            self.current_stake_info, self.balance,
+                            dirty_netuids=self.dirty_subnets,
                         )
                         runtime_grids = _strategy_engine.get_runtime_subnet_grids(self.static_subnet_grids)
                     except Exception as e:
@@ -580,6 +703,7 @@ class BittensorUtility():
                         )
 
                 self.subnet_grids = runtime_grids or {}
+                self._state_changed()
                 if self.subnet_grids:
                     self.last_runtime_subnet_grids = {
                         netuid: dict(config)
@@ -599,38 +723,58 @@ class BittensorUtility():
 
                 print_link(f"https://taoflute.com/d/5c216965-b99b-4d82-8b31-931bb3d71567/subnets-overview?orgId=1&var-target_subnets={allSubnetParams}", 'Taoflute Portfolio link')
                 logger.info(f'Tick {self.tick}: Checking trades')
-                cash_buy_available = self._has_spendable_buy_opportunity()
-                if cash_buy_available:
-                    executed_buy = False
-                    for subnet_netuid in self.subnet_grids:
-                        trade_result = await self.do_available_trades(subnet_netuid)
-                        executed_buy = executed_buy or trade_result['buy_executed']
-                        if executed_buy:
-                            break
-
-                    if not executed_buy:
+                self._settle_presign_task()
+                async with self.trade_lock:
+                    await self._reread_trigger_filled_subnets()
+                    cash_buy_available = self._has_spendable_buy_opportunity()
+                    if cash_buy_available:
+                        allocation = self.plan_cash_allocation()
+                        executed_buy = False
+                        if self._pipelined_submission_enabled():
+                            submitted = await self.submit_trades_pipelined(self.collect_tick_trades(allocation))
+                            executed_buy = any('tao_amount' in trade for trade in submitted)
+                        elif self._batched_extrinsics_enabled():
+                            results = await self.execute_trade_batch(self.collect_tick_trades(allocation))
+                            executed_buy = any(ok for trade, ok in results if 'tao_amount' in trade)
+                        else:
+                            for subnet_netuid in list(allocation) + [n for n in self.subnet_grids if n not in allocation]:
+                                trade_result = await self.do_available_trades(subnet_netuid, allocation=allocation)
+                                executed_buy = executed_buy or trade_result['buy_executed']
+
+                        if not executed_buy:
+                            rotationTrade = await self.constructRotationTrade()
+                            if rotationTrade and self._pipelined_submission_enabled():
+                                await self.submit_trades_pipelined([rotationTrade])
+                            elif rotationTrade:
+                                await self.execute_rotation_trade(rotationTrade)
+                    else:
                         rotationTrade = await self.constructRotationTrade()
-                        if rotationTrade:
+                        if rotationTrade and self._pipelined_submission_enabled():
+                            await self.submit_trades_pipelined([rotationTrade])
+                        elif rotationTrade:
                             await self.execute_rotation_trade(rotationTrade)
-                else:
-                    rotationTrade = await self.constructRotationTrade()
-                    if rotationTrade:
-                        await self.execute_rotation_trade(rotationTrade)
-                    else:
-                        for subnet_netuid in self.subnet_grids:
-                            await self.do_available_trades(subnet_netuid)
-
-                logging.info(f'Finished tick {self.tick} in {time.time() - start:.2f} seconds')
-                #return
-                try:
-                    logger.info(f'Tick {self.tick}: Waiting for next block')
-                    await asyncio.wait_for(self.sub.wait_for_block(), timeout=30.0)
-                except asyncio.TimeoutError:
-                    logger.warning(f'Tick {self.tick}: wait_for_block timed out after 30s, reconnecting...')
-                    await self.sub.close()
-                    self.sub = await my_async_subtensor("finney")
-                except (OSError, KeyError):
-                    await asyncio.sleep(12) #if error with waiting for block, just wait approx 1 block and try again
+                        elif self._pipelined_submission_enabled():
+                            await self.submit_trades_pipelined(self.collect_tick_trades())
+                        elif self._batched_extrinsics_enabled():
+                            await self.execute_trade_batch(self.collect_tick_trades())
+                        else:
+                            for subnet_netuid in self.subnet_grids:
+                                await self.do_available_trades(subnet_netuid)
+                    self._refresh_trade_triggers()
+
+                overlap = self.scheduler.finish_tick()
+                if overlap:
+                    logger.warning(f"Tick {self.tick} for block {self.current_block['block']} overlapped {overlap} new block(s)")
+                logging.info(
+                    f'Finished tick {self.tick} in {time.time() - start:.2f} seconds | '
+                    f'{self.scheduler.describe()} | {self.read_cache.describe()} | '
+                    f'{self.trade_plan.describe() if self.trade_plan is not None else "no trade plan"} | '
+                    f'{self.trade_triggers.describe()} | {self.connection.describe()}'
+                    + (f' | {self.submission_pipeline.describe()}' if self.submission_pipeline is not None else '')
+                    + (f' | {self.fill_reconciler.describe()}' if self.fill_reconciler is not None else '')
+                )
+                if self._presign_enabled():
+                    self.presign_task = asyncio.create_task(self.prepare_candidate_extrinsics())
 
             except InternetIssueException:
                 logger.warning(f'Some internet issue must be happening, pausing for 1 minute...')
@@ -643,27 +787,19 @@ class BittensorUtility():
                 await asyncio.sleep(3)
             except ConnectionResetError:
                 logger.info(f'connection reset, retrying...')
+                self.connection.mark_unhealthy('connection reset')
                 await asyncio.sleep(3)
             except (websockets.exceptions.InvalidStatus, async_substrate_interface.errors.SubstrateRequestException, websockets.exceptions.ConnectionClosedError) as e:
-                logger.info(f'potential server error: {e}, reconnecting...')
-                try:
-                    await self.sub.close()
-                except:
-                    pass
-                self.sub = await my_async_subtensor("finney")
+                logger.info(f'potential server error: {e}, checking connection...')
+                self.connection.mark_unhealthy(f'server error: {e}')
             except asyncio.exceptions.TimeoutError:
-                logger.warning(f'Timeout error in tick {self.tick}, reconnecting subtensor...')
-                try:
-                    await self.sub.close()
-                except:
-                    pass
-                self.sub = await my_async_subtensor("finney")
+                logger.warning(f'Timeout error in tick {self.tick}, checking connection...')
+                self.connection.mark_unhealthy(f'timeout in tick {self.tick}')
+                await asyncio.sleep(3)
+            except OSError as e:
+                logger.warning(f'Network error in tick {self.tick}: {e}, checking connection...')
+                self.connection.mark_unhealthy(f'network error: {e}')
                 await asyncio.sleep(3)
-            finally:
-                try:
-                    await self.sub.close()
-                except asyncio.exceptions.TimeoutError:
-                    logger.error('Closing subtensor timeout')
 
 
     def determine_buy_at_for_amount(self, subnet_settings, alpha_amount):
@@ -731,33 +867,94 @@ class BittensorUtility():
         """
 
 
+    def _state_changed(self):
+        """Bump the state version after stake, stats, grids or balance are replaced or re-read.
+
+        The portfolio snapshot and trade plan are stamped with the version they
+        were built at and rebuild once it moves on. A fill or a single re-quote
+        carries a current snapshot and plan over to the new version instead.
+        """
+        self.state_version += 1
+
+
+    def _portfolio(self):
+        """Return the stake snapshot for the current state version, rebuilding it once the version moved on."""
+        default_validator = bagbot_settings.STAKE_ON_VALIDATOR
+        dust_threshold_tao = legacy_dust_threshold_tao(bagbot_settings)
+        portfolio = self.portfolio
+        if portfolio is None or not portfolio.matches(self.state_version, default_validator, dust_threshold_tao):
+            portfolio = portfolioHelpers.PortfolioSnapshot.build(
+                self.current_stake_info, self.stats, self.subnet_grids, default_validator, dust_threshold_tao,
+                version=self.state_version,
+            )
+            self.portfolio = portfolio
+        return portfolio
+
+
+    def _record_portfolio_fill(self, hotkey, subnet_netuid, alpha_delta):
+        # The chain stake map is only re-read next tick; keep the aggregates honest until then.
+        portfolio = self._portfolio()
+        plan = self._current_trade_plan()
+        self._state_changed()
+        self.portfolio = portfolio.with_fill(hotkey, subnet_netuid, alpha_delta, version=self.state_version)
+        if plan is not None:
+            plan.invalidate_fill(subnet_netuid, version=self.state_version)
+
+
+    def _apply_quote(self, netuid, entry):
+        """Replace one subnet's stats entry with a fresh quote, carrying a current snapshot and plan over to it."""
+        current = self.portfolio is not None and self.portfolio.version == self.state_version
+        plan = self._current_trade_plan()
+        self.stats[netuid] = entry
+        self._state_changed()
+        if current:
+            self.portfolio = self.portfolio.with_price(netuid, entry['price'], version=self.state_version)
+        if plan is not None:
+            plan.invalidate_quote(netuid, version=self.state_version)
+
+
+    def _current_trade_plan(self):
+        """The trade plan if it is still at the current state version, else None."""
+        plan = self.trade_plan
+        return plan if plan is not None and plan.matches(self.state_version) else None
+
+
+    def _trade_plan(self):
+        """Return the trade plan for the current state version, starting a new one once the version moved on."""
+        plan = self._current_trade_plan()
+        if plan is None:
+            plan = tradeHelpers.TradePlan(self.state_version)
+            self.trade_plan = plan
+        return plan
+
+
+    def _planned_subnet(self, subnet_netuid):
+        def build():
+            patch = self._apply_live_patch(subnet_netuid) if subnet_netuid in self.subnet_grids else None
+            return {
+                'patch': patch,
+                'buy_threshold': self.get_subnet_buy_threshold(subnet_netuid),
+                'sell_threshold': self.get_subnet_sell_threshold(subnet_netuid),
+            }
+        return self._trade_plan().subnet(subnet_netuid, build)
+
+
+    def get_planned_thresholds(self, subnet_netuid):
+        """Buy and sell thresholds for a subnet as this tick's trades will see them, live patch applied."""
+        planned = self._planned_subnet(subnet_netuid)
+        return planned['buy_threshold'], planned['sell_threshold']
+
+
     def my_current_stake(self, subnet_netuid):
-        total_stake = 0
-        for hotkey in self.current_stake_info:
-            stake_obj = self.current_stake_info[hotkey].get(subnet_netuid)
-            stake_amt = (float(stake_obj.stake) if stake_obj is not None else 0.0)
-            if self._ignore_non_configured_legacy_dust(hotkey, subnet_netuid, stake_amt):
-                continue
-            total_stake += stake_amt
-        return total_stake
+        return self._portfolio().current_stake(subnet_netuid)
 
 
     def my_total_staked_value(self):
-        total_value = 0.0
-        for hotkey in self.current_stake_info:
-            for subnet_netuid, stake_obj in self.current_stake_info[hotkey].items():
-                if stake_obj is None or subnet_netuid not in self.stats:
-                    continue
-                if self._ignore_non_configured_legacy_dust(hotkey, subnet_netuid, float(stake_obj.stake)):
-                    continue
-                total_value += float(stake_obj.stake) * self.stats[subnet_netuid]['price']
-        return total_value
+        return self._portfolio().total_value
 
 
     def my_subnet_staked_value(self, subnet_netuid):
-        if subnet_netuid not in self.stats:
-            return 0.0
-        return self.my_current_stake(subnet_netuid) * self.stats[subnet_netuid]['price']
+        return self._portfolio().subnet_value(subnet_netuid)
 
 
     def _stake_for_hotkey_subnet(self, hotkey, subnet_netuid):
@@ -775,10 +972,7 @@ class BittensorUtility():
 
 
     def _ignore_non_configured_legacy_dust(self, hotkey, subnet_netuid, stake_amount):
-        legacy_value_tao = self._non_configured_legacy_value_tao(hotkey, subnet_netuid, stake_amount)
-        if legacy_value_tao is None:
-            return False
-        return legacy_value_tao <= legacy_dust_threshold_tao(bagbot_settings)
+        return self._portfolio().is_dust(hotkey, subnet_netuid, stake_amount)
 
 
     def determineHotKey(self, unstake_amt, subnet_netuid):
@@ -855,7 +1049,7 @@ class BittensorUtility():
     def _available_spendable_balance(self):
         tao_reserve = float(getattr(bagbot_settings, 'MIN_TAO_RESERVE', 0.0) or 0.0)
         execution_fee_buffer = self._execution_fee_buffer_tao()
-        return max(0.0, float(self.balance) - tao_reserve - execution_fee_buffer)
+        return max(0.0, float(self.balance) - self.inflight_buy_tao - tao_reserve - execution_fee_buffer)
 
 
     def _has_spendable_buy_opportunity(self):
@@ -1008,7 +1202,7 @@ class BittensorUtility():
         return Decimal(str(slippage)) - Decimal(str(max_slippage)) > epsilon
 
 
-    def _build_sell_trade(self, subnet_netuid, max_tao_per_sell, sell_threshold, hotkey, force_reason=None, preview_only=False):
+    def _build_sell_trade(self, subnet_netuid, max_tao_per_sell, sell_threshold, hotkey, force_reason=None, notes=None):
         if subnet_netuid not in self.stats or self.my_current_stake(subnet_netuid) <= 0:
             return None
 
@@ -1029,14 +1223,14 @@ class BittensorUtility():
         if self._slippage_exceeds_limit(slippage, max_slippage):
             raise Exception(f'Stopping before selling too much, slippage: {Decimal(slippage)}, max slippage per buy/sell: {Decimal(max_slippage)}  \nTO FIX: increase the max_tao_per_sell variable or increase max_slippage_percent_per_buy')
 
-        if not preview_only:
+        if notes is not None:
             if force_reason:
-                logger.info(
+                notes.append(
                     f"About to rotate out of sn{subnet_netuid}: unstake {alpha_to_sell} alpha "
                     f"(~{approx_tao} TAO) on hotkey {hotkey} with expected slippage of {slippage:.4f}% | {force_reason}"
                 )
             else:
-                logger.info(f"About to unstake {alpha_to_sell} alpha (~{approx_tao} TAO) in sn{subnet_netuid} on hotkey {hotkey} with expected slippage of {slippage:.4f}%")
+                notes.append(f"About to unstake {alpha_to_sell} alpha (~{approx_tao} TAO) in sn{subnet_netuid} on hotkey {hotkey} with expected slippage of {slippage:.4f}%")
 
         trade = {
             'hotkey': hotkey,
@@ -1054,12 +1248,27 @@ class BittensorUtility():
 
 
     def constructBuy(self, subnet_netuid, ignore_balance_limits=False, preview_only=False):
-        patch = self._apply_live_patch(subnet_netuid)
+        trade, notes = self._trade_plan().leg(
+            subnet_netuid, 'buy', (ignore_balance_limits,),
+            lambda: self._plan_buy(subnet_netuid, ignore_balance_limits),
+            portfolio_wide=not ignore_balance_limits,
+        )
+        if not preview_only:
+            for note in notes:
+                logger.info(note)
+        return dict(trade) if trade is not None else None
+
+
+    def _plan_buy(self, subnet_netuid, ignore_balance_limits):
+        """Size the buy leg for a subnet; returns (trade or None, log lines for an executing caller)."""
+        notes = []
+        planned = self._planned_subnet(subnet_netuid)
+        patch = planned['patch']
         if patch is not None and not patch.enable_buys:
-            return None
+            return None, notes
 
         current_stake_amt = self.my_current_stake(subnet_netuid)
-        buy_threshold = self.get_subnet_buy_threshold(subnet_netuid)
+        buy_threshold = planned['buy_threshold']
 
         max_tao_per_buy = self._limit_or_unbounded(
             self.get_subnet_setting(subnet_netuid, 'max_tao_per_buy', bagbot_settings.MAX_TAO_PER_BUY)
@@ -1072,12 +1281,11 @@ class BittensorUtility():
             remaining_budget = self._available_remaining_budget()
             max_tao_per_buy = min(max_tao_per_buy, remaining_budget)
             if max_tao_per_buy < 0.01:
-                if not preview_only:
-                    logger.info(
-                        f'Portfolio cap reached or remaining budget too small to trade: '
-                        f'cap={float(portfolio_cap):.4f}, remaining={remaining_budget:.4f}'
-                    )
-                return None
+                notes.append(
+                    f'Portfolio cap reached or remaining budget too small to trade: '
+                    f'cap={float(portfolio_cap):.4f}, remaining={remaining_budget:.4f}'
+                )
+                return None, notes
 
         tao_reserve = float(getattr(bagbot_settings, 'MIN_TAO_RESERVE', 0.0) or 0.0)
         execution_fee_buffer = self._execution_fee_buffer_tao()
@@ -1085,16 +1293,14 @@ class BittensorUtility():
             spendable_balance = self._available_spendable_balance()
             max_tao_per_buy = min(max_tao_per_buy, spendable_balance)
             if max_tao_per_buy < 0.01:
-                if not preview_only:
-                    logger.info(
-                        f'Fee buffer reached or remaining spendable balance too small to trade: '
-                        f'reserve={tao_reserve:.4f}, fee_buffer={execution_fee_buffer:.4f}, balance={float(self.balance):.4f}, '
-                        f'spendable={spendable_balance:.4f}'
-                    )
-                return None
+                notes.append(
+                    f'Fee buffer reached or remaining spendable balance too small to trade: '
+                    f'reserve={tao_reserve:.4f}, fee_buffer={execution_fee_buffer:.4f}, balance={float(self.balance):.4f}, '
+                    f'spendable={spendable_balance:.4f}'
+                )
+                return None, notes
 
         if patch is not None:
-            buy_threshold = self.get_subnet_buy_threshold(subnet_netuid)
             patch_limit = getattr(patch, 'max_tao_per_buy', None)
             if patch_limit is not None:
                 max_tao_per_buy = min(max_tao_per_buy, float(patch_limit))
@@ -1102,37 +1308,33 @@ class BittensorUtility():
         if not ignore_balance_limits:
             max_tao_per_buy = min(max_tao_per_buy, float(self.balance))
             if max_tao_per_buy < 0.01:
-                if not preview_only:
-                    logger.info(f'Not enough balance to stake: {self.balance:.2f}')
-                return None
+                notes.append(f'Not enough balance to stake: {self.balance:.2f}')
+                return None, notes
 
         allocation_headroom = self._max_additional_subnet_allocation(subnet_netuid)
         if not ignore_balance_limits and allocation_headroom is not None:
             max_tao_per_buy = min(max_tao_per_buy, allocation_headroom)
             if max_tao_per_buy < 0.01:
-                if not preview_only:
-                    logger.info(
-                        f'Subnet allocation cap reached for sn{subnet_netuid}: '
-                        f'ratio={float(getattr(bagbot_settings, "MAX_SUBNET_ALLOCATION_RATIO", 0.0)):.2f}, '
-                        f'current_value={self.my_subnet_staked_value(subnet_netuid):.4f}, '
-                        f'portfolio_value={(self.my_total_staked_value() + float(self.balance)):.4f}'
-                    )
-                return None
+                notes.append(
+                    f'Subnet allocation cap reached for sn{subnet_netuid}: '
+                    f'ratio={float(getattr(bagbot_settings, "MAX_SUBNET_ALLOCATION_RATIO", 0.0)):.2f}, '
+                    f'current_value={self.my_subnet_staked_value(subnet_netuid):.4f}, '
+                    f'portfolio_value={(self.my_total_staked_value() + float(self.balance)):.4f}'
+                )
+                return None, notes
 
         if subnet_netuid in self.stats and self.stats[subnet_netuid]['price'] < buy_threshold and current_stake_amt < self.subnet_grids[subnet_netuid]['max_alpha']:
-            if not preview_only:
-                logger.info(f'''Want to buy sn{subnet_netuid} at price {self.stats[subnet_netuid]['price']} because it's lower than my threshold: {buy_threshold}, currently have {current_stake_amt} alpha in it''')
+            notes.append(f'''Want to buy sn{subnet_netuid} at price {self.stats[subnet_netuid]['price']} because it's lower than my threshold: {buy_threshold}, currently have {current_stake_amt} alpha in it''')
 
             tao_amount = self.determineTokenBuyAmount(max_tao_per_buy, self.stats[subnet_netuid]['tao_in'], max_slippage)
             min_new_position_tao = float(getattr(bagbot_settings, 'MIN_TAO_PER_NEW_POSITION', 0.0) or 0.0)
             if current_stake_amt <= 0 and tao_amount < min_new_position_tao:
-                if not preview_only:
-                    logger.info(
-                        f'Skipping new position in sn{subnet_netuid}: '
-                        f'calculated buy size {tao_amount:.6f} TAO is below '
-                        f'MIN_TAO_PER_NEW_POSITION={min_new_position_tao:.6f}'
-                    )
-                return None
+                notes.append(
+                    f'Skipping new position in sn{subnet_netuid}: '
+                    f'calculated buy size {tao_amount:.6f} TAO is below '
+                    f'MIN_TAO_PER_NEW_POSITION={min_new_position_tao:.6f}'
+                )
+                return None, notes
             slippage = self.determineSlippage(tao_amount, self.stats[subnet_netuid]['tao_in'])
             if self._slippage_exceeds_limit(slippage, max_slippage):
                 raise Exception(f'Stopping before purchasing too much slippage: {Decimal(slippage)}, max slippage per buy/sell: {Decimal(max_slippage)}.  \nTO FIX: increase the max_tao_per_buy variable or increase max_slippage_percent_per_buy')
@@ -1145,25 +1347,37 @@ class BittensorUtility():
                 'calculated_slippage':slippage,
                 'max_slippage':max_slippage / 100.0
             }
-            if not preview_only:
-                logger.info(f"About to stake {tao_amount} to {subnet_netuid} with expected slippage of {slippage:.4f}%")
-            return trade
-        if not ignore_balance_limits and not preview_only and max_tao_per_buy < float('inf') and self.balance < max_tao_per_buy:
-            logger.info(f'Not enough balance to stake: {self.balance:.2f}')
-        return None
+            notes.append(f"About to stake {tao_amount} to {subnet_netuid} with expected slippage of {slippage:.4f}%")
+            return trade, notes
+        if not ignore_balance_limits and max_tao_per_buy < float('inf') and self.balance < max_tao_per_buy:
+            notes.append(f'Not enough balance to stake: {self.balance:.2f}')
+        return None, notes
 
     def constructSell(self, subnet_netuid, force_sell=False, desired_tao=None, force_reason=None, preview_only=False):
-        patch = self._apply_live_patch(subnet_netuid)
+        trade, notes = self._trade_plan().leg(
+            subnet_netuid, 'sell', (force_sell, desired_tao, force_reason),
+            lambda: self._plan_sell(subnet_netuid, force_sell, desired_tao, force_reason),
+        )
+        if not preview_only:
+            for note in notes:
+                logger.info(note)
+        return dict(trade) if trade is not None else None
+
+
+    def _plan_sell(self, subnet_netuid, force_sell, desired_tao, force_reason):
+        """Size the sell leg for a subnet; returns (trade or None, log lines for an executing caller)."""
+        notes = []
+        planned = self._planned_subnet(subnet_netuid)
+        patch = planned['patch']
         if patch is not None and not patch.enable_sells and not force_sell:
-            return None
+            return None, notes
 
-        sell_threshold = self.get_subnet_sell_threshold(subnet_netuid)
+        sell_threshold = planned['sell_threshold']
         max_tao_per_sell = self._limit_or_unbounded(
             self.get_subnet_setting(subnet_netuid, 'max_tao_per_sell', bagbot_settings.MAX_TAO_PER_SELL)
         )
 
         if patch is not None:
-            sell_threshold = self.get_subnet_sell_threshold(subnet_netuid)
             patch_limit = getattr(patch, 'max_tao_per_sell', None)
             if patch_limit is not None:
                 max_tao_per_sell = min(max_tao_per_sell, float(patch_limit))
@@ -1174,19 +1388,20 @@ class BittensorUtility():
         if subnet_netuid in self.stats and self.my_current_stake(subnet_netuid) > 0:
             hotkey = self.determineHotKey(max_tao_per_sell / self.stats[subnet_netuid]['price'], subnet_netuid)
             if hotkey is None:
-                return None
+                return None, notes
 
             if force_sell or self.stats[subnet_netuid]['price'] > sell_threshold:
-                return self._build_sell_trade(
+                trade = self._build_sell_trade(
                     subnet_netuid=subnet_netuid,
                     max_tao_per_sell=max_tao_per_sell,
                     sell_threshold=sell_threshold,
                     hotkey=hotkey,
                     force_reason=force_reason,
-                    preview_only=preview_only,
+                    notes=notes,
                 )
+                return trade, notes
 
-        return None
+        return None, notes
 
 
     async def constructRotationTrade(self):
@@ -1210,6 +1425,7 @@ class BittensorUtility():
 
         best_trade = None
         near_misses = []
+        semaphore = asyncio.Semaphore(self._rotation_sim_concurrency())
 
         def remember_near_miss(priority, closeness, message):
             near_misses.append({
@@ -1218,6 +1434,7 @@ class BittensorUtility():
                 'message': message,
             })
 
+        targets, discounts, target_hotkeys, buy_trades = [], [], [], {}
         for target_netuid in self.subnet_grids:
             blocked_reason = self._subnet_execution_block_reason(target_netuid)
             if blocked_reason:
@@ -1235,125 +1452,275 @@ class BittensorUtility():
             if buy_threshold <= 0:
                 continue
 
-            discount_pct = max(0.0, (buy_threshold - self.stats[target_netuid]['price']) / buy_threshold)
-            if discount_pct < target_discount_floor:
-                closeness = discount_pct / target_discount_floor if target_discount_floor > 0 else 0.0
+            targets.append(target_netuid)
+            discounts.append(max(0.0, (buy_threshold - self.stats[target_netuid]['price']) / buy_threshold))
+            target_hotkeys.append(buy_trade['hotkey'])
+            buy_trades[target_netuid] = buy_trade
+
+        sources, weaknesses, source_hotkeys = [], [], []
+        for source_netuid in self.subnet_grids:
+            if self.my_current_stake(source_netuid) <= 0 or source_netuid not in self.stats:
+                continue
+            sell_leg = self.constructSell(source_netuid, force_sell=True, preview_only=True)
+            if sell_leg is None:
+                continue
+
+            sell_threshold = float(sell_leg['sell_threshold'])
+            if sell_threshold <= 0:
+                continue
+
+            sources.append(source_netuid)
+            weaknesses.append(max(0.0, (sell_threshold - self.stats[source_netuid]['price']) / sell_threshold))
+            source_hotkeys.append(sell_leg['hotkey'])
+
+        pair_plan = tradeHelpers.RotationPairPlan(
+            targets, discounts, target_hotkeys,
+            sources, weaknesses, source_hotkeys,
+            discount_floor=target_discount_floor,
+            weakness_floor=source_weakness_floor,
+        )
+        candidates = []
+        for target_netuid, source_netuid, discount_pct, weakness_pct in pair_plan.eligible_pairs():
+            buy_trade = buy_trades[target_netuid]
+            sell_trade = self.constructSell(
+                source_netuid,
+                force_sell=True,
+                desired_tao=float(buy_trade['tao_amount']),
+                preview_only=True,
+            )
+            if sell_trade is None:
+                continue
+            candidates.append((target_netuid, source_netuid, buy_trade, sell_trade, discount_pct, weakness_pct))
+
+        # Pre-screen on local pool math, simulate the survivors concurrently on chain,
+        # then evaluate them in roster order.
+        candidates = self._prescreen_rotation_candidates(candidates, remember_near_miss)
+        quotes = await asyncio.gather(*(
+            self._quote_rotation(source_netuid, target_netuid, sell_trade['alpha_amount'], semaphore)
+            for target_netuid, source_netuid, _, sell_trade, _, _ in candidates
+        ))
+        for (target_netuid, source_netuid, buy_trade, sell_trade, discount_pct, weakness_pct), sim_result in zip(candidates, quotes):
+            movement_fee_tao = float(sim_result.tao_fee)
+            alpha_fee_tao = float(sim_result.alpha_fee) * self.stats[target_netuid]['price']
+            estimated_total_fee_tao = movement_fee_tao + alpha_fee_tao + extrinsic_fee_buffer_tao
+            gross_edge_pct = discount_pct + weakness_pct
+            fee_drag_pct = estimated_total_fee_tao / sell_trade['approx_tao'] if sell_trade['approx_tao'] > 0 else 1.0
+            net_edge_pct = gross_edge_pct - fee_drag_pct
+            if net_edge_pct < min_net_edge_pct:
+                closeness = net_edge_pct / min_net_edge_pct if min_net_edge_pct > 0 else 0.0
                 remember_near_miss(
-                    priority=1.0,
+                    priority=3.0,
                     closeness=closeness,
                     message=(
-                        f'sn{target_netuid} target_discount {discount_pct:.2%} < '
-                        f'{target_discount_floor:.2%}'
+                        f'sn{source_netuid}->sn{target_netuid} net_edge {net_edge_pct:.2%} < '
+                        f'{min_net_edge_pct:.2%} (discount={discount_pct:.2%}, '
+                        f'weakness={weakness_pct:.2%}, fee_drag={fee_drag_pct:.2%})'
                     ),
                 )
                 continue
 
-            desired_tao = float(buy_trade['tao_amount'])
-            for source_netuid in self.subnet_grids:
-                if source_netuid == target_netuid:
-                    continue
-                if self.my_current_stake(source_netuid) <= 0 or source_netuid not in self.stats:
-                    continue
+            if best_trade is None or net_edge_pct > best_trade['net_edge_pct']:
+                best_trade = {
+                    'type': 'rotation_swap',
+                    'hotkey': sell_trade['hotkey'],
+                    'origin_netuid': source_netuid,
+                    'destination_netuid': target_netuid,
+                    'alpha_amount': sell_trade['alpha_amount'],
+                    'approx_tao': sell_trade['approx_tao'],
+                    'max_slippage': min(sell_trade['max_slippage'], buy_trade['max_slippage']),
+                    'source_sell_threshold': sell_trade['sell_threshold'],
+                    'target_buy_threshold': buy_trade['buy_threshold'],
+                    'rotation_reason': (
+                        f'rotation_to_sn{target_netuid}: target is {discount_pct:.2%} below its buy threshold '
+                        f'while sn{source_netuid} is {weakness_pct:.2%} below its sell threshold; '
+                        f'fee_drag={fee_drag_pct:.2%}; net_edge={net_edge_pct:.2%}'
+                    ),
+                    'discount_pct': discount_pct,
+                    'weakness_pct': weakness_pct,
+                    'gross_edge_pct': gross_edge_pct,
+                    'net_edge_pct': net_edge_pct,
+                    'estimated_fee_tao': estimated_total_fee_tao,
+                    'simulated_destination_alpha': float(sim_result.alpha_amount),
+                    'mev_protection': self._mev_enabled(),
+                }
 
-                sell_trade = self.constructSell(
-                    source_netuid,
-                    force_sell=True,
-                    desired_tao=desired_tao,
-                    preview_only=True,
-                )
-                if sell_trade is None:
-                    continue
+        if best_trade is None:
+            near_misses.extend(pair_plan.near_misses(self._rotation_near_miss_log_limit()))
+            self._log_rotation_near_misses(near_misses)
+        return best_trade
 
-                sell_threshold = float(sell_trade['sell_threshold'])
-                if sell_threshold <= 0:
-                    continue
 
-                weakness_pct = max(0.0, (sell_threshold - self.stats[source_netuid]['price']) / sell_threshold)
-                if weakness_pct < source_weakness_floor:
-                    closeness = weakness_pct / source_weakness_floor if source_weakness_floor > 0 else 0.0
-                    remember_near_miss(
-                        priority=2.0,
-                        closeness=closeness,
-                        message=(
-                            f'sn{source_netuid}->sn{target_netuid} source_weakness {weakness_pct:.2%} < '
-                            f'{source_weakness_floor:.2%} (target_discount={discount_pct:.2%})'
-                        ),
-                    )
-                    continue
+    def _rotation_sim_concurrency(self):
+        raw_limit = getattr(bagbot_settings, 'ROTATION_SIM_CONCURRENCY', 8)
+        try:
+            return max(1, int(raw_limit))
+        except (TypeError, ValueError):
+            return 8
+
+
+    def _rotation_sim_top_k(self):
+        raw_limit = getattr(bagbot_settings, 'ROTATION_SIM_TOP_K', 3)
+        try:
+            return int(raw_limit)
+        except (TypeError, ValueError):
+            return 3
+
+
+    def _prescreen_rotation_candidates(self, candidates, remember_near_miss):
+        """
+        Keep only the top ROTATION_SIM_TOP_K rotation candidates by locally simulated net edge.
+
+        Args:
+            candidates: List of (target_netuid, source_netuid, buy_trade, sell_trade, discount_pct, weakness_pct)
+            remember_near_miss: Callback used to report candidates that were screened out
+
+        Returns:
+            The surviving candidates, in their original order
+        """
+        top_k = self._rotation_sim_top_k()
+        if top_k <= 0 or len(candidates) <= top_k:
+            return candidates
+
+        simulator = poolHelpers.LocalPoolSimulator(self.stats)
+        local = [i for i, c in enumerate(candidates) if c[0] in simulator and c[1] in simulator]
+        if len(local) <= top_k:
+            return candidates
+        estimate = simulator.swap(
+            [candidates[i][1] for i in local],
+            [candidates[i][0] for i in local],
+            [float(candidates[i][3]['alpha_amount']) for i in local],
+        )
+        gross_edge = np.array([candidates[i][4] + candidates[i][5] for i in local], dtype=float)
+        local_net_edge = gross_edge - estimate['value_loss_pct']
+        ranked = np.argsort(-local_net_edge, kind='stable')
+        keep = {local[j] for j in ranked[:top_k]}
+        for j in ranked[top_k:]:
+            target_netuid, source_netuid = candidates[local[j]][0], candidates[local[j]][1]
+            remember_near_miss(
+                priority=2.8,
+                closeness=0.0,
+                message=(
+                    f'sn{source_netuid}->sn{target_netuid} local net_edge {local_net_edge[j]:.2%} '
+                    f'outside top {top_k} for sim_swap'
+                ),
+            )
+        return [c for i, c in enumerate(candidates) if i in keep or i not in local]
 
-                if sell_trade['hotkey'] != buy_trade['hotkey']:
-                    closeness = min(
-                        discount_pct / target_discount_floor if target_discount_floor > 0 else 1.0,
-                        weakness_pct / source_weakness_floor if source_weakness_floor > 0 else 1.0,
-                    )
-                    remember_near_miss(
-                        priority=2.5,
-                        closeness=closeness,
-                        message=(
-                            f'sn{source_netuid}->sn{target_netuid} hotkey mismatch '
-                            f'({sell_trade["hotkey"]} != {buy_trade["hotkey"]})'
-                        ),
-                    )
-                    continue
 
-                sim_result = await self.sub.sim_swap(
+    def _rotation_amount_bucket(self, alpha_amount):
+        """Round a stake amount (in rao) to 4 significant digits so near-identical quotes share a cache entry."""
+        rao = int(alpha_amount.rao) if hasattr(alpha_amount, 'rao') else int(round(float(alpha_amount) * 1e9))
+        digits = len(str(abs(rao)))
+        return round(rao, -(digits - 4)) if digits > 4 else rao
+
+
+    async def _quote_rotation(self, source_netuid, target_netuid, alpha_amount, semaphore=None):
+        """
+        sim_swap quote for a rotation, keyed by (origin, destination, amount bucket).
+
+        Within a block the quote comes from the per-block read cache; across ticks it
+        is reused while neither pool has changed (refresh_stats() drops cached quotes
+        that touch a dirty subnet).
+        """
+        bucket = self._rotation_amount_bucket(alpha_amount)
+        key = (source_netuid, target_netuid, bucket)
+        if key in self.rotation_quotes:
+            return self.rotation_quotes[key]
+        block_hash = self._tick_block_hash()
+        sub = self.sub
+        semaphore = semaphore or asyncio.Semaphore(1)
+
+        async def simulate():
+            async with semaphore:
+                return await sub.sim_swap(
                     origin_netuid=source_netuid,
                     destination_netuid=target_netuid,
-                    amount=sell_trade['alpha_amount'],
+                    amount=alpha_amount,
+                    block_hash=block_hash,
                 )
-                movement_fee_tao = float(sim_result.tao_fee)
-                alpha_fee_tao = float(sim_result.alpha_fee) * self.stats[target_netuid]['price']
-                estimated_total_fee_tao = movement_fee_tao + alpha_fee_tao + extrinsic_fee_buffer_tao
-                gross_edge_pct = discount_pct + weakness_pct
-                fee_drag_pct = estimated_total_fee_tao / sell_trade['approx_tao'] if sell_trade['approx_tao'] > 0 else 1.0
-                net_edge_pct = gross_edge_pct - fee_drag_pct
-                if net_edge_pct < min_net_edge_pct:
-                    closeness = net_edge_pct / min_net_edge_pct if min_net_edge_pct > 0 else 0.0
-                    remember_near_miss(
-                        priority=3.0,
-                        closeness=closeness,
-                        message=(
-                            f'sn{source_netuid}->sn{target_netuid} net_edge {net_edge_pct:.2%} < '
-                            f'{min_net_edge_pct:.2%} (discount={discount_pct:.2%}, '
-                            f'weakness={weakness_pct:.2%}, fee_drag={fee_drag_pct:.2%})'
-                        ),
-                    )
-                    continue
 
-                if best_trade is None or net_edge_pct > best_trade['net_edge_pct']:
-                    best_trade = {
-                        'type': 'rotation_swap',
-                        'hotkey': sell_trade['hotkey'],
-                        'origin_netuid': source_netuid,
-                        'destination_netuid': target_netuid,
-                        'alpha_amount': sell_trade['alpha_amount'],
-                        'approx_tao': sell_trade['approx_tao'],
-                        'max_slippage': min(sell_trade['max_slippage'], buy_trade['max_slippage']),
-                        'source_sell_threshold': sell_trade['sell_threshold'],
-                        'target_buy_threshold': buy_trade['buy_threshold'],
-                        'rotation_reason': (
-                            f'rotation_to_sn{target_netuid}: target is {discount_pct:.2%} below its buy threshold '
-                            f'while sn{source_netuid} is {weakness_pct:.2%} below its sell threshold; '
-                            f'fee_drag={fee_drag_pct:.2%}; net_edge={net_edge_pct:.2%}'
-                        ),
-                        'discount_pct': discount_pct,
-                        'weakness_pct': weakness_pct,
-                        'gross_edge_pct': gross_edge_pct,
-                        'net_edge_pct': net_edge_pct,
-                        'estimated_fee_tao': estimated_total_fee_tao,
-                        'simulated_destination_alpha': float(sim_result.alpha_amount),
-                        'mev_protection': self._mev_enabled(),
-                    }
+        sim_result = await self.read_cache.get(
+            'sim_swap',
+            {'origin_netuid': source_netuid, 'destination_netuid': target_netuid, 'amount_bucket': bucket},
+            block_hash,
+            simulate,
+        )
+        self.rotation_quotes[key] = sim_result
+        return sim_result
+
+
+    def _trade_triggers_enabled(self):
+        return bool(getattr(bagbot_settings, 'ENABLE_TRADE_TRIGGERS', False))
 
-        if best_trade is None:
-            self._log_rotation_near_misses(near_misses)
-        return best_trade
 
+    def _refresh_trade_triggers(self):
+        """Publish each live subnet's current buy/sell trigger price to the trigger engine."""
+        if not self._trade_triggers_enabled():
+            return
+        triggers = {}
+        for netuid, grid in self.subnet_grids.items():
+            current_stake_amt = self.my_current_stake(netuid)
+            buy_threshold, sell_threshold = self.get_planned_thresholds(netuid)
+            buy_at = None
+            if not self._subnet_execution_block_reason(netuid) and current_stake_amt < grid.get('max_alpha', 0):
+                buy_at = buy_threshold
+            sell_at = sell_threshold if current_stake_amt > 0 else None
+            triggers[netuid] = {'buy_at': buy_at, 'sell_at': sell_at}
+        self.trade_triggers.set_triggers(triggers)
+
+
+    async def _quote_spot_price(self, netuid):
+        return float(await self.sub.get_subnet_price(netuid=netuid))
+
+
+    async def _dispatch_trigger(self, netuid, side, price):
+        """Build and execute the triggered trade against the freshly quoted price."""
+        async with self.trade_lock:
+            if netuid not in self.stats or netuid not in self.subnet_grids:
+                return False
+            reserves = self.pool_watcher.reserves.get(netuid, {})
+            self._apply_quote(netuid, dict(self.stats[netuid], price=price, **reserves))
+            self.quote_times[netuid] = time.monotonic()
+            executed = False
+            if side == 'buy':
+                if self._subnet_execution_block_reason(netuid):
+                    return False
+                buyTrade = self.constructBuy(netuid)
+                if buyTrade:
+                    executed = await self.execute_buy_trade(buyTrade)
+            else:
+                sellTrade = self.constructSell(netuid)
+                if sellTrade:
+                    executed = await self.execute_sell_trade(sellTrade)
+            if executed:
+                self.trigger_filled_netuids.add(netuid)
+                await self._refresh_runtime_market_state(netuids=[netuid])
+                self._refresh_trade_triggers()
+            return bool(executed)
 
-    async def _refresh_runtime_market_state(self):
-        discovered_validators = await self.discover_all_validators_with_stake()
-        all_validators = discovered_validators or self.get_all_validators()
-        await self.refresh_stats(all_validators)
+
+    async def _reread_trigger_filled_subnets(self):
+        """
+        Re-read, at the head, the subnets triggers traded since the last tick's trading.
+
+        The tick's refresh_stats() runs outside trade_lock and reads at the tick's block, so it
+        can land after a trigger fill's targeted refresh and put back the stake and pools from
+        before the fill. Called under trade_lock before the tick plans any trade.
+        """
+        if not self.trigger_filled_netuids:
+            return
+        netuids = sorted(self.trigger_filled_netuids)
+        await self._refresh_runtime_market_state(netuids=netuids)
+        self.trigger_filled_netuids.difference_update(netuids)
+
+
+    async def _refresh_runtime_market_state(self, netuids=None):
+        # Our own extrinsic has landed in a newer block than the tick's, so re-read at the current head.
+        head_hash = await self.sub.substrate.get_chain_head()
+        if netuids:
+            await self.refresh_subnets(netuids, block_hash=head_hash)
+        else:
+            await self.refresh_stats(block_hash=head_hash)
 
 
     async def _execute_two_step_rotation(self, rotationTrade, failure_reason):
@@ -1378,7 +1745,9 @@ class BittensorUtility():
         if not sell_ok:
             return False
 
-        await self._refresh_runtime_market_state()
+        await self._refresh_runtime_market_state(
+            netuids=[rotationTrade['origin_netuid'], rotationTrade['destination_netuid']],
+        )
         if self._subnet_execution_block_reason(rotationTrade['destination_netuid']):
             logger.warning(
                 f"Destination sn{rotationTrade['destination_netuid']} became blocked before fallback buy"
@@ -1396,11 +1765,119 @@ class BittensorUtility():
         return await self.execute_buy_trade(buy_trade)
 
 
+    def _record_buy_fill(self, buyTrade, adjust_portfolio=True, response=None):
+        est_alpha = float(buyTrade['tao_amount']) / self.stats[buyTrade['netuid']]['price'] if self.stats[buyTrade['netuid']]['price'] > 0 else 0
+        if adjust_portfolio:
+            self._record_portfolio_fill(buyTrade['hotkey'], buyTrade['netuid'], est_alpha)
+        if _strategy_engine is not None:
+            try:
+                fill_id = _strategy_engine.on_fill(
+                    netuid=buyTrade['netuid'], side='buy',
+                    tao_amount=float(buyTrade['tao_amount']),
+                    alpha_amount=est_alpha,
+                    price=self.stats[buyTrade['netuid']]['price'],
+                )
+                self._reconcile_fills(response, [{'fill_id': fill_id, 'netuid': buyTrade['netuid'], 'side': 'buy'}])
+            except Exception as e:
+                logger.error(f'Brains on_fill error (buy): {e}')
+
+
+    def _record_buy_failure(self, buyTrade, result_text):
+        block_reason = self._extract_execution_block_reason(result_text)
+        if block_reason:
+            self._block_subnet_execution(buyTrade['netuid'], block_reason)
+        logger.info(f"Failed to stake {float(buyTrade['tao_amount'])} TAO to subnet {buyTrade['netuid']} ({result_text})")
+
+
+    def _record_sell_fill(self, sellTrade, adjust_portfolio=True, response=None):
+        if sellTrade.get('rotation_reason'):
+            logger.info(f"Rotation exit executed on sn{sellTrade['netuid']}: {sellTrade['rotation_reason']}")
+        logger.info(f"Unstaked {float(sellTrade['alpha_amount'])} stake units from sn{sellTrade['netuid']} (approx. {sellTrade['approx_tao']:.4f} TAO value) at price: {self.stats[sellTrade['netuid']]['price']}.  my threshold = {sellTrade['sell_threshold']}")
+        if adjust_portfolio:
+            self._record_portfolio_fill(sellTrade['hotkey'], sellTrade['netuid'], -float(sellTrade['alpha_amount']))
+        if _strategy_engine is not None:
+            try:
+                fill_id = _strategy_engine.on_fill(
+                    netuid=sellTrade['netuid'], side='sell',
+                    tao_amount=sellTrade['approx_tao'],
+                    alpha_amount=float(sellTrade['alpha_amount']),
+                    price=self.stats[sellTrade['netuid']]['price'],
+                )
+                self._reconcile_fills(response, [{'fill_id': fill_id, 'netuid': sellTrade['netuid'], 'side': 'sell'}])
+            except Exception as e:
+                logger.error(f'Brains on_fill error (sell): {e}')
+
+
+    def _record_rotation_fill(self, active_trade, adjust_portfolio=True, response=None):
+        if adjust_portfolio:
+            self._record_portfolio_fill(active_trade['hotkey'], active_trade['origin_netuid'], -float(active_trade['alpha_amount']))
+            self._record_portfolio_fill(active_trade['hotkey'], active_trade['destination_netuid'], active_trade['simulated_destination_alpha'])
+        if _strategy_engine is not None:
+            try:
+                sell_fill_id = _strategy_engine.on_fill(
+                    netuid=active_trade['origin_netuid'], side='sell',
+                    tao_amount=active_trade['approx_tao'],
+                    alpha_amount=float(active_trade['alpha_amount']),
+                    price=self.stats[active_trade['origin_netuid']]['price'],
+                )
+                buy_fill_id = _strategy_engine.on_fill(
+                    netuid=active_trade['destination_netuid'], side='buy',
+                    tao_amount=max(0.0, active_trade['approx_tao'] - active_trade['estimated_fee_tao']),
+                    alpha_amount=active_trade['simulated_destination_alpha'],
+                    price=self.stats[active_trade['destination_netuid']]['price'],
+                )
+                self._reconcile_fills(response, [
+                    {'fill_id': sell_fill_id, 'netuid': active_trade['origin_netuid'], 'side': 'sell'},
+                    {'fill_id': buy_fill_id, 'netuid': active_trade['destination_netuid'], 'side': 'buy'},
+                ])
+            except Exception as e:
+                logger.error(f'Brains on_fill error (rotation): {e}')
+
+
+    def _reconcile_fills(self, response, fills):
+        """Queue fills booked from estimates for correction from their extrinsic's stake events.
+
+        A response with a receipt is read directly. For an MEV-shielded trade
+        that is the revealed extrinsic's receipt (mev_extrinsic): the submitted
+        one only carries the encrypted wrapper, and the stake events are
+        emitted when the shield decrypts and executes the call. One sent
+        without waiting for inclusion is found by its extrinsic hash,
+        searching forward from the tick's block.
+        """
+        fills = [fill for fill in fills if fill['fill_id'] is not None]
+        if response is None or not fills:
+            return
+        if self.fill_reconciler is None:
+            self.fill_reconciler = tradeHelpers.FillReconciler(self._on_fill_realized)
+        receipt = getattr(response, 'mev_extrinsic', None) or getattr(response, 'extrinsic_receipt', None)
+        if receipt is not None:
+            self.fill_reconciler.submit(receipt, fills)
+            return
+        extrinsic_hash = tradeHelpers.extrinsic_hash_of(response)
+        if extrinsic_hash is None:
+            logger.debug(f'No receipt or extrinsic hash to reconcile fills {fills} from')
+            return
+        from_block = self.current_block['block'] if self.current_block else None
+        self.fill_reconciler.submit_pending(self.submit_sub.substrate, extrinsic_hash, fills, from_block=from_block)
+
+
+    def _on_fill_realized(self, fill_id, realized):
+        if _strategy_engine is None:
+            return
+        try:
+            _strategy_engine.reconcile_fill(fill_id, **realized)
+        except Exception as e:
+            logger.error(f'Brains reconcile_fill error: {e}')
+
+
     async def execute_buy_trade(self, buyTrade):
         async def submit_buy():
             mev_protection = self._mev_enabled()
+            prepared = self._take_prepared_extrinsic(buyTrade)
+            if prepared is not None:
+                return await asyncio.wait_for(self._submit_prepared_extrinsic(prepared, buyTrade, wait_for_inclusion=False), timeout=45.0)
             return await asyncio.wait_for(
-                self.sub.add_stake(
+                self.submit_sub.add_stake(
                     wallet=self.wallet,
                     hotkey_ss58=buyTrade['hotkey'],
                     netuid=buyTrade['netuid'],
@@ -1417,7 +1894,7 @@ class BittensorUtility():
             )
 
         try:
-            logger.info(f"Attempting to stake {float(buyTrade['tao_amount'])} TAO to subnet {buyTrade['netuid']}")
+            logger.info(f"Attempting to stake {float(buyTrade['tao_amount'])} TAO to subnet {buyTrade['netuid']}{self._describe_quote_age(buyTrade)}")
             stake_result = await submit_buy()
             print(f'after buy {str(buyTrade)}')
             if self._transaction_outdated(str(stake_result)):
@@ -1427,23 +1904,10 @@ class BittensorUtility():
                 stake_result = await submit_buy()
             if stake_result is True or stake_result.__dict__.get('success') is True:
                 logger.info(f"Staked {float(buyTrade['tao_amount'])} TAO to subnet {buyTrade['netuid']} ({str(stake_result)})")
-                if _strategy_engine is not None:
-                    try:
-                        est_alpha = float(buyTrade['tao_amount']) / self.stats[buyTrade['netuid']]['price'] if self.stats[buyTrade['netuid']]['price'] > 0 else 0
-                        _strategy_engine.on_fill(
-                            netuid=buyTrade['netuid'], side='buy',
-                            tao_amount=float(buyTrade['tao_amount']),
-                            alpha_amount=est_alpha,
-                            price=self.stats[buyTrade['netuid']]['price'],
-                        )
-                    except Exception as e:
-                        logger.error(f'Brains on_fill error (buy): {e}')
+                self._record_buy_fill(buyTrade, response=stake_result)
                 return True
             else:
-                block_reason = self._extract_execution_block_reason(str(stake_result))
-                if block_reason:
-                    self._block_subnet_execution(buyTrade['netuid'], block_reason)
-                logger.info(f"Failed to stake {float(buyTrade['tao_amount'])} TAO to subnet {buyTrade['netuid']} ({str(stake_result)})")
+                self._record_buy_failure(buyTrade, str(stake_result))
                 return False
         except asyncio.TimeoutError:
             logger.error(f"Timeout staking on subnet {buyTrade['netuid']} after 45s")
@@ -1458,8 +1922,11 @@ class BittensorUtility():
     async def execute_sell_trade(self, sellTrade):
         async def submit_sell():
             mev_protection = self._mev_enabled()
+            prepared = self._take_prepared_extrinsic(sellTrade)
+            if prepared is not None:
+                return await asyncio.wait_for(self._submit_prepared_extrinsic(prepared, sellTrade, wait_for_inclusion=True), timeout=60.0)
             return await asyncio.wait_for(
-                self.sub.unstake(
+                self.submit_sub.unstake(
                     wallet=self.wallet,
                     hotkey_ss58=sellTrade['hotkey'] ,
                     netuid=sellTrade['netuid'],
@@ -1476,7 +1943,7 @@ class BittensorUtility():
             )
 
         try:
-            logger.info(f"Attempting to unstake {float(sellTrade['alpha_amount'])} alpha from subnet {sellTrade['netuid']}")
+            logger.info(f"Attempting to unstake {float(sellTrade['alpha_amount'])} alpha from subnet {sellTrade['netuid']}{self._describe_quote_age(sellTrade)}")
             unstake_result = await submit_sell()
             print(f'after sell {str(sellTrade)}')
             if self._transaction_outdated(str(unstake_result)):
@@ -1485,19 +1952,7 @@ class BittensorUtility():
                 )
                 unstake_result = await submit_sell()
             if unstake_result is True or unstake_result.__dict__.get('success') is True:
-                if sellTrade.get('rotation_reason'):
-                    logger.info(f"Rotation exit executed on sn{sellTrade['netuid']}: {sellTrade['rotation_reason']}")
-                logger.info(f"Unstaked {float(sellTrade['alpha_amount'])} stake units from sn{sellTrade['netuid']} (approx. {sellTrade['approx_tao']:.4f} TAO value) at price: {self.stats[sellTrade['netuid']]['price']}.  my threshold = {sellTrade['sell_threshold']}")
-                if _strategy_engine is not None:
-                    try:
-                        _strategy_engine.on_fill(
-                            netuid=sellTrade['netuid'], side='sell',
-                            tao_amount=sellTrade['approx_tao'],
-                            alpha_amount=float(sellTrade['alpha_amount']),
-                            price=self.stats[sellTrade['netuid']]['price'],
-                        )
-                    except Exception as e:
-                        logger.error(f'Brains on_fill error (sell): {e}')
+                self._record_sell_fill(sellTrade, response=unstake_result)
                 return True
             else:
                 logger.info(f"Failed to unstake {str(sellTrade)}  sn{sellTrade['netuid']} ({str(unstake_result)})")
@@ -1506,13 +1961,13 @@ class BittensorUtility():
             msg = f"Timeout unstaking from subnet {sellTrade['netuid']} after 60s"
             print(msg)
             logger.error(msg)
-            self.sub = await my_async_subtensor("finney")
+            await self._recover_subtensor(msg, sub=self.submit_sub)
             return False
         except (asyncio.exceptions.CancelledError, asyncio.exceptions.InvalidStateError) as e:
             print(f'ERROR unstaking - {e}... continuing')
             logger.error(traceback.format_exc())
             logger.error(f"Failed to unstake from subnet {sellTrade['netuid']}: {e}")
-            self.sub = await my_async_subtensor("finney")
+            await self._recover_subtensor(f'unstake cancelled: {e}', sub=self.submit_sub)
             return False
         except Exception as e:
             print(f'ERROR unstaking')
@@ -1523,8 +1978,9 @@ class BittensorUtility():
 
     async def execute_rotation_trade(self, rotationTrade):
         async def submit_rotation(active_trade, mev_protection):
+            self.prepared_extrinsics = []
             return await asyncio.wait_for(
-                self.sub.swap_stake(
+                self.submit_sub.swap_stake(
                     wallet=self.wallet,
                     hotkey_ss58=active_trade['hotkey'],
                     origin_netuid=active_trade['origin_netuid'],
@@ -1541,24 +1997,6 @@ class BittensorUtility():
                 timeout=60.0
             )
 
-        def record_rotation_fill(active_trade):
-            if _strategy_engine is not None:
-                try:
-                    _strategy_engine.on_fill(
-                        netuid=active_trade['origin_netuid'], side='sell',
-                        tao_amount=active_trade['approx_tao'],
-                        alpha_amount=float(active_trade['alpha_amount']),
-                        price=self.stats[active_trade['origin_netuid']]['price'],
-                    )
-                    _strategy_engine.on_fill(
-                        netuid=active_trade['destination_netuid'], side='buy',
-                        tao_amount=max(0.0, active_trade['approx_tao'] - active_trade['estimated_fee_tao']),
-                        alpha_amount=active_trade['simulated_destination_alpha'],
-                        price=self.stats[active_trade['destination_netuid']]['price'],
-                    )
-                except Exception as e:
-                    logger.error(f'Brains on_fill error (rotation): {e}')
-
         try:
             active_trade = dict(rotationTrade)
             logger.info(
@@ -1572,7 +2010,7 @@ class BittensorUtility():
                     f"Rotation swap executed: sn{active_trade['origin_netuid']} -> sn{active_trade['destination_netuid']} | "
                     f"{active_trade['rotation_reason']}"
                 )
-                record_rotation_fill(active_trade)
+                self._record_rotation_fill(active_trade, response=swap_result)
                 return True
             swap_result_text = str(swap_result)
             if active_trade['mev_protection'] and (
@@ -1589,7 +2027,7 @@ class BittensorUtility():
                         f"Rotation swap executed without MEV fallback: sn{active_trade['origin_netuid']} -> "
                         f"sn{active_trade['destination_netuid']} | {active_trade['rotation_reason']}"
                     )
-                    record_rotation_fill(active_trade)
+                    self._record_rotation_fill(active_trade, response=retry_result)
                     return True
                 swap_result = retry_result
                 swap_result_text = str(retry_result)
@@ -1608,7 +2046,7 @@ class BittensorUtility():
                             f"Rotation swap executed after size backoff: sn{resized_trade['origin_netuid']} -> "
                             f"sn{resized_trade['destination_netuid']} | {resized_trade['rotation_reason']}"
                         )
-                        record_rotation_fill(resized_trade)
+                        self._record_rotation_fill(resized_trade, response=retry_result)
                         return True
                     swap_result = retry_result
                     swap_result_text = str(retry_result)
@@ -1635,7 +2073,7 @@ class BittensorUtility():
             )
             print(msg)
             logger.error(msg)
-            self.sub = await my_async_subtensor("finney")
+            await self._recover_subtensor(msg, sub=self.submit_sub)
             return await self._execute_two_step_rotation(active_trade, failure_reason='Timeout')
         except Exception as e:
             print('ERROR rotating')
@@ -1647,12 +2085,442 @@ class BittensorUtility():
             raise
 
 
-    async def do_available_trades(self, subnet_netuid):
+    def plan_cash_allocation(self):
+        """
+        Split spendable TAO across every actionable buy this tick.
+
+        Each buy leg is scored by its discount to the buy threshold per unit of expected
+        slippage. tradeHelpers.allocate_cash then fills the legs in score order against
+        the spendable balance and remaining portfolio budget, holding the execution fee
+        buffer back once per leg rather than once per tick. Per-subnet limits
+        (max_tao_per_buy, MAX_SUBNET_ALLOCATION_RATIO, slippage) are already in each leg.
+
+        Returns:
+            Dict of netuid -> resized buy trade, in execution order
+        """
+        min_new_position_tao = float(getattr(bagbot_settings, 'MIN_TAO_PER_NEW_POSITION', 0.0) or 0.0)
+        legs = []
+        trades = {}
+        for subnet_netuid in self.subnet_grids:
+            if self._subnet_execution_block_reason(subnet_netuid):
+                continue
+            trade = self.constructBuy(subnet_netuid, preview_only=True)
+            if trade is None:
+                continue
+            buy_threshold = float(trade['buy_threshold'])
+            edge_pct = (buy_threshold - self.stats[subnet_netuid]['price']) / buy_threshold if buy_threshold > 0 else 0.0
+            slippage_pct = float(trade['calculated_slippage'])
+            legs.append({
+                'netuid': subnet_netuid,
+                'max_tao': float(trade['tao_amount']),
+                'score': edge_pct / max(slippage_pct, 1e-12),
+                'min_tao': min_new_position_tao if self.my_current_stake(subnet_netuid) <= 0 else 0.0,
+            })
+            trades[subnet_netuid] = trade
+
+        # The spendable balance already holds back one fee buffer; allocate_cash takes one per leg.
+        fee_buffer = self._execution_fee_buffer_tao()
+        split = tradeHelpers.allocate_cash(
+            legs, self._available_spendable_balance() + fee_buffer, self._available_remaining_budget(),
+            fee_per_leg_tao=fee_buffer,
+        )
+        allocation = {}
+        for subnet_netuid, tao_amount in split:
+            trade = dict(trades[subnet_netuid])
+            trade['tao_amount'] = bt.utils.balance.tao(tao_amount)
+            trade['calculated_slippage'] = self.determineSlippage(tao_amount, self.stats[subnet_netuid]['tao_in'])
+            allocation[subnet_netuid] = trade
+        if allocation:
+            logger.info(
+                'Cash allocation: ' + ', '.join(
+                    f"sn{netuid}={float(trade['tao_amount']):.4f} TAO" for netuid, trade in allocation.items()
+                )
+            )
+        return allocation
+
+
+    def _batched_extrinsics_enabled(self):
+        # MEV shield encrypts one call per submission, so shielded trades stay individual.
+        return bool(getattr(bagbot_settings, 'ENABLE_BATCHED_EXTRINSICS', False)) and not self._mev_enabled()
+
+
+    def collect_tick_trades(self, allocation=None, preview_only=False):
+        """
+        Gather this tick's buys and sells in roster order, one per subnet, with the same
+        rules as do_available_trades: a subnet with a buy does not also sell.
+
+        Args:
+            allocation: Optional netuid -> buy trade map from plan_cash_allocation; when given,
+                it supplies the buys (allocated subnets first) instead of constructBuy.
+            preview_only: Build the legs without logging their trade notes, for callers that
+                may never submit them.
+        """
+        order = list(self.subnet_grids)
+        if allocation is not None:
+            order = list(allocation) + [netuid for netuid in order if netuid not in allocation]
+
+        trades = []
+        for subnet_netuid in order:
+            if subnet_netuid in self.inflight_subnets:
+                continue
+            buyTrade = None
+            if not self._subnet_execution_block_reason(subnet_netuid):
+                if allocation is None:
+                    buyTrade = self.constructBuy(subnet_netuid, preview_only=preview_only)
+                else:
+                    buyTrade = allocation.get(subnet_netuid)
+            if buyTrade:
+                trades.append(buyTrade)
+                continue
+            sellTrade = self.constructSell(subnet_netuid, preview_only=preview_only)
+            if sellTrade:
+                trades.append(sellTrade)
+        return trades
+
+
+    async def _execute_single_trade(self, trade):
+        if 'origin_netuid' in trade:
+            return await self.execute_rotation_trade(trade)
+        if 'tao_amount' in trade:
+            return await self.execute_buy_trade(trade)
+        return await self.execute_sell_trade(trade)
+
+
+    async def execute_trade_batch(self, trades):
+        """
+        Submit several buys, sells and rotations as one Utility.force_batch extrinsic.
+
+        Each call carries its own price limit derived from the trade's max_slippage, and
+        each call's outcome is decoded from the batch events and booked like an individual
+        fill. If the batch itself is rejected, nothing executed, so every trade is retried
+        through its individual path.
+
+        Returns:
+            List of (trade, executed) pairs in submission order
+        """
+        trades = await self._requote_trades(trades)
+        if len(trades) < 2:
+            return [(trade, await self._execute_single_trade(trade)) for trade in trades]
+
+        batch = await self._build_stake_batch(trades)
+
+        logger.info(f'Submitting {len(batch)} staking calls as one batch')
+        try:
+            response, outcomes = await asyncio.wait_for(batch.submit(), timeout=60.0)
+        except asyncio.TimeoutError:
+            # The batch may still land; the next tick's refresh will show what executed.
+            msg = f'Timeout submitting batch of {len(batch)} staking calls after 60s'
+            logger.error(msg)
+            await self._recover_subtensor(msg, sub=self.submit_sub)
+            return [(trade, False) for trade in trades]
+
+        if outcomes is None:
+            logger.warning(f'Batch of {len(batch)} staking calls was rejected ({response}); submitting individually')
+            return [(trade, await self._execute_single_trade(trade)) for trade in trades]
+
+        results = []
+        for trade, (ok, error) in zip(trades, outcomes):
+            self._book_trade_outcome(trade, ok, error, response=response)
+            results.append((trade, ok))
+        return results
+
+
+    async def _build_stake_batch(self, trades):
+        """Compose one price-limited call per trade, limits derived from each trade's max_slippage."""
+        batch = tradeHelpers.StakeBatch(self.submit_sub, self.wallet)
+        for trade in trades:
+            if 'origin_netuid' in trade:
+                price_ratio = self.stats[trade['origin_netuid']]['price'] / self.stats[trade['destination_netuid']]['price']
+                await batch.swap_stake(
+                    trade['hotkey'], trade['origin_netuid'], trade['destination_netuid'], trade['alpha_amount'],
+                    limit_ratio=price_ratio * (1 + trade['max_slippage']),
+                )
+            elif 'tao_amount' in trade:
+                await batch.add_stake(
+                    trade['hotkey'], trade['netuid'], trade['tao_amount'],
+                    limit_price=self.stats[trade['netuid']]['price'] * (1 + trade['max_slippage']),
+                )
+            else:
+                await batch.remove_stake(
+                    trade['hotkey'], trade['netuid'], trade['alpha_amount'],
+                    limit_price=self.stats[trade['netuid']]['price'] * (1 - trade['max_slippage']),
+                )
+        return batch
+
+
+    def _book_trade_outcome(self, trade, ok, error=None, adjust_portfolio=True, response=None):
+        """Book one decoded call outcome exactly as the individual execute_* paths would."""
+        if 'origin_netuid' in trade:
+            if ok:
+                logger.info(f"Rotation swap executed: sn{trade['origin_netuid']} -> sn{trade['destination_netuid']}")
+                self._record_rotation_fill(trade, adjust_portfolio=adjust_portfolio, response=response)
+            else:
+                logger.info(f"Failed rotation swap {trade} ({error})")
+        elif 'tao_amount' in trade:
+            if ok:
+                logger.info(f"Staked {float(trade['tao_amount'])} TAO to subnet {trade['netuid']}")
+                self._record_buy_fill(trade, adjust_portfolio=adjust_portfolio, response=response)
+            else:
+                self._record_buy_failure(trade, str(error))
+        elif ok:
+            self._record_sell_fill(trade, adjust_portfolio=adjust_portfolio, response=response)
+        else:
+            logger.info(f"Failed to unstake {str(trade)}  sn{trade['netuid']} ({error})")
+
+
+    def _presign_enabled(self):
+        # Batched and pipelined modes compose their own calls; shielded trades must be encrypted at submit.
+        return (
+            bool(getattr(bagbot_settings, 'ENABLE_PRESIGNED_EXTRINSICS', False))
+            and not self._mev_enabled()
+            and not self._batched_extrinsics_enabled()
+            and not self._pipelined_submission_enabled()
+        )
+
+
+    async def prepare_candidate_extrinsics(self):
+        """
+        Compose and sign the buys and sells this tick would still make, for use on the next block.
+
+        Runs in the background while the scheduler waits for the next head. The candidates are
+        the legs collect_tick_trades() returns after this tick's fills, which are usually the next
+        block's repeat buys and sells, up to PRESIGN_MAX_CANDIDATES of them. They are built as
+        previews, so their trade notes are logged only when a trade is actually submitted. All
+        are signed with the account's next nonce, because only one of them can be used. Each has
+        a short era, so a leftover expires on chain.
+        """
+        self.prepared_extrinsics = []
+        if self.submission_pipeline is not None and self.submission_pipeline.pending:
+            return
+        limit = int(getattr(bagbot_settings, 'PRESIGN_MAX_CANDIDATES', 3))
+        candidates = [trade for trade in self.collect_tick_trades(preview_only=True) if 'origin_netuid' not in trade][:limit]
+        if not candidates:
+            return
+        substrate = self.submit_sub.substrate
+        nonce = await substrate.get_account_next_index(self.wallet.coldkeypub.ss58_address, use_cache=False)
+        prepared = []
+        for trade in candidates:
+            batch = await self._build_stake_batch([trade])
+            extrinsic = await substrate.create_signed_extrinsic(
+                call=batch.calls[0], keypair=self.wallet.coldkey, nonce=nonce, era={'period': 8},
+            )
+            prepared.append(tradeHelpers.PreparedExtrinsic(
+                'buy' if 'tao_amount' in trade else 'sell', trade['netuid'], trade['hotkey'],
+                trade['tao_amount'] if 'tao_amount' in trade else trade['alpha_amount'],
+                batch.limit_prices[0], nonce, extrinsic,
+            ))
+        self.prepared_extrinsics = prepared
+        logger.info(f'Pre-signed {len(prepared)} candidate extrinsic(s) with nonce {nonce}')
+
+
+    def _settle_presign_task(self):
+        """Keep the prepared extrinsics only if their preparation finished before this block."""
+        task, self.presign_task = self.presign_task, None
+        if task is None:
+            return
+        if not task.done():
+            task.cancel()
+            self.prepared_extrinsics = []
+        elif not task.cancelled() and task.exception() is not None:
+            logger.warning(f'Pre-signing candidate extrinsics failed: {task.exception()}')
+            self.prepared_extrinsics = []
+
+
+    def _take_prepared_extrinsic(self, trade):
+        """
+        Return the prepared extrinsic that the fresh trade confirms, if any.
+
+        Every prepared extrinsic shares one nonce, so the set is discarded on any submission.
+        A match has the trade's amount set to the signed amount.
+        """
+        prepared, self.prepared_extrinsics = self.prepared_extrinsics, []
+        price = self.stats.get(trade['netuid'], {}).get('price')
+        for candidate in prepared:
+            if price and candidate.confirms(trade, price):
+                if candidate.side == 'buy':
+                    trade['tao_amount'] = candidate.amount
+                else:
+                    trade['approx_tao'] *= candidate.amount.rao / trade['alpha_amount'].rao
+                    trade['alpha_amount'] = candidate.amount
+                return candidate
+        return None
+
+
+    async def _submit_prepared_extrinsic(self, prepared, trade, wait_for_inclusion):
+        """Broadcast a pre-signed extrinsic, answering like AsyncSubtensor.sign_and_send_extrinsic."""
+        substrate = self.submit_sub.substrate
+        logger.info(
+            f"Submitting pre-signed {prepared.side} on sn{prepared.netuid} "
+            f"(prepared {time.monotonic() - prepared.prepared_at:.1f}s ago, nonce {prepared.nonce})"
+        )
+        try:
+            receipt = await substrate.submit_extrinsic(
+                prepared.extrinsic, wait_for_inclusion=wait_for_inclusion, wait_for_finalization=False,
+            )
+        except async_substrate_interface.errors.SubstrateRequestException as e:
+            return ExtrinsicResponse(success=False, message=str(e), error=e)
+        finally:
+            # Later sends must re-read the nonce rather than reuse a cached one.
+            substrate.clear_nonce_cache_for_account(self.wallet.coldkeypub.ss58_address)
+        if not wait_for_inclusion:
+            return ExtrinsicResponse(success=True, message='Not waiting for finalization or inclusion.', extrinsic=prepared.extrinsic)
+        if await receipt.is_success:
+            return ExtrinsicResponse(success=True, message='Success', extrinsic_receipt=receipt)
+        return ExtrinsicResponse(success=False, message=str(await receipt.error_message), extrinsic_receipt=receipt)
+
+
+    def _pipelined_submission_enabled(self):
+        # Shielded submissions are wrapped and revealed by the MEV pallet, so they keep their own path.
+        return bool(getattr(bagbot_settings, 'ENABLE_PIPELINED_SUBMISSION', False)) and not self._mev_enabled()
+
+
+    def _submission_pipeline(self):
+        if self.submission_pipeline is None:
+            nonces = chainHelpers.NonceManager(self.wallet.coldkeypub.ss58_address)
+            self.submission_pipeline = tradeHelpers.SubmissionPipeline(nonces)
+        return self.submission_pipeline
+
+
+    @staticmethod
+    def _trade_netuids(trade):
+        if 'origin_netuid' in trade:
+            return {trade['origin_netuid'], trade['destination_netuid']}
+        return {trade['netuid']}
+
+
+    async def submit_trades_pipelined(self, trades):
+        """
+        Sign and send trades back-to-back with locally tracked nonces, without waiting for inclusion.
+
+        Each trade is its own extrinsic, or all of them share one force_batch when batching is
+        also enabled. Outcomes are booked by _on_pipelined_result as they land; until then the
+        trades' subnets are skipped by collect_tick_trades and their buys are held out of the
+        spendable balance. Trades touching a subnet that is already in flight are dropped.
+
+        Returns:
+            The trades that were submitted
+        """
+        trades = [trade for trade in trades if not self._trade_netuids(trade) & self.inflight_subnets]
+        trades = await self._requote_trades(trades)
+        if not trades:
+            return []
+        if self._batched_extrinsics_enabled() and len(trades) > 1:
+            units = [trades]
+        else:
+            units = [[trade] for trade in trades]
+
+        pipeline = self._submission_pipeline()
+        stake_info = self.current_stake_info
+        for unit in units:
+            batch = await self._build_stake_batch(unit)
+            netuids = set().union(*(self._trade_netuids(trade) for trade in unit))
+            buy_tao = sum(float(trade['tao_amount']) for trade in unit if 'tao_amount' in trade)
+            self.inflight_subnets |= netuids
+            self.inflight_buy_tao += buy_tao
+            nonce = await pipeline.submit(batch, functools.partial(
+                self._on_pipelined_result, unit, netuids, buy_tao, stake_info,
+            ))
+            logger.info(f'Submitted {len(batch)} staking call(s) for sn{sorted(netuids)} with nonce {nonce}')
+        return trades
+
+
+    def _on_pipelined_result(self, trades, netuids, buy_tao, stake_info, response, outcomes):
+        # The pipeline only reports a timed-out extrinsic once its era has ended or its nonce was
+        # consumed, so releasing the subnets here cannot let a re-planned trade race a late landing.
+        self.inflight_subnets -= netuids
+        self.inflight_buy_tao = max(0.0, self.inflight_buy_tao - buy_tao)
+        if outcomes is None:
+            logger.warning(f'Pipelined submission for sn{sorted(netuids)} has no outcome ({response}); it will be re-planned from the next stake read')
+            return
+        # A stake map re-read since submission may already include this fill; only Brains hears about it then.
+        adjust_portfolio = self.current_stake_info is stake_info
+        for trade, (ok, error) in zip(trades, outcomes):
+            self._book_trade_outcome(
+                trade, ok, error, adjust_portfolio=adjust_portfolio,
+                response=response,
+            )
+
+
+    def _quote_age(self, netuid):
+        quoted_at = self.quote_times.get(netuid, self.stats_quoted_at)
+        return None if quoted_at is None else time.monotonic() - quoted_at
+
+
+    async def _requote_trade(self, trade):
+        """
+        Re-quote a buy or sell's pool right before submission and rebuild the trade from it.
+
+        Only done once the subnet's quote is older than REQUOTE_AFTER_SECONDS (default 2s;
+        None disables it). The fresh price and reserves replace the subnet's stats entry and
+        the leg is rebuilt through constructBuy/constructSell, so it is re-sized from the new
+        reserves or dropped if the band is no longer crossed. A rebuilt buy never grows past
+        the amount that was planned for it. The quote's age at submit is kept on the trade.
+        If the re-quote fails or times out, the trade goes ahead as planned; its limit price
+        still bounds the fill.
+
+        Returns:
+            The trade to submit, or None if it should be dropped
+        """
+        if 'origin_netuid' in trade or trade.get('rotation_reason'):
+            return trade
+        netuid = trade['netuid']
+        age = self._quote_age(netuid)
+        requote_after = getattr(bagbot_settings, 'REQUOTE_AFTER_SECONDS', 2.0)
+        if requote_after is None or age is None or age < requote_after:
+            trade['quote_age_seconds'] = age
+            return trade
+
+        try:
+            pool = (await asyncio.wait_for(self.pool_reader.read_subnets(self.sub, [netuid]), timeout=20.0))[netuid]
+        except Exception as e:
+            logger.warning(f'Re-quote of sn{netuid} failed ({type(e).__name__} {e}); keeping the planned trade')
+            trade['quote_age_seconds'] = age
+            return trade
+        self.quote_times[netuid] = time.monotonic()
+        previous = self.stats.get(netuid, {})
+        if pool['price'] <= 0 or all(previous.get(field) == pool[field] for field in ('price', 'tao_in', 'alpha_in')):
+            trade['quote_age_seconds'] = 0.0
+            return trade
+
+        self._apply_quote(netuid, dict(previous, **pool))
+
+        if 'tao_amount' in trade:
+            fresh = None if self._subnet_execution_block_reason(netuid) else self.constructBuy(netuid)
+            if fresh is not None and float(fresh['tao_amount']) > float(trade['tao_amount']):
+                fresh = dict(fresh, tao_amount=trade['tao_amount'])
+        else:
+            fresh = self.constructSell(netuid)
+        logger.info(
+            f"Re-quoted sn{netuid} after {age:.1f}s: price {previous.get('price')} -> {pool['price']}; "
+            + ('trade dropped' if fresh is None else 'trade rebuilt')
+        )
+        if fresh is not None:
+            fresh['quote_age_seconds'] = 0.0
+        return fresh
+
+
+    @staticmethod
+    def _describe_quote_age(trade):
+        age = trade.get('quote_age_seconds')
+        return '' if age is None else f' (quote age {age:.1f}s)'
+
+
+    async def _requote_trades(self, trades):
+        fresh = await asyncio.gather(*(self._requote_trade(trade) for trade in trades))
+        return [trade for trade in fresh if trade]
+
+
+    async def do_available_trades(self, subnet_netuid, allocation=None):
         buy_executed = False
         sell_executed = False
         buyTrade = None
         if not self._subnet_execution_block_reason(subnet_netuid):
-            buyTrade = self.constructBuy(subnet_netuid)
+            if allocation is None:
+                buyTrade = self.constructBuy(subnet_netuid)
+            else:
+                buyTrade = allocation.get(subnet_netuid)
+        if buyTrade:
+            buyTrade = await self._requote_trade(buyTrade)
         if buyTrade:
             buy_executed = await self.execute_buy_trade(buyTrade)
             if buy_executed:
@@ -1662,6 +2530,8 @@ class BittensorUtility():
                 }
 
         sellTrade = self.constructSell(subnet_netuid)
+        if sellTrade:
+            sellTrade = await self._requote_trade(sellTrade)
         if sellTrade:
             sell_executed = await self.execute_sell_trade(sellTrade)
 
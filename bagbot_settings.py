@@ -7,6 +7,9 @@ WALLET_PW_ENV = None #Optional: environment variable name containing the wallet
 WALLET_PW_FILE = None #Optional: path to a file containing only the wallet password
 WALLET_NAME = 'bagbot' #The name of the wallet created in btcli
 
+SUBTENSOR_ENDPOINTS = ['finney'] #Chain endpoints to keep connected (network names or ws:// / wss:// urls, e.g. your own lite node and a backup). Reads use the fastest healthy one.
+SUBTENSOR_SUBMIT_ENDPOINT = None #Optional: endpoint that transactions are sent through (default: first entry of SUBTENSOR_ENDPOINTS)
+
 # Note: LOWER THAN 0.01 MAY CAUSE THE BUYS TO FAIL WHILE STILL TAKING THE GAS FEE
 MAX_TAO_PER_BUY = 0.02 #May increase as desired, I wouldnt reduce it.
 MAX_TAO_PER_SELL = 0.02 #May increase as desired, I wouldnt reduce it
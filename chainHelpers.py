@@ -0,0 +1,531 @@
+"""Chain connection helpers: long-lived, health-checked AsyncSubtensor connections."""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import websockets
+from bittensor.core.async_subtensor import AsyncSubtensor
+
+logger = logging.getLogger(__name__)
+
+
+async def open_async_subtensor(network, attempts=20):
+    """Open and initialize an AsyncSubtensor, retrying transient handshake failures.
+
+    The websocket auto-shutdown timer is disabled because the connection is
+    kept warm by SubtensorConnection's keepalive pings instead.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            sub = AsyncSubtensor(network=network, websocket_shutdown_timer=None)
+            await sub.initialize()
+            return sub
+        except (websockets.exceptions.InvalidStatus, AttributeError, ConnectionError, asyncio.exceptions.TimeoutError) as e:
+            logger.error(f'Could not connect to {network} ({e}), retrying')
+            if attempt >= attempts:
+                raise
+            await asyncio.sleep(attempt * 2)
+
+
+class SubtensorConnection:
+    """Owns the AsyncSubtensor for the whole process.
+
+    The websocket is kept alive with periodic chain-head pings and is only
+    closed and re-opened when a health check fails, instead of paying a fresh
+    websocket + metadata handshake after every tick or error.
+    """
+
+    def __init__(self, network='finney', ping_interval=20.0, ping_timeout=10.0, opener=open_async_subtensor):
+        self.network = network
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self._opener = opener
+        self.sub = None
+        self.healthy = False
+        self.last_failure = ''
+        self.connect_count = 0
+        self.reconnect_count = 0
+        self.failed_health_checks = 0
+        self.last_handshake_seconds = None
+        self.total_handshake_seconds = 0.0
+        self.last_ping_at = None
+        self.last_ping_seconds = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._keepalive_task = None
+
+    def attach(self, sub):
+        """Adopt an already-open subtensor as the live connection."""
+        self.sub = sub
+        self.healthy = sub is not None
+        self._generation += 1
+
+    async def connect(self):
+        start = time.monotonic()
+        self.sub = await self._opener(self.network)
+        elapsed = time.monotonic() - start
+        self._generation += 1
+        self.connect_count += 1
+        self.last_handshake_seconds = elapsed
+        self.total_handshake_seconds += elapsed
+        self.healthy = True
+        self.last_failure = ''
+        logger.info(f'Connected to {self.network} in {elapsed:.2f}s ({self.describe()})')
+        return self.sub
+
+    async def _close_quietly(self, sub):
+        if sub is None:
+            return
+        try:
+            await asyncio.wait_for(sub.close(), timeout=5.0)
+        except Exception as e:
+            logger.warning(f'Error closing stale {self.network} connection: {e}')
+
+    async def reconnect(self, reason):
+        """Tear down the current socket and open a new one."""
+        generation = self._generation
+        async with self._lock:
+            if self._generation != generation and self.healthy:
+                # Someone else already replaced the connection while we waited.
+                return self.sub
+            self.reconnect_count += 1
+            logger.warning(f'Reconnecting to {self.network}: {reason}')
+            stale_sub, self.sub, self.healthy = self.sub, None, False
+            await self._close_quietly(stale_sub)
+            return await self.connect()
+
+    async def ping(self):
+        """Health check: ask the node for its chain head within ping_timeout."""
+        if self.sub is None:
+            return False
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self.sub.substrate.get_chain_head(), timeout=self.ping_timeout)
+        except Exception as e:
+            self.failed_health_checks += 1
+            self.mark_unhealthy(f'health check failed: {type(e).__name__} {e}')
+            return False
+        self.last_ping_seconds = time.monotonic() - start
+        self.last_ping_at = time.time()
+        self.healthy = True
+        return True
+
+    def mark_unhealthy(self, reason):
+        """Flag the connection as suspect; the next ensure_healthy() re-checks it."""
+        self.healthy = False
+        self.last_failure = reason
+
+    async def ensure_healthy(self):
+        """Return a usable subtensor, reconnecting only if a health check fails."""
+        if self.sub is None:
+            async with self._lock:
+                if self.sub is None:
+                    await self.connect()
+            return self.sub
+        if self.healthy:
+            return self.sub
+        if await self.ping():
+            return self.sub
+        return await self.reconnect(self.last_failure or 'health check failed')
+
+    async def _keepalive_loop(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            if self.sub is not None and await self.ping():
+                continue
+            if self.sub is not None:
+                logger.warning(f'Keepalive ping to {self.network} failed: {self.last_failure}')
+            try:
+                await self.ensure_healthy()
+            except Exception as e:
+                logger.error(f'Keepalive reconnect to {self.network} failed: {e}')
+
+    def start_keepalive(self):
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.create_task(self._keepalive_loop())
+
+    async def close(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        stale_sub, self.sub, self.healthy = self.sub, None, False
+        await self._close_quietly(stale_sub)
+
+    def stats(self):
+        return {
+            'network': self.network,
+            'healthy': self.healthy,
+            'connects': self.connect_count,
+            'reconnects': self.reconnect_count,
+            'failed_health_checks': self.failed_health_checks,
+            'last_handshake_seconds': self.last_handshake_seconds,
+            'total_handshake_seconds': self.total_handshake_seconds,
+            'last_ping_seconds': self.last_ping_seconds,
+            'last_failure': self.last_failure,
+        }
+
+    def describe(self):
+        handshake = f'{self.last_handshake_seconds:.2f}s' if self.last_handshake_seconds is not None else 'n/a'
+        ping = f'{self.last_ping_seconds * 1000:.0f}ms' if self.last_ping_seconds is not None else 'n/a'
+        return (
+            f'{self.network}: connects={self.connect_count}, reconnects={self.reconnect_count}, '
+            f'handshake={handshake}, ping={ping}'
+        )
+
+
+class SubtensorPool:
+    """A set of SubtensorConnections to different endpoints, probed continuously.
+
+    Reads go to the healthy endpoint with the lowest last ping, so a slow or
+    dead public node is routed around at the next probe (every probe_interval
+    seconds, which is kept below the block time). Extrinsics are pinned to the
+    submit endpoint and only fall back to the read endpoint while it is down.
+    """
+
+    def __init__(self, endpoints, submit_endpoint=None, probe_interval=6.0, ping_timeout=5.0, opener=open_async_subtensor):
+        endpoints = list(dict.fromkeys(endpoints or ['finney']))
+        if submit_endpoint and submit_endpoint not in endpoints:
+            endpoints.append(submit_endpoint)
+        self.endpoints = endpoints
+        self.submit_endpoint = submit_endpoint or endpoints[0]
+        self.connections = {
+            endpoint: SubtensorConnection(endpoint, ping_interval=probe_interval, ping_timeout=ping_timeout, opener=opener)
+            for endpoint in endpoints
+        }
+        self._connect_tasks = []
+
+    @property
+    def submit_connection(self):
+        return self.connections[self.submit_endpoint]
+
+    def read_connection(self):
+        """Lowest-latency healthy connection, or the submit connection if none is healthy."""
+        healthy = [conn for conn in self.connections.values() if conn.healthy and conn.sub is not None]
+        if not healthy:
+            return self.submit_connection
+        return min(
+            healthy,
+            key=lambda conn: (
+                conn.last_ping_seconds is None,
+                conn.last_ping_seconds or 0.0,
+                conn is not self.submit_connection,
+            ),
+        )
+
+    @property
+    def sub(self):
+        return self.read_connection().sub
+
+    @property
+    def submit_sub(self):
+        conn = self.submit_connection
+        if conn.healthy and conn.sub is not None:
+            return conn.sub
+        return self.sub
+
+    @property
+    def healthy(self):
+        return any(conn.healthy for conn in self.connections.values())
+
+    def attach(self, sub):
+        """Adopt an already-open subtensor as the submit (primary) connection."""
+        self.submit_connection.attach(sub)
+
+    def _owner(self, sub):
+        for conn in self.connections.values():
+            if conn.sub is sub:
+                return conn
+        return None
+
+    async def connect(self):
+        """Open every endpoint concurrently and return as soon as one is usable.
+
+        Endpoints that are still handshaking keep going in the background and
+        join the pool when they finish.
+        """
+        pending = {asyncio.create_task(self._connect_one(conn)) for conn in self.connections.values()}
+        self._connect_tasks = list(pending)
+        last_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                last_error = task.result()
+                if last_error is None:
+                    return self.sub
+        raise last_error
+
+    async def _connect_one(self, conn):
+        try:
+            await conn.ensure_healthy()
+        except Exception as e:
+            logger.error(f'Could not connect to {conn.network}: {e}')
+            return e
+        return None
+
+    def mark_unhealthy(self, reason, sub=None):
+        """Flag the connection that served `sub` (default: the current read connection)."""
+        conn = self._owner(sub) if sub is not None else self.read_connection()
+        (conn or self.read_connection()).mark_unhealthy(reason)
+
+    async def probe(self):
+        """Ping every open endpoint concurrently, refreshing health and latency."""
+        open_connections = [conn for conn in self.connections.values() if conn.sub is not None]
+        await asyncio.gather(*(conn.ping() for conn in open_connections))
+
+    async def ensure_healthy(self):
+        """Return a usable read subtensor, failing over before reconnecting anything."""
+        conn = self.read_connection()
+        if conn.healthy and conn.sub is not None:
+            return conn.sub
+        await self.probe()
+        conn = self.read_connection()
+        if conn.healthy and conn.sub is not None:
+            return conn.sub
+        return await self.submit_connection.ensure_healthy()
+
+    def start_keepalive(self):
+        for conn in self.connections.values():
+            conn.start_keepalive()
+
+    async def close(self):
+        for task in self._connect_tasks:
+            task.cancel()
+        self._connect_tasks = []
+        await asyncio.gather(*(conn.close() for conn in self.connections.values()))
+
+    def stats(self):
+        return {
+            'read_endpoint': self.read_connection().network,
+            'submit_endpoint': self.submit_endpoint,
+            'endpoints': {endpoint: conn.stats() for endpoint, conn in self.connections.items()},
+        }
+
+    def describe(self):
+        if len(self.connections) == 1:
+            return self.submit_connection.describe()
+        endpoints = '; '.join(conn.describe() for conn in self.connections.values())
+        return f'read={self.read_connection().network}, submit={self.submit_endpoint} | {endpoints}'
+
+
+class BlockScheduler:
+    """Drives the bot's ticks from a new-head subscription.
+
+    Heads are tracked as they arrive; next_tick() always returns the newest
+    one, so a slow tick skips straight to the current block instead of
+    queueing stale ones. Each tick is stamped with its block number and hash
+    plus how many blocks it spanned since the previous tick.
+    """
+
+    def __init__(self, connection, stall_timeout=30.0):
+        self.connection = connection
+        self.stall_timeout = stall_timeout
+        self.head_number = None
+        self.head_received_at = None
+        self.last_tick_block = None
+        self.current = None
+        self.ticks = 0
+        self.blocks_skipped = 0
+        self.max_blocks_spanned = 0
+        self.overlapped_ticks = 0
+        self.stalls = 0
+        self._head_event = asyncio.Event()
+        self._task = None
+
+    def on_new_head(self, number):
+        if self.head_number is not None and number <= self.head_number:
+            return
+        self.head_number = number
+        self.head_received_at = time.monotonic()
+        self._head_event.set()
+
+    async def _on_header(self, obj):
+        # subscribe_block_headers passes only the decoded block; returning None keeps it subscribed.
+        number = obj['header']['number']
+        if isinstance(number, str):
+            number = int(number, 16) if number.startswith('0x') else int(number)
+        self.on_new_head(int(number))
+
+    async def _subscribe_forever(self):
+        while True:
+            sub = None
+            try:
+                sub = await self.connection.ensure_healthy()
+                await sub.substrate.subscribe_block_headers(self._on_header)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f'Block header subscription dropped: {type(e).__name__} {e}')
+                self.connection.mark_unhealthy(f'header subscription dropped: {e}', sub=sub)
+                await asyncio.sleep(1)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._subscribe_forever())
+
+    async def restart(self):
+        await self.stop()
+        self.start()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    async def next_tick(self):
+        """Wait for a head newer than the last tick and stamp a tick with the latest one."""
+        while self.head_number is None or (self.last_tick_block is not None and self.head_number <= self.last_tick_block):
+            self._head_event.clear()
+            try:
+                await asyncio.wait_for(self._head_event.wait(), timeout=self.stall_timeout)
+            except asyncio.TimeoutError:
+                self.stalls += 1
+                logger.warning(f'No new block header for {self.stall_timeout:.0f}s, resubscribing')
+                self.connection.mark_unhealthy('block header subscription stalled')
+                await self.restart()
+
+        block = self.head_number
+        head_age = time.monotonic() - self.head_received_at
+        spanned = block - self.last_tick_block if self.last_tick_block is not None else 1
+        block_hash = await self.connection.sub.substrate.get_block_hash(block)
+
+        self.ticks += 1
+        self.blocks_skipped += max(0, spanned - 1)
+        self.max_blocks_spanned = max(self.max_blocks_spanned, spanned)
+        self.last_tick_block = block
+        self.current = {
+            'block': block,
+            'block_hash': block_hash,
+            'blocks_spanned': spanned,
+            'head_age_seconds': head_age,
+        }
+        return self.current
+
+    def finish_tick(self):
+        """Number of new heads that arrived while the current tick was running."""
+        if self.current is None or self.head_number is None:
+            return 0
+        overlap = max(0, self.head_number - self.current['block'])
+        if overlap:
+            self.overlapped_ticks += 1
+        return overlap
+
+    def stats(self):
+        return {
+            'head': self.head_number,
+            'ticks': self.ticks,
+            'blocks_skipped': self.blocks_skipped,
+            'max_blocks_spanned': self.max_blocks_spanned,
+            'overlapped_ticks': self.overlapped_ticks,
+            'stalls': self.stalls,
+        }
+
+    def describe(self):
+        return (
+            f'head={self.head_number}, skipped={self.blocks_skipped}, '
+            f'max_span={self.max_blocks_spanned}, overlapped={self.overlapped_ticks}'
+        )
+
+
+def _freeze(value):
+    """Hashable cache-key form of an RPC argument (Balances compare by rao)."""
+    if hasattr(value, 'rao'):
+        return ('rao', int(value.rao))
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class BlockReadCache:
+    """Read-through cache for chain reads pinned to a block hash.
+
+    State at a given block hash never changes, so a result keyed by
+    (method, args, block_hash) can be shared by everything that reads during
+    that block. Concurrent identical reads share one in-flight request, failed
+    reads are not cached, and only the newest max_blocks blocks are kept.
+    """
+
+    def __init__(self, max_blocks=3):
+        self.max_blocks = max_blocks
+        self.hits = 0
+        self.misses = 0
+        self._blocks = OrderedDict()
+
+    async def get(self, method, kwargs, block_hash, fetch):
+        if block_hash is None:
+            self.misses += 1
+            return await fetch()
+
+        entries = self._blocks.get(block_hash)
+        if entries is None:
+            entries = self._blocks[block_hash] = {}
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+
+        key = (method, _freeze(kwargs))
+        task = entries.get(key)
+        if task is None:
+            self.misses += 1
+            task = entries[key] = asyncio.ensure_future(fetch())
+            task.add_done_callback(lambda done: self._forget_failed(block_hash, key, done))
+        else:
+            self.hits += 1
+        return await asyncio.shield(task)
+
+    def _forget_failed(self, block_hash, key, task):
+        if task.cancelled() or task.exception() is not None:
+            entries = self._blocks.get(block_hash)
+            if entries is not None and entries.get(key) is task:
+                del entries[key]
+
+    def clear(self):
+        self._blocks.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'blocks': len(self._blocks)}
+
+    def describe(self):
+        return f'cache hits={self.hits}, misses={self.misses}'
+
+
+class NonceManager:
+    """Hands out account nonces locally so extrinsics can be signed back-to-back.
+
+    The next nonce is read from the chain (account_nextIndex, which counts
+    transactions already waiting in the pool) only when the caller asks for a
+    resync or after reset(); otherwise each call returns the previous nonce
+    plus one without a round trip.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.issued = 0
+        self.resyncs = 0
+        self._next = None
+        self._lock = asyncio.Lock()
+
+    async def next(self, substrate, resync=False):
+        async with self._lock:
+            if resync or self._next is None:
+                self._next = int(await substrate.get_account_next_index(self.address, use_cache=False))
+                self.resyncs += 1
+            nonce = self._next
+            self._next += 1
+            self.issued += 1
+            return nonce
+
+    def reset(self):
+        """Forget the local nonce; the next call re-reads it from the chain."""
+        self._next = None
+
+    def describe(self):
+        return f'nonces issued={self.issued}, resyncs={self.resyncs}'
@@ -0,0 +1,370 @@
+"""Subnet pool state: a lightweight per-block reader for reserves and prices, plus local pool math."""
+
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RAO_PER_TAO = 1e9
+DEFAULT_SWAP_FEE_RATE = 33 / 65535  # subtensor's default FeeRate (~0.05%)
+
+
+class PoolSnapshot:
+    """Struct-of-arrays view of every subnet pool at one block.
+
+    netuids, prices, tao_in and alpha_in are parallel lists (TAO units);
+    names maps netuid -> cached subnet name.
+    """
+
+    def __init__(self, block_hash, netuids, prices, tao_in, alpha_in, names):
+        self.block_hash = block_hash
+        self.netuids = netuids
+        self.prices = prices
+        self.tao_in = tao_in
+        self.alpha_in = alpha_in
+        self.names = names
+        self._index = {netuid: i for i, netuid in enumerate(netuids)}
+
+    def __len__(self):
+        return len(self.netuids)
+
+    def __contains__(self, netuid):
+        return netuid in self._index
+
+    def index(self, netuid):
+        return self._index[netuid]
+
+    def price(self, netuid):
+        return self.prices[self._index[netuid]]
+
+    def to_stats(self):
+        """The {netuid: {'name', 'price', 'tao_in', 'alpha_in'}} form used by the bot and Brains."""
+        return {
+            netuid: {
+                'name': self.names.get(netuid, ''),
+                'price': self.prices[i],
+                'tao_in': self.tao_in[i],
+                'alpha_in': self.alpha_in[i],
+            }
+            for i, netuid in enumerate(self.netuids)
+        }
+
+
+class PoolStateReader:
+    """Reads pool reserves and prices for all subnets without decoding DynamicInfo.
+
+    Per block this costs one state_queryStorageAt over SubnetTAO/SubnetAlphaIn
+    for every netuid plus one SwapRuntimeApi.current_alpha_price_all call.
+    Subnet names come from a full all_subnets() decode that is only repeated
+    every metadata_refresh_seconds or when a new netuid shows up.
+    """
+
+    def __init__(self, metadata_refresh_seconds=1800.0):
+        self.metadata_refresh_seconds = metadata_refresh_seconds
+        self.names = {}
+        self.metadata_refreshed_at = None
+        self._storage_keys = {}
+        self._key_fields = {}
+
+    def _metadata_stale(self, netuids):
+        if self.metadata_refreshed_at is None:
+            return True
+        if time.monotonic() - self.metadata_refreshed_at > self.metadata_refresh_seconds:
+            return True
+        return any(netuid not in self.names for netuid in netuids)
+
+    async def refresh_metadata(self, sub, block_hash=None):
+        all_subnets = await sub.all_subnets(block_hash=block_hash)
+        self.names = {
+            subnet.netuid: str(subnet.subnet_name) if hasattr(subnet, 'subnet_name') else ''
+            for subnet in all_subnets or []
+        }
+        self.metadata_refreshed_at = time.monotonic()
+
+    async def _storage_keys_for(self, substrate, netuids, block_hash):
+        missing = [netuid for netuid in netuids if netuid not in self._storage_keys]
+        if missing:
+            created = await asyncio.gather(*(
+                substrate.create_storage_key('SubtensorModule', storage_function, [netuid], block_hash)
+                for netuid in missing
+                for storage_function in ('SubnetTAO', 'SubnetAlphaIn')
+            ))
+            for i, netuid in enumerate(missing):
+                tao_key, alpha_key = created[2 * i], created[2 * i + 1]
+                self._storage_keys[netuid] = (tao_key, alpha_key)
+                self._key_fields[tao_key.to_hex()] = (netuid, 'tao_in')
+                self._key_fields[alpha_key.to_hex()] = (netuid, 'alpha_in')
+        return [key for netuid in netuids for key in self._storage_keys[netuid]]
+
+    async def _query_reserves(self, substrate, netuids, block_hash):
+        if not netuids:
+            return []
+        storage_keys = await self._storage_keys_for(substrate, netuids, block_hash)
+        return await substrate.query_multi(storage_keys, block_hash=block_hash)
+
+    async def read(self, sub, block_hash=None):
+        # Reserves for already-known netuids are fetched alongside the price call.
+        known_netuids = sorted(self._storage_keys)
+        prices_by_netuid, pairs = await asyncio.gather(
+            sub.get_subnet_prices(block_hash=block_hash),
+            self._query_reserves(sub.substrate, known_netuids, block_hash),
+        )
+        prices_by_netuid = {
+            netuid: float(price)
+            for netuid, price in prices_by_netuid.items()
+            if float(price) > 0
+        }
+        netuids = sorted(prices_by_netuid)
+        new_netuids = [netuid for netuid in netuids if netuid not in self._storage_keys]
+        if new_netuids:
+            pairs = list(pairs) + list(await self._query_reserves(sub.substrate, new_netuids, block_hash))
+        if self._metadata_stale(netuids):
+            await self.refresh_metadata(sub, block_hash)
+
+        reserves = {netuid: {'tao_in': 0.0, 'alpha_in': 0.0} for netuid in netuids}
+        for storage_key, value in pairs:
+            netuid, field = self._key_fields[storage_key.to_hex()]
+            if netuid not in reserves:
+                continue
+            raw = getattr(value, 'value', value)
+            reserves[netuid][field] = float(raw or 0) / RAO_PER_TAO
+
+        return PoolSnapshot(
+            block_hash=block_hash,
+            netuids=netuids,
+            prices=[prices_by_netuid[netuid] for netuid in netuids],
+            tao_in=[reserves[netuid]['tao_in'] for netuid in netuids],
+            alpha_in=[reserves[netuid]['alpha_in'] for netuid in netuids],
+            names=self.names,
+        )
+
+    async def read_subnets(self, sub, netuids, block_hash=None):
+        """Price and reserves for just these netuids: {netuid: {'price', 'tao_in', 'alpha_in'}}."""
+        netuids = sorted(netuids)
+        prices, pairs = await asyncio.gather(
+            asyncio.gather(*(sub.get_subnet_price(netuid=netuid, block_hash=block_hash) for netuid in netuids)),
+            self._query_reserves(sub.substrate, netuids, block_hash),
+        )
+        pools = {
+            netuid: {'price': float(price), 'tao_in': 0.0, 'alpha_in': 0.0}
+            for netuid, price in zip(netuids, prices)
+        }
+        for storage_key, value in pairs:
+            netuid, field = self._key_fields[storage_key.to_hex()]
+            raw = getattr(value, 'value', value)
+            pools[netuid][field] = float(raw or 0) / RAO_PER_TAO
+        return pools
+
+
+class PoolWatcher:
+    """Tracks pool reserves through a storage subscription instead of re-reading them.
+
+    subscribe_storage pushes SubnetTAO/SubnetAlphaIn changes as they happen;
+    apply() then re-prices only the subnets whose reserves moved and returns
+    an updated stats dict plus the set of changed netuids. A full read via
+    the PoolStateReader re-seeds the watcher every resync_blocks blocks.
+    Listeners are plain callables invoked with the netuid of every change;
+    they must not block.
+    """
+
+    def __init__(self, reader, resync_blocks=100):
+        self.reader = reader
+        self.resync_blocks = resync_blocks
+        self.reserves = {}
+        self.pending = set()
+        self.updates = 0
+        self.seeded_at_block = None
+        self.listeners = []
+        self.netuids = []
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def needs_resync(self, block_number):
+        if self.seeded_at_block is None or block_number is None:
+            return True
+        return block_number - self.seeded_at_block >= self.resync_blocks
+
+    def seed(self, snapshot, block_number=None):
+        self.reserves = {
+            netuid: {'tao_in': snapshot.tao_in[i], 'alpha_in': snapshot.alpha_in[i]}
+            for i, netuid in enumerate(snapshot.netuids)
+        }
+        self.pending = set()
+        self.seeded_at_block = block_number
+
+    async def _on_change(self, storage_key, value, subscription_id):
+        field_info = self.reader._key_fields.get(storage_key.to_hex())
+        if field_info is None:
+            return None
+        netuid, field = field_info
+        amount = float(getattr(value, 'value', value) or 0) / RAO_PER_TAO
+        reserves = self.reserves.setdefault(netuid, {'tao_in': 0.0, 'alpha_in': 0.0})
+        if reserves[field] != amount:
+            reserves[field] = amount
+            self.pending.add(netuid)
+            self.updates += 1
+            for listener in self.listeners:
+                listener(netuid)
+        return None
+
+    async def _watch_forever(self, connection, netuids):
+        while True:
+            sub = None
+            try:
+                sub = await connection.ensure_healthy()
+                storage_keys = await self.reader._storage_keys_for(sub.substrate, netuids, None)
+                await sub.substrate.subscribe_storage(storage_keys, self._on_change)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f'Pool storage subscription dropped: {type(e).__name__} {e}')
+                connection.mark_unhealthy(f'pool subscription dropped: {e}', sub=sub)
+                # Updates may have been missed while disconnected.
+                self.seeded_at_block = None
+                await asyncio.sleep(1)
+
+    def start(self, connection, netuids):
+        """Subscribe to the reserves of netuids, resubscribing if the watched set changed."""
+        netuids = sorted(netuids)
+        if self.running:
+            if netuids == self.netuids:
+                return
+            # A subscription only covers the keys it was opened with; replace it.
+            self._task.cancel()
+        self.netuids = netuids
+        self._task = asyncio.create_task(self._watch_forever(connection, netuids))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    async def apply(self, sub, stats, block_hash=None):
+        """Return (stats, changed_netuids) with only the changed subnets re-priced."""
+        changed = sorted(netuid for netuid in self.pending if netuid in stats)
+        self.pending = set()
+        if not changed:
+            return stats, set()
+        prices = await asyncio.gather(*(
+            sub.get_subnet_price(netuid=netuid, block_hash=block_hash)
+            for netuid in changed
+        ))
+        updated = dict(stats)
+        for netuid, price in zip(changed, prices):
+            updated[netuid] = dict(
+                stats[netuid],
+                price=float(price),
+                tao_in=self.reserves[netuid]['tao_in'],
+                alpha_in=self.reserves[netuid]['alpha_in'],
+            )
+        return updated, set(changed)
+
+
+def simulate_stake(tao_amount, tao_in, alpha_in, fee_rate=DEFAULT_SWAP_FEE_RATE):
+    """TAO -> alpha through a constant-product pool. Works elementwise on numpy arrays.
+
+    Returns (alpha_out, fee_tao, price_impact), price_impact being the fraction
+    of the spot-price output lost to the curve (fees excluded).
+    """
+    tao_amount = np.asarray(tao_amount, dtype=float)
+    fee_tao = tao_amount * fee_rate
+    net_tao = tao_amount - fee_tao
+    alpha_out = alpha_in * net_tao / (tao_in + net_tao)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spot_out = net_tao * alpha_in / tao_in
+        price_impact = np.where(spot_out > 0, 1.0 - alpha_out / spot_out, 0.0)
+    return alpha_out, fee_tao, price_impact
+
+
+def simulate_unstake(alpha_amount, tao_in, alpha_in, fee_rate=DEFAULT_SWAP_FEE_RATE):
+    """Alpha -> TAO through a constant-product pool. Works elementwise on numpy arrays.
+
+    Returns (tao_out, fee_alpha, price_impact).
+    """
+    alpha_amount = np.asarray(alpha_amount, dtype=float)
+    fee_alpha = alpha_amount * fee_rate
+    net_alpha = alpha_amount - fee_alpha
+    tao_out = tao_in * net_alpha / (alpha_in + net_alpha)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spot_out = net_alpha * tao_in / alpha_in
+        price_impact = np.where(spot_out > 0, 1.0 - tao_out / spot_out, 0.0)
+    return tao_out, fee_alpha, price_impact
+
+
+class LocalPoolSimulator:
+    """Constant-product model of every subnet pool, seeded from the bot's stats.
+
+    Used to estimate stake, unstake and swap_stake outcomes for many
+    candidates at once without an RPC; chain sim_swap is still the source of
+    truth for anything that is actually executed.
+    """
+
+    def __init__(self, stats, fee_rate=DEFAULT_SWAP_FEE_RATE):
+        self.fee_rate = fee_rate
+        self.netuids = [
+            netuid for netuid, entry in sorted(stats.items())
+            if entry.get('tao_in', 0) > 0 and entry.get('alpha_in', 0) > 0
+        ]
+        self._index = {netuid: i for i, netuid in enumerate(self.netuids)}
+        self.tao_in = np.array([stats[netuid]['tao_in'] for netuid in self.netuids], dtype=float)
+        self.alpha_in = np.array([stats[netuid]['alpha_in'] for netuid in self.netuids], dtype=float)
+        self.prices = np.array([stats[netuid]['price'] for netuid in self.netuids], dtype=float)
+
+    def __contains__(self, netuid):
+        return netuid in self._index
+
+    def indices(self, netuids):
+        return np.array([self._index[netuid] for netuid in netuids], dtype=int)
+
+    def stake(self, netuids, tao_amounts):
+        idx = self.indices(netuids)
+        return simulate_stake(tao_amounts, self.tao_in[idx], self.alpha_in[idx], self.fee_rate)
+
+    def unstake(self, netuids, alpha_amounts):
+        idx = self.indices(netuids)
+        return simulate_unstake(alpha_amounts, self.tao_in[idx], self.alpha_in[idx], self.fee_rate)
+
+    def swap(self, origin_netuids, destination_netuids, alpha_amounts):
+        """Vectorized swap_stake estimate for parallel lists of (origin, destination, alpha amount).
+
+        Returns a dict of arrays: destination_alpha, tao_out (TAO leaving the
+        origin pool), fee_tao (both legs, in TAO), value_tao (destination alpha
+        at spot) and value_loss_pct (1 - value_tao / origin alpha at spot).
+        """
+        origin = self.indices(origin_netuids)
+        destination = self.indices(destination_netuids)
+        alpha_amounts = np.asarray(alpha_amounts, dtype=float)
+        tao_out, fee_alpha, _ = simulate_unstake(alpha_amounts, self.tao_in[origin], self.alpha_in[origin], self.fee_rate)
+        destination_alpha, stake_fee_tao, _ = simulate_stake(tao_out, self.tao_in[destination], self.alpha_in[destination], self.fee_rate)
+        origin_value = alpha_amounts * self.prices[origin]
+        value_tao = destination_alpha * self.prices[destination]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value_loss_pct = np.where(origin_value > 0, 1.0 - value_tao / origin_value, 1.0)
+        return {
+            'destination_alpha': destination_alpha,
+            'tao_out': tao_out,
+            'fee_tao': fee_alpha * self.prices[origin] + stake_fee_tao,
+            'value_tao': value_tao,
+            'value_loss_pct': value_loss_pct,
+        }
+
+    def swap_matrix(self, alpha_amounts):
+        """All-pairs swap estimate: row i swaps alpha_amounts[i] out of netuids[i] into every pool.
+
+        Returns an (n, n) array of destination alpha (diagonal is NaN).
+        """
+        alpha_amounts = np.asarray(alpha_amounts, dtype=float)
+        tao_out, _, _ = simulate_unstake(alpha_amounts, self.tao_in, self.alpha_in, self.fee_rate)
+        destination_alpha, _, _ = simulate_stake(tao_out[:, None], self.tao_in[None, :], self.alpha_in[None, :], self.fee_rate)
+        np.fill_diagonal(destination_alpha, np.nan)
+        return destination_alpha
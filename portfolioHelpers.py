@@ -0,0 +1,102 @@
+"""Portfolio helpers: a per-tick snapshot of our stake with precomputed aggregates."""
+
+
+class PortfolioSnapshot:
+    """Immutable view of our stake, built once per tick.
+
+    Holds alpha per (hotkey, netuid), the dust-filtered alpha and TAO value per
+    subnet and the total staked value, so the sizing helpers answer in O(1)
+    instead of rescanning every hotkey. Stake held on a hotkey other than the
+    subnet's configured validator is left out of the aggregates when its TAO
+    value is at or below the legacy dust threshold, matching the bot's
+    existing rules. with_fill() and with_price() return a new snapshot adjusted
+    for one fill or one re-quoted pool.
+
+    The snapshot is stamped with the bot's state version it was built at (or
+    carried over to by with_fill()/with_price()); the bot bumps that version
+    whenever the stake, stats or grids it was built from change, and matches()
+    tells it whether the snapshot is still current.
+    """
+
+    __slots__ = (
+        'version', 'default_validator', 'dust_threshold_tao', 'validators',
+        'prices', 'alpha_by_hotkey', 'alpha', 'value', 'total_value',
+    )
+
+    def __init__(self, version, default_validator, dust_threshold_tao, validators, prices, alpha_by_hotkey):
+        self.version = version
+        self.default_validator = default_validator
+        self.dust_threshold_tao = dust_threshold_tao
+        self.validators = validators
+        self.prices = prices
+        self.alpha_by_hotkey = alpha_by_hotkey
+        self.alpha = {}
+        self.value = {}
+        for (hotkey, netuid), stake in alpha_by_hotkey.items():
+            if self.is_dust(hotkey, netuid, stake):
+                continue
+            self.alpha[netuid] = self.alpha.get(netuid, 0.0) + stake
+        for netuid, stake in self.alpha.items():
+            if netuid in prices:
+                self.value[netuid] = stake * prices[netuid]
+        self.total_value = sum(self.value.values())
+
+    @classmethod
+    def build(cls, stake_info, stats, subnet_grids, default_validator, dust_threshold_tao, version=0):
+        """Build a snapshot at state `version` from the hotkey -> netuid -> StakeInfo map and pool stats."""
+        alpha_by_hotkey = {}
+        for hotkey, subnet_stakes in stake_info.items():
+            for netuid, stake_obj in subnet_stakes.items():
+                if stake_obj is None:
+                    continue
+                alpha_by_hotkey[(hotkey, netuid)] = float(stake_obj.stake)
+        validators = {
+            netuid: config.get('stake_on_validator', default_validator)
+            for netuid, config in subnet_grids.items()
+        }
+        prices = {netuid: float(entry['price']) for netuid, entry in stats.items()}
+        return cls(
+            version,
+            default_validator, dust_threshold_tao, validators, prices, alpha_by_hotkey,
+        )
+
+    def matches(self, version, default_validator, dust_threshold_tao):
+        """True when the snapshot is at this state version and was built with these settings."""
+        return (
+            self.version == version
+            and self.default_validator == default_validator
+            and self.dust_threshold_tao == dust_threshold_tao
+        )
+
+    def validator_for(self, netuid):
+        return self.validators.get(netuid, self.default_validator)
+
+    def is_dust(self, hotkey, netuid, stake):
+        """True if stake on a non-configured hotkey is worth no more than the dust threshold."""
+        if hotkey == self.validator_for(netuid) or netuid not in self.prices:
+            return False
+        return max(0.0, stake) * self.prices[netuid] <= self.dust_threshold_tao
+
+    def current_stake(self, netuid):
+        return self.alpha.get(netuid, 0.0)
+
+    def subnet_value(self, netuid):
+        return self.value.get(netuid, 0.0)
+
+    def with_fill(self, hotkey, netuid, alpha_delta, version=None):
+        """Return a new snapshot with alpha_delta applied to (hotkey, netuid), at `version` if given."""
+        alpha_by_hotkey = dict(self.alpha_by_hotkey)
+        alpha_by_hotkey[(hotkey, netuid)] = max(0.0, alpha_by_hotkey.get((hotkey, netuid), 0.0) + alpha_delta)
+        return PortfolioSnapshot(
+            self.version if version is None else version, self.default_validator, self.dust_threshold_tao,
+            self.validators, self.prices, alpha_by_hotkey,
+        )
+
+    def with_price(self, netuid, price, version=None):
+        """Return a new snapshot valuing netuid at a freshly quoted price, at `version` if given."""
+        prices = dict(self.prices)
+        prices[netuid] = float(price)
+        return PortfolioSnapshot(
+            self.version if version is None else version, self.default_validator, self.dust_threshold_tao,
+            self.validators, prices, self.alpha_by_hotkey,
+        )
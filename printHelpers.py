@@ -118,8 +118,7 @@ def print_table_rich(
 
         # Get previous average delta; if none, use the current delta.
 
-        buy_threshold = botInstance.get_subnet_buy_threshold(netuid)
-        sell_threshold = botInstance.get_subnet_sell_threshold(netuid)
+        buy_threshold, sell_threshold = botInstance.get_planned_thresholds(netuid)
 
         if stake_amt == 0 and buy_threshold is None:
             continue
@@ -2,7 +2,7 @@ import unittest
 import bagbot
 import math
 import os
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 
 
@@ -35,6 +35,9 @@ class TestBAGBot(unittest.TestCase):
         bagbot.bagbot_settings.ENABLE_POSITION_ROTATION = False
         bagbot.bagbot_settings.ENABLE_ATOMIC_ROTATION = True
         bagbot.bagbot_settings.ENABLE_MEV_PROTECTION = False
+        bagbot.bagbot_settings.ENABLE_TRADE_TRIGGERS = False
+        bagbot.bagbot_settings.ENABLE_PRESIGNED_EXTRINSICS = False
+        bagbot.bagbot_settings.ROTATION_SIM_TOP_K = 3
         bagbot.bagbot_settings.ROTATION_REQUIRE_CONSTRAINTS = False
         bagbot.bagbot_settings.ROTATION_TARGET_DISCOUNT_PCT = 0.02
         bagbot.bagbot_settings.ROTATION_SOURCE_WEAKNESS_PCT = 0.02
@@ -463,6 +466,84 @@ class TestBAGBot(unittest.TestCase):
         self.assertEqual(rotationTrade['destination_netuid'], 90)
         self.assertIn('rotation_to_sn90', rotationTrade['rotation_reason'])
 
+    def testRotationSimulatesPairsConcurrentlyAndCachesPerBlock(self):
+        args = {}
+        bagbot.bagbot_settings.ENABLE_POSITION_ROTATION = True
+        bagbot.bagbot_settings.ENABLE_ATOMIC_ROTATION = True
+        bagbot.bagbot_settings.MAX_PORTFOLIO_TAO = None
+        bagbot.bagbot_settings.MAX_TAO_PER_BUY = 0.05
+        bagbot.bagbot_settings.MAX_TAO_PER_SELL = 1.0
+
+        bu = bagbot.BittensorUtility(args)
+        bu.balance = 1.0
+        bu.stats = {
+            90: {'price': 0.009, 'tao_in': 10000, 'alpha_in': 10000},
+            91: {'price': 0.010, 'tao_in': 10000, 'alpha_in': 10000},
+            92: {'price': 0.010, 'tao_in': 10000, 'alpha_in': 10000},
+            93: {'price': 0.009, 'tao_in': 10000, 'alpha_in': 10000},
+        }
+        bu.current_stake_info = {
+            bagbot.bagbot_settings.STAKE_ON_VALIDATOR: {
+                91: MockStake(100),
+                92: MockStake(100),
+            }
+        }
+        target_grid = {'buy_lower': 0.0105, 'buy_upper': 0.011, 'sell_lower': 0.013, 'sell_upper': 0.014, 'max_alpha': 1000}
+        source_grid = {'buy_lower': 0.008, 'buy_upper': 0.009, 'sell_lower': 0.012, 'sell_upper': 0.013, 'max_alpha': 1000}
+        bu.subnet_grids = {90: dict(target_grid), 91: dict(source_grid), 92: dict(source_grid), 93: dict(target_grid)}
+        bu.current_block = {'block': 100, 'block_hash': '0xabc', 'blocks_spanned': 1, 'head_age_seconds': 0.0}
+        bu.sub = ConcurrentSimSub(MockSimSwapResult(dest_netuid=90))
+        bagbot.bagbot_settings.ROTATION_SIM_TOP_K = 0
+
+        async def construct_twice():
+            first = await bu.constructRotationTrade()
+            bu.rotation_quotes = {}
+            second = await bu.constructRotationTrade()
+            return first, second
+
+        first, second = bagbot.asyncio.run(construct_twice())
+
+        self.assertEqual(len(bu.sub.calls), 4)
+        self.assertEqual(bu.sub.max_in_flight, 4)
+        self.assertEqual(bu.sub.block_hashes, {'0xabc'})
+        self.assertEqual(first['destination_netuid'], second['destination_netuid'])
+        self.assertEqual(first['origin_netuid'], second['origin_netuid'])
+
+    def testRotationPrescreenSendsOnlyTopLocalCandidatesToChain(self):
+        args = {}
+        bagbot.bagbot_settings.ENABLE_POSITION_ROTATION = True
+        bagbot.bagbot_settings.ENABLE_ATOMIC_ROTATION = True
+        bagbot.bagbot_settings.MAX_PORTFOLIO_TAO = None
+        bagbot.bagbot_settings.MAX_TAO_PER_BUY = 0.05
+        bagbot.bagbot_settings.MAX_TAO_PER_SELL = 1.0
+        bagbot.bagbot_settings.ROTATION_SIM_TOP_K = 1
+
+        bu = bagbot.BittensorUtility(args)
+        bu.balance = 1.0
+        bu.stats = {
+            90: {'price': 0.009, 'tao_in': 10000, 'alpha_in': 1111111},
+            91: {'price': 0.010, 'tao_in': 10000, 'alpha_in': 1000000},
+            92: {'price': 0.010, 'tao_in': 10, 'alpha_in': 1000},
+        }
+        bu.current_stake_info = {
+            bagbot.bagbot_settings.STAKE_ON_VALIDATOR: {
+                91: MockStake(100),
+                92: MockStake(100),
+            }
+        }
+        source_grid = {'buy_lower': 0.008, 'buy_upper': 0.009, 'sell_lower': 0.012, 'sell_upper': 0.013, 'max_alpha': 1000}
+        bu.subnet_grids = {
+            90: {'buy_lower': 0.0105, 'buy_upper': 0.011, 'sell_lower': 0.013, 'sell_upper': 0.014, 'max_alpha': 1000},
+            91: dict(source_grid),
+            92: dict(source_grid),
+        }
+        bu.sub = StubSub(MockSimSwapResult(dest_netuid=90))
+
+        rotationTrade = bagbot.asyncio.run(bu.constructRotationTrade())
+
+        self.assertEqual([call[:2] for call in bu.sub.calls], [(91, 90)])
+        self.assertEqual(rotationTrade['origin_netuid'], 91)
+
     def testRotationTradeBlockedWhenFeesKillNetEdge(self):
         args = {}
         bagbot.bagbot_settings.ENABLE_POSITION_ROTATION = True
@@ -703,6 +784,208 @@ class TestBAGBot(unittest.TestCase):
 
         self.assertTrue(math.isclose(bu.my_current_stake(71), 10.0, rel_tol=1e-6))
 
+    def testBuyFillUpdatesPortfolioAggregatesBeforeNextRefresh(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        configured = bagbot.bagbot_settings.STAKE_ON_VALIDATOR
+        bagbot.bagbot_settings.MAX_PORTFOLIO_TAO = 10.0
+        bu.sub = CaptureAddStakeSub()
+        bu.wallet = object()
+        bu.balance = 1.0
+        bu.stats = {90: {'price': 0.01}}
+        bu.current_stake_info = {configured: {90: MockStake(100.0)}}
+        stake_info = bu.current_stake_info
+
+        self.assertTrue(math.isclose(bu._available_remaining_budget(), 9.0))
+        buyTrade = {
+            'hotkey': configured,
+            'netuid': 90,
+            'tao_amount': bagbot.bt.utils.balance.tao(0.5),
+            'max_slippage': 0.005,
+        }
+        self.assertTrue(bagbot.asyncio.run(bu.execute_buy_trade(buyTrade)))
+
+        self.assertIs(bu.current_stake_info, stake_info)
+        self.assertTrue(math.isclose(bu.my_current_stake(90), 150.0))
+        self.assertTrue(math.isclose(bu.my_subnet_staked_value(90), 1.5))
+        self.assertTrue(math.isclose(bu._available_remaining_budget(), 8.5))
+
+    def testUnwaitedBuyIsReconciledOnceItsExtrinsicIsFoundOnChain(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        bu.sub = UnwaitedStakeSub(head=101, included_in=101, extrinsic_hash=b'\xbb')
+        bu.wallet = object()
+        bu.balance = 1.0
+        bu.stats = {90: {'price': 0.01}}
+        bu.current_stake_info = {'somehotkey': {}}
+        bu.current_block = {'block': 100, 'block_hash': '0x64'}
+        engine = ReconcilingStrategyEngine()
+        buyTrade = {
+            'hotkey': 'somehotkey',
+            'netuid': 90,
+            'tao_amount': bagbot.bt.utils.balance.tao(0.5),
+            'max_slippage': 0.005,
+        }
+
+        async def scenario():
+            executed = await bu.execute_buy_trade(buyTrade)
+            await bu.fill_reconciler.drain()
+            return executed
+
+        with patch.object(bagbot, '_strategy_engine', engine):
+            self.assertTrue(bagbot.asyncio.run(scenario()))
+
+        self.assertFalse(bu.sub.calls[0]['wait_for_inclusion'])
+        self.assertEqual(engine.fills, [('buy', 90, 50.0)])
+        self.assertEqual(len(engine.reconciled), 1)
+        fill_id, realized = engine.reconciled[0]
+        self.assertEqual(fill_id, 1)
+        self.assertEqual((realized['tx_hash'], realized['block_number']), ('0xbb', 101))
+        self.assertTrue(math.isclose(realized['alpha_amount'], 48.0))
+        self.assertTrue(math.isclose(realized['tao_amount'], 0.5))
+
+    def testShieldedFillIsReconciledFromTheRevealedExtrinsic(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        bu.fill_reconciler = MagicMock()
+        response = bagbot.SimpleNamespace(extrinsic_receipt='wrapper-receipt', mev_extrinsic='revealed-receipt')
+        fills = [{'fill_id': 3, 'netuid': 90, 'side': 'buy'}]
+
+        bu._reconcile_fills(response, fills)
+
+        bu.fill_reconciler.submit.assert_called_once_with('revealed-receipt', fills)
+
+    def testPortfolioSnapshotIsCarriedByQuotesAndFillsAndRebuiltOnStateChange(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        configured = bagbot.bagbot_settings.STAKE_ON_VALIDATOR
+        bu.stats = {90: {'price': 0.01}, 91: {'price': 0.02}}
+        bu.current_stake_info = {configured: {90: MockStake(100.0)}}
+
+        with patch.object(bagbot.portfolioHelpers.PortfolioSnapshot, 'build', wraps=bagbot.portfolioHelpers.PortfolioSnapshot.build) as build:
+            self.assertTrue(math.isclose(bu.my_subnet_staked_value(90), 1.0))
+            bu._apply_quote(90, dict(bu.stats[90], price=0.02))
+            repriced = bu.my_subnet_staked_value(90)
+            bu._record_portfolio_fill(configured, 90, 50.0)
+            filled = bu.my_current_stake(90)
+            builds_before_refresh = build.call_count
+            bu.current_stake_info = {configured: {90: MockStake(120.0)}}
+            bu._state_changed()
+            refreshed = bu.my_current_stake(90)
+
+        self.assertTrue(math.isclose(repriced, 2.0))
+        self.assertTrue(math.isclose(filled, 150.0))
+        self.assertEqual(builds_before_refresh, 1)
+        self.assertTrue(math.isclose(refreshed, 120.0))
+        self.assertEqual(build.call_count, 2)
+        self.assertEqual(bu.portfolio.version, bu.state_version)
+
+    def testTradePlanKeepsUntouchedLegsAcrossAQuoteAndRestartsOnStateChange(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        bu.stats = {90: {'price': 0.01}, 91: {'price': 0.02}}
+        plan = bu._trade_plan()
+        plan.leg(91, 'sell', (False, None, None), lambda: 'sell91')
+        plan.leg(90, 'sell', (False, None, None), lambda: 'sell90')
+
+        bu._apply_quote(90, dict(bu.stats[90], price=0.011))
+        carried = bu._trade_plan()
+        kept = sorted(key[0] for key in carried.legs)
+        bu._state_changed()
+
+        self.assertIs(carried, plan)
+        self.assertEqual(kept, [91])
+        self.assertEqual(carried.version, bu.state_version - 1)
+        self.assertIsNot(bu._trade_plan(), plan)
+
+    def testTradePlanSharesBuyLegBetweenPreviewAndExecution(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        bu.balance = 1.0
+        bu.sub = CaptureAddStakeSub()
+        bu.wallet = object()
+        bu.stats = {90: {'price': 0.01, 'tao_in': 10000}}
+        bu.subnet_grids = {90: {'buy_upper': 0.02, 'sell_lower': 0.03, 'max_alpha': 3000}}
+
+        with patch.object(bu, '_plan_buy', wraps=bu._plan_buy) as plan_buy:
+            self.assertTrue(bu._has_spendable_buy_opportunity())
+            result = bagbot.asyncio.run(bu.do_available_trades(90))
+            self.assertEqual(plan_buy.call_count, 1)
+            bu.constructBuy(90, preview_only=True)
+
+        self.assertTrue(result['buy_executed'])
+        self.assertEqual(len(bu.sub.calls), 1)
+        self.assertEqual(plan_buy.call_count, 2)
+        self.assertEqual(bu.get_planned_thresholds(90), (0.02, 0.03))
+
+    def testTradeBatchBooksEachOutcomeAndFallsBackWhenRejected(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        configured = bagbot.bagbot_settings.STAKE_ON_VALIDATOR
+        bu.wallet = object()
+        bu.balance = 1.0
+        bu.stats = {90: {'price': 0.01}, 91: {'price': 0.02}}
+        bu.current_stake_info = {configured: {91: MockStake(100.0)}}
+        buyTrade = {'hotkey': configured, 'netuid': 90, 'tao_amount': bagbot.bt.utils.balance.tao(0.5), 'max_slippage': 0.005}
+        sellTrade = {
+            'hotkey': configured, 'netuid': 91, 'alpha_amount': bagbot.bt.utils.balance.tao(10.0, 91),
+            'max_slippage': 0.005, 'sell_threshold': 0.015, 'approx_tao': 0.2,
+        }
+        bu.sub = BatchStakeSub(success=True, outcomes=['ItemCompleted', 'ItemFailed'])
+
+        results = bagbot.asyncio.run(bu.execute_trade_batch([buyTrade, sellTrade]))
+
+        self.assertEqual([ok for _, ok in results], [True, False])
+        self.assertEqual(bu.sub.submitted, 1)
+        self.assertEqual([call['call_function'] for call in bu.sub.composed], ['add_stake_limit', 'remove_stake_limit', 'force_batch'])
+        self.assertEqual(bu.sub.composed[1]['call_params']['limit_price'], int(0.02 * (1 - 0.005) * 1e9))
+        self.assertTrue(math.isclose(bu.my_current_stake(90), 50.0))
+        self.assertTrue(math.isclose(bu.my_current_stake(91), 100.0))
+
+        bu.sub = BatchStakeSub(success=False, outcomes=[])
+        with patch.object(bu, 'execute_buy_trade', new=AsyncMock(return_value=True)) as single_buy, \
+             patch.object(bu, 'execute_sell_trade', new=AsyncMock(return_value=True)) as single_sell:
+            results = bagbot.asyncio.run(bu.execute_trade_batch([buyTrade, sellTrade]))
+
+        self.assertEqual([ok for _, ok in results], [True, True])
+        single_buy.assert_awaited_once_with(buyTrade)
+        single_sell.assert_awaited_once_with(sellTrade)
+
+    def testPipelinedTradesHoldSubnetsUntilTheyLandThenBookFills(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        configured = bagbot.bagbot_settings.STAKE_ON_VALIDATOR
+        bu.wallet = bagbot.SimpleNamespace(coldkeypub=bagbot.SimpleNamespace(ss58_address='coldkey'))
+        bu.balance = 1.0
+        bu.stats = {90: {'price': 0.01}, 91: {'price': 0.02}}
+        bu.current_stake_info = {configured: {91: MockStake(100.0)}}
+        buyTrade = {'hotkey': configured, 'netuid': 90, 'tao_amount': bagbot.bt.utils.balance.tao(0.5), 'max_slippage': 0.005}
+        sellTrade = {
+            'hotkey': configured, 'netuid': 91, 'alpha_amount': bagbot.bt.utils.balance.tao(10.0, 91),
+            'max_slippage': 0.005, 'sell_threshold': 0.015, 'approx_tao': 0.2,
+        }
+        bu.sub = PipelinedStakeSub(next_index=7)
+
+        async def scenario():
+            submitted = await bu.submit_trades_pipelined([buyTrade, sellTrade])
+            in_flight = (set(bu.inflight_subnets), bu._available_spendable_balance(), bu.collect_tick_trades())
+            resubmitted = await bu.submit_trades_pipelined([buyTrade])
+            bu.sub.release.set()
+            await bu.submission_pipeline.drain()
+            return submitted, in_flight, resubmitted
+
+        submitted, in_flight, resubmitted = bagbot.asyncio.run(scenario())
+
+        self.assertEqual(submitted, [buyTrade, sellTrade])
+        self.assertEqual(in_flight, ({90, 91}, 0.5, []))
+        self.assertEqual(resubmitted, [])
+        self.assertEqual(bu.sub.sent_nonces, [7, 8])
+        self.assertEqual([call['call_function'] for call in bu.sub.composed], ['add_stake_limit', 'remove_stake_limit'])
+        self.assertEqual(bu.inflight_subnets, set())
+        self.assertEqual(bu.inflight_buy_tao, 0.0)
+        self.assertTrue(math.isclose(bu.my_current_stake(90), 50.0))
+        self.assertTrue(math.isclose(bu.my_current_stake(91), 90.0))
+
     def testDetermineHotKeySilentlyIgnoresDustOnlyAlternateStake(self):
         args = {}
         bu = bagbot.BittensorUtility(args)
@@ -876,7 +1159,7 @@ class TestBAGBot(unittest.TestCase):
         self.assertTrue(result)
         mock_construct_sell.assert_called_once()
         mock_execute_sell.assert_awaited_once()
-        mock_refresh_state.assert_awaited_once()
+        mock_refresh_state.assert_awaited_once_with(netuids=[38, 62])
         mock_construct_buy.assert_called_once_with(62)
         mock_execute_buy.assert_awaited_once_with(buyTrade)
 
@@ -926,9 +1209,10 @@ class TestBAGBot(unittest.TestCase):
         }
         bu.static_subnet_grids = dict(bu.subnet_grids)
         bu.sub = CloseOnlySub()
+        bu.scheduler = StubScheduler([100], StopRun)
         call_order = []
 
-        async def fake_do_available_trades(netuid):
+        async def fake_do_available_trades(netuid, allocation=None):
             call_order.append(('spot', netuid))
             raise StopRun()
 
@@ -938,7 +1222,6 @@ class TestBAGBot(unittest.TestCase):
 
         with patch.object(bu, 'setup', new=AsyncMock()), \
              patch.object(bu, 'refresh_subnet_grid', new=AsyncMock()), \
-             patch.object(bu, 'discover_all_validators_with_stake', new=AsyncMock(return_value=None)), \
              patch.object(bu, 'refresh_stats', new=AsyncMock()), \
              patch.object(bu, 'do_available_trades', side_effect=fake_do_available_trades), \
              patch.object(bu, 'constructRotationTrade', side_effect=fake_construct_rotation_trade), \
@@ -949,16 +1232,16 @@ class TestBAGBot(unittest.TestCase):
 
         self.assertEqual(call_order, [('spot', 90)])
 
-    def testRunStopsScanningAfterFirstSuccessfulBuy(self):
+    def testRunDeploysCashAcrossSubnetsInOneTick(self):
         class StopRun(Exception):
             pass
 
         args = bagbot.SimpleNamespace(nocheck=True)
         bu = bagbot.BittensorUtility(args)
-        bu.balance = 1.0
+        bu.balance = 0.035
         bu.stats = {
             90: {'price': 0.01, 'tao_in': 10000, 'alpha_in': 10000},
-            91: {'price': 0.01, 'tao_in': 10000, 'alpha_in': 10000},
+            91: {'price': 0.005, 'tao_in': 10000, 'alpha_in': 10000},
         }
         bu.current_stake_info = {'somehotkey': {}}
         bu.subnet_grids = {
@@ -966,16 +1249,16 @@ class TestBAGBot(unittest.TestCase):
             91: {'buy_upper': 0.02, 'sell_lower': 0.03, 'max_alpha': 3000},
         }
         bu.static_subnet_grids = dict(bu.subnet_grids)
-        bu.sub = WaitStopSub(StopRun)
+        bu.sub = CloseOnlySub()
+        bu.scheduler = StubScheduler([100], StopRun)
         call_order = []
 
-        async def fake_do_available_trades(netuid):
-            call_order.append(netuid)
-            return {'buy_executed': netuid == 90, 'sell_executed': False}
+        async def fake_do_available_trades(netuid, allocation=None):
+            call_order.append((netuid, round(float(allocation[netuid]['tao_amount']), 6)))
+            return {'buy_executed': True, 'sell_executed': False}
 
         with patch.object(bu, 'setup', new=AsyncMock()), \
              patch.object(bu, 'refresh_subnet_grid', new=AsyncMock()), \
-             patch.object(bu, 'discover_all_validators_with_stake', new=AsyncMock(return_value=None)), \
              patch.object(bu, 'refresh_stats', new=AsyncMock()), \
              patch.object(bu, 'do_available_trades', side_effect=fake_do_available_trades), \
              patch.object(bu, 'constructRotationTrade', new=AsyncMock(return_value=None)), \
@@ -984,7 +1267,9 @@ class TestBAGBot(unittest.TestCase):
             with self.assertRaises(StopRun):
                 bagbot.asyncio.run(bu.run())
 
-        self.assertEqual(call_order, [90])
+        self.assertEqual(call_order, [(91, 0.02), (90, 0.015)])
+        self.assertEqual(bu.current_block['block'], 100)
+        self.assertEqual(len(bu.scheduler.finished), 1)
 
     def testRefreshSubnetGridHotReloadsUpdatedAllowlist(self):
         args = {}
@@ -1055,6 +1340,244 @@ class TestBAGBot(unittest.TestCase):
 
         self.assertEqual(sorted(bu.subnet_grids.keys()), [11])
 
+    def testRefreshStatsBuildsStakeInfoFromColdkeySnapshot(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        bu.wallet = MockWallet('my-coldkey')
+        bu.sub = PortfolioSnapshotSub(
+            stake_infos=[
+                MockStakeInfo('somehotkey', 90, 100.0),
+                MockStakeInfo('other-validator', 91, 5.0),
+            ],
+            balance=1.5,
+            subnets=[
+                MockDynamicInfo(90, 0.01, 10000.0, 1000000.0, 'ninety'),
+                MockDynamicInfo(91, 0.02, 20000.0, 1000000.0, 'ninety-one'),
+            ],
+        )
+
+        bagbot.asyncio.run(bu.refresh_stats())
+
+        self.assertEqual(bu.sub.stake_calls, ['my-coldkey'])
+        self.assertEqual(bu.sub.balance_calls, ['my-coldkey'])
+        self.assertEqual(bu.balance, 1.5)
+        self.assertEqual(sorted(bu.stats.keys()), [90, 91])
+        self.assertEqual(bu.stats[90]['name'], 'ninety')
+        self.assertTrue(math.isclose(bu.my_current_stake(90), 100.0))
+        self.assertIn(91, bu.current_stake_info['other-validator'])
+        self.assertEqual(bu.current_stake_info[bagbot.bagbot_settings.STAKE_ON_VALIDATOR].get(91), None)
+
+    def testRefreshStatsFailsInsteadOfReadingUnexpectedStakeResponseAsEmpty(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        bu.wallet = MockWallet('my-coldkey')
+        bu.sub = PortfolioSnapshotSub(
+            stake_infos=None,
+            balance=1.5,
+            subnets=[MockDynamicInfo(90, 0.01, 10000.0, 1000000.0, 'ninety')],
+        )
+        held = {'somehotkey': {90: MockStake(100.0)}}
+        bu.current_stake_info = held
+
+        with self.assertRaises(bagbot.async_substrate_interface.errors.SubstrateRequestException):
+            bagbot.asyncio.run(bu.refresh_stats())
+
+        self.assertIs(bu.current_stake_info, held)
+
+    def testRefreshStatsPinsReadsToTickBlockAndReusesCache(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        bu.wallet = MockWallet('my-coldkey')
+        bu.sub = PortfolioSnapshotSub(
+            stake_infos=[MockStakeInfo('somehotkey', 90, 100.0)],
+            balance=1.5,
+            subnets=[MockDynamicInfo(90, 0.01, 10000.0, 1000000.0, 'ninety')],
+        )
+        bu.current_block = {'block': 100, 'block_hash': '0xabc', 'blocks_spanned': 1, 'head_age_seconds': 0.0}
+
+        async def refresh_twice():
+            await bu.refresh_stats()
+            await bu.refresh_stats()
+
+        bagbot.asyncio.run(refresh_twice())
+
+        self.assertEqual(bu.sub.stake_calls, ['my-coldkey'])
+        self.assertEqual(bu.sub.balance_calls, ['my-coldkey'])
+        self.assertEqual(bu.sub.block_hashes, {'0xabc'})
+        self.assertEqual(bu.read_cache.hits, 3)
+
+    def testRefreshStatsMarksOnlyChangedSubnetsDirty(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        bu.wallet = MockWallet('my-coldkey')
+        bu.sub = PortfolioSnapshotSub(
+            stake_infos=[],
+            balance=1.5,
+            subnets=[
+                MockDynamicInfo(90, 0.01, 10000.0, 1000000.0, 'ninety'),
+                MockDynamicInfo(91, 0.02, 20000.0, 1000000.0, 'ninety-one'),
+            ],
+        )
+        bu.rotation_quotes = {(90, 91, 5): 'stale', (92, 93, 5): 'fresh'}
+
+        async def refresh_twice():
+            await bu.refresh_stats()
+            first_dirty = set(bu.dirty_subnets)
+            bu.sub.subnets = [
+                MockDynamicInfo(90, 0.01, 10000.0, 1000000.0, 'ninety'),
+                MockDynamicInfo(91, 0.025, 21000.0, 990000.0, 'ninety-one'),
+            ]
+            await bu.refresh_stats()
+            return first_dirty
+
+        first_dirty = bagbot.asyncio.run(refresh_twice())
+
+        self.assertEqual(first_dirty, {90, 91})
+        self.assertEqual(bu.dirty_subnets, {91})
+        self.assertFalse(bu.stats[90]['dirty'])
+        self.assertTrue(bu.stats[91]['dirty'])
+        self.assertEqual(bu.rotation_quotes, {(92, 93, 5): 'fresh'})
+
+    def testRefreshSubnetsReadsOnlyTouchedPoolsStakeAndBalance(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        configured = bagbot.bagbot_settings.STAKE_ON_VALIDATOR
+        bu.wallet = bagbot.SimpleNamespace(coldkey=bagbot.SimpleNamespace(ss58_address='coldkey'))
+        bu.balance = 0.5
+        bu.stats = {
+            38: {'name': 'a', 'price': 0.012, 'tao_in': 100.0, 'alpha_in': 8000.0},
+            62: {'name': 'b', 'price': 0.039, 'tao_in': 200.0, 'alpha_in': 5000.0},
+            70: {'name': 'c', 'price': 0.5, 'tao_in': 300.0, 'alpha_in': 600.0},
+        }
+        untouched = bu.stats[70]
+        bu.current_stake_info = {
+            configured: {38: MockStakeInfo(configured, 38, 30.0), 70: MockStakeInfo(configured, 70, 4.0)},
+            'legacy': {38: MockStakeInfo('legacy', 38, 2.0)},
+        }
+        bu.rotation_quotes = {(38, 70, 5): 'stale', (70, 71, 5): 'fresh'}
+        bu.sub = TargetedRefreshSub(
+            pools={38: (0.0119, 90.0, 8400.0), 62: (0.0395, 240.0, 4800.0)},
+            stakes={configured: {62: 25.0}, 'legacy': {38: 2.0}},
+            balance=0.61,
+        )
+
+        bagbot.asyncio.run(bu.refresh_subnets([62, 38], block_hash='0xhead'))
+
+        self.assertEqual(bu.balance, 0.61)
+        self.assertEqual(bu.stats[38]['price'], 0.0119)
+        self.assertEqual(bu.stats[62]['tao_in'], 240.0)
+        self.assertIs(bu.stats[70], untouched)
+        self.assertEqual(sorted(bu.current_stake_info[configured]), [62, 70])
+        self.assertIn(38, bu.current_stake_info['legacy'])
+        self.assertTrue(math.isclose(bu.my_current_stake(62), 25.0))
+        self.assertEqual(bu.dirty_subnets, {38, 62})
+        self.assertEqual(bu.rotation_quotes, {(70, 71, 5): 'fresh'})
+        self.assertEqual(sorted(bu.sub.price_calls), [38, 62])
+        self.assertEqual(sorted(bu.sub.stake_calls), [('legacy', [38, 62]), (configured, [38, 62])])
+
+    def testStaleQuoteIsRefreshedBeforeSubmissionAndTradeRebuiltOrDropped(self):
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        bu.balance = 1.0
+        bu.stats = {90: {'price': 0.012, 'tao_in': 10000.0, 'alpha_in': 833333.0}}
+        bu.current_stake_info = {'somehotkey': {}}
+        bu.subnet_grids = {90: {'buy_upper': 0.015, 'buy_lower': 0.01, 'sell_lower': 0.03, 'sell_upper': 0.04, 'max_alpha': 3000}}
+        bu.stats_quoted_at = bagbot.time.monotonic() - 10.0
+        buyTrade = bu.constructBuy(90)
+        planned = dict(buyTrade, tao_amount=bagbot.bt.utils.balance.tao(0.01))
+
+        bu.sub = TargetedRefreshSub(pools={90: (0.0125, 10100.0, 808000.0)}, stakes={}, balance=1.0)
+        rebuilt = bagbot.asyncio.run(bu._requote_trade(planned))
+
+        self.assertEqual(bu.stats[90]['price'], 0.0125)
+        self.assertEqual(float(rebuilt['tao_amount']), 0.01)
+        self.assertEqual(rebuilt['quote_age_seconds'], 0.0)
+        self.assertEqual(bu.trade_plan.requotes, 1)
+
+        fresh = bagbot.asyncio.run(bu._requote_trade(dict(buyTrade)))
+        self.assertEqual(len(bu.sub.price_calls), 1)
+        self.assertLess(fresh['quote_age_seconds'], 2.0)
+
+        bu.quote_times[90] = bagbot.time.monotonic() - 10.0
+        bu.sub.pools[90] = (0.02, 9000.0, 450000.0)
+        self.assertIsNone(bagbot.asyncio.run(bu._requote_trade(dict(buyTrade))))
+
+        bu.quote_times[90] = bagbot.time.monotonic() - 10.0
+        with patch.object(bu.pool_reader, 'read_subnets', AsyncMock(side_effect=bagbot.asyncio.TimeoutError)):
+            kept = bagbot.asyncio.run(bu._requote_trade(dict(buyTrade)))
+        self.assertEqual(kept['tao_amount'], buyTrade['tao_amount'])
+        self.assertGreater(kept['quote_age_seconds'], 2.0)
+
+    def testPresignedBuyIsSubmittedWhenTheFreshBlockConfirmsIt(self):
+        bagbot.bagbot_settings.ENABLE_PRESIGNED_EXTRINSICS = True
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        bu.wallet = bagbot.SimpleNamespace(coldkey='coldkey-pair', coldkeypub=bagbot.SimpleNamespace(ss58_address='coldkey'))
+        bu.balance = 1.0
+        bu.stats = {90: {'price': 0.012, 'tao_in': 10000.0, 'alpha_in': 833333.0}}
+        bu.current_stake_info = {'somehotkey': {}}
+        bu.subnet_grids = {90: {'buy_upper': 0.015, 'buy_lower': 0.01, 'sell_lower': 0.03, 'sell_upper': 0.04, 'max_alpha': 3000}}
+        bu.sub = PresignSub(next_index=12)
+
+        with self.assertLogs(bagbot.logger, level='INFO') as presign_logs:
+            bagbot.asyncio.run(bu.prepare_candidate_extrinsics())
+
+        self.assertEqual(len(bu.prepared_extrinsics), 1)
+        self.assertEqual(bu.sub.substrate.signed, [('add_stake_limit', 'coldkey-pair', 12, {'period': 8})])
+        self.assertFalse([line for line in presign_logs.output if 'About to' in line or 'Want to buy' in line])
+
+        bu.stats = {90: {'price': 0.01201, 'tao_in': 10001.0, 'alpha_in': 832700.0}}
+        with self.assertLogs(bagbot.logger, level='INFO') as submit_logs:
+            executed = bagbot.asyncio.run(bu.execute_buy_trade(bu.constructBuy(90)))
+
+        self.assertTrue(executed)
+        self.assertTrue([line for line in submit_logs.output if 'About to stake' in line])
+        self.assertEqual(bu.sub.substrate.submitted, ['signed:add_stake_limit'])
+        self.assertEqual(bu.sub.substrate.cleared, ['coldkey'])
+        self.assertEqual(bu.prepared_extrinsics, [])
+        self.assertTrue(math.isclose(bu.my_current_stake(90), 0.02 / 0.01201))
+
+        bagbot.asyncio.run(bu.prepare_candidate_extrinsics())
+        bu.stats = {90: {'price': 0.0125, 'tao_in': 10100.0, 'alpha_in': 808000.0}}
+        buyTrade = bu.constructBuy(90)
+        self.assertIsNone(bu._take_prepared_extrinsic(buyTrade))
+        self.assertEqual(bu.prepared_extrinsics, [])
+
+    def testTriggeredBuyRepricesAndExecutesUnderTradeLock(self):
+        bagbot.bagbot_settings.ENABLE_TRADE_TRIGGERS = True
+        args = {}
+        bu = bagbot.BittensorUtility(args)
+        bu.balance = 1.0
+        bu.stats = {90: {'price': 0.02, 'tao_in': 10000, 'alpha_in': 10000}}
+        bu.current_stake_info = {'somehotkey': {}}
+        bu.subnet_grids = {90: {'buy_upper': 0.015, 'buy_lower': 0.01, 'sell_lower': 0.03, 'sell_upper': 0.04, 'max_alpha': 3000}}
+        bu.pool_watcher.reserves[90] = {'tao_in': 9900.0, 'alpha_in': 1000000.0}
+        executed = []
+
+        async def fake_execute_buy(trade):
+            self.assertTrue(bu.trade_lock.locked())
+            executed.append(trade['netuid'])
+            return True
+
+        bu._refresh_trade_triggers()
+        with patch.object(bu, 'execute_buy_trade', side_effect=fake_execute_buy), \
+             patch.object(bu, '_refresh_runtime_market_state', new=AsyncMock()) as mock_refresh:
+            result = bagbot.asyncio.run(bu._dispatch_trigger(90, 'buy', 0.012))
+            filled_before_tick = set(bu.trigger_filled_netuids)
+            bagbot.asyncio.run(bu._reread_trigger_filled_subnets())
+            bagbot.asyncio.run(bu._reread_trigger_filled_subnets())
+
+        self.assertEqual(filled_before_tick, {90})
+        self.assertEqual(bu.trigger_filled_netuids, set())
+        self.assertEqual(mock_refresh.await_count, 2)
+        self.assertTrue(result)
+        self.assertEqual(executed, [90])
+        self.assertEqual(bu.stats[90]['price'], 0.012)
+        self.assertEqual(bu.stats[90]['tao_in'], 9900.0)
+        self.assertEqual(bu.trade_triggers.triggers[90]['sell_at'], None)
+        self.assertAlmostEqual(bu.trade_triggers.triggers[90]['buy_at'], 0.015)
+        mock_refresh.assert_awaited_with(netuids=[90])
+
     def testFallbackManagedRosterIncludesHeldSubnets(self):
         args = {}
         bu = bagbot.BittensorUtility(args)
@@ -1112,6 +1635,51 @@ class MockStake:
         self.stake = stake
 
 
+class MockStakeInfo:
+    def __init__(self, hotkey_ss58, netuid, stake):
+        self.hotkey_ss58 = hotkey_ss58
+        self.netuid = netuid
+        self.stake = bagbot.bt.utils.balance.tao(stake, netuid)
+
+
+class MockDynamicInfo:
+    def __init__(self, netuid, price, tao_in, alpha_in, subnet_name=''):
+        self.netuid = netuid
+        self.price = bagbot.bt.utils.balance.tao(price)
+        self.tao_in = bagbot.bt.utils.balance.tao(tao_in)
+        self.alpha_in = bagbot.bt.utils.balance.tao(alpha_in, netuid)
+        self.subnet_name = subnet_name
+
+
+class MockWallet:
+    def __init__(self, coldkey_ss58):
+        self.coldkey = bagbot.SimpleNamespace(ss58_address=coldkey_ss58)
+
+
+class PortfolioSnapshotSub:
+    def __init__(self, stake_infos, balance, subnets):
+        self.stake_infos = stake_infos
+        self.balance = balance
+        self.subnets = subnets
+        self.stake_calls = []
+        self.balance_calls = []
+        self.block_hashes = set()
+
+    async def all_subnets(self, block_hash=None, **kwargs):
+        self.block_hashes.add(block_hash)
+        return self.subnets
+
+    async def get_stake_info_for_coldkey(self, coldkey_ss58, block_hash=None, **kwargs):
+        self.block_hashes.add(block_hash)
+        self.stake_calls.append(coldkey_ss58)
+        return self.stake_infos
+
+    async def get_balance(self, address, block_hash=None, **kwargs):
+        self.block_hashes.add(block_hash)
+        self.balance_calls.append(address)
+        return bagbot.bt.utils.balance.tao(self.balance)
+
+
 class MockSimSwapResult:
     def __init__(self, tao_fee=0.0001, alpha_fee=0.0, alpha_amount=10.0, dest_netuid=0):
         self.tao_fee = bagbot.bt.utils.balance.tao(tao_fee)
@@ -1124,11 +1692,27 @@ class StubSub:
         self.sim_result = sim_result
         self.calls = []
 
-    async def sim_swap(self, origin_netuid, destination_netuid, amount):
+    async def sim_swap(self, origin_netuid, destination_netuid, amount, block_hash=None):
         self.calls.append((origin_netuid, destination_netuid, float(amount)))
         return self.sim_result
 
 
+class ConcurrentSimSub(StubSub):
+    def __init__(self, sim_result):
+        super().__init__(sim_result)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.block_hashes = set()
+
+    async def sim_swap(self, origin_netuid, destination_netuid, amount, block_hash=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.block_hashes.add(block_hash)
+        await bagbot.asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return await super().sim_swap(origin_netuid, destination_netuid, amount, block_hash)
+
+
 class CaptureAddStakeSub:
     def __init__(self):
         self.calls = []
@@ -1147,6 +1731,69 @@ class MockExtrinsicResponse:
         return self.message or f'MockExtrinsicResponse(success={self.success})'
 
 
+class UnwaitedStakeExtrinsic:
+    def __init__(self, extrinsic_hash):
+        self.extrinsic_hash = extrinsic_hash
+
+
+class UnwaitedStakeReceipt:
+    def __init__(self, extrinsic_hash, block_hash):
+        self.extrinsic_hash = extrinsic_hash
+        self.block_hash = block_hash
+        self.block_number = None
+
+    @property
+    async def triggered_events(self):
+        attributes = ('coldkey', 'somehotkey', int(0.5 * 1e9), int(48.0 * 1e9), 90, int(0.0005 * 1e9))
+        return [{'event': {'module_id': 'SubtensorModule', 'event_id': 'StakeAdded', 'attributes': attributes}}]
+
+
+class UnwaitedStakeSubstrate:
+    def __init__(self, owner):
+        self.owner = owner
+
+    async def get_block_hash(self, number):
+        return hex(number) if number <= self.owner.head else None
+
+    async def get_block(self, block_hash):
+        included = int(block_hash, 16) == self.owner.included_in
+        return {'extrinsics': [UnwaitedStakeExtrinsic(self.owner.extrinsic_hash)] if included else []}
+
+    def retrieve_extrinsic_by_hash(self, block_hash, extrinsic_hash):
+        return UnwaitedStakeReceipt(extrinsic_hash, block_hash)
+
+
+class UnwaitedStakeSub(CaptureAddStakeSub):
+    """add_stake without wait_for_inclusion: no receipt, only the signed extrinsic."""
+
+    def __init__(self, head, included_in, extrinsic_hash):
+        super().__init__()
+        self.head = head
+        self.included_in = included_in
+        self.extrinsic_hash = extrinsic_hash
+        self.substrate = UnwaitedStakeSubstrate(self)
+
+    async def add_stake(self, **kwargs):
+        self.calls.append(kwargs)
+        response = MockExtrinsicResponse(True)
+        response.extrinsic = UnwaitedStakeExtrinsic(self.extrinsic_hash)
+        response.extrinsic_receipt = None
+        return response
+
+
+class ReconcilingStrategyEngine:
+    def __init__(self):
+        self.fills = []
+        self.reconciled = []
+
+    def on_fill(self, netuid, side, tao_amount, alpha_amount, price, tx_hash=''):
+        self.fills.append((side, netuid, round(alpha_amount, 6)))
+        return len(self.fills)
+
+    def reconcile_fill(self, fill_id, **realized):
+        self.reconciled.append((fill_id, realized))
+
+
 class CaptureSwapStakeSub:
     def __init__(self, results):
         self.results = list(results)
@@ -1159,17 +1806,147 @@ class CaptureSwapStakeSub:
         return self.results.pop(0)
 
 
+class BatchStakeReceipt:
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+
+    @property
+    async def triggered_events(self):
+        return [
+            {'event': {'module_id': 'Utility', 'event_id': event_id, 'attributes': {'error': 'SlippageTooHigh'}}}
+            for event_id in self.outcomes
+        ]
+
+
+class BatchStakeSub:
+    def __init__(self, success, outcomes):
+        self.success = success
+        self.outcomes = outcomes
+        self.composed = []
+        self.submitted = 0
+
+    async def compose_call(self, call_module, call_function, call_params):
+        self.composed.append({'call_function': call_function, 'call_params': call_params})
+        return call_function
+
+    async def sign_and_send_extrinsic(self, call, wallet, **kwargs):
+        self.submitted += 1
+        response = MockExtrinsicResponse(self.success, 'batch rejected' if not self.success else '')
+        response.extrinsic_receipt = BatchStakeReceipt(self.outcomes)
+        return response
+
+
+class PipelinedStakeSub(BatchStakeSub):
+    def __init__(self, next_index):
+        super().__init__(success=True, outcomes=[])
+        self.next_index = next_index
+        self.sent_nonces = []
+        self.release = bagbot.asyncio.Event()
+        self.substrate = bagbot.SimpleNamespace(get_account_next_index=AsyncMock(return_value=next_index))
+
+    async def sign_and_send_extrinsic(self, call, wallet, nonce=None, **kwargs):
+        self.sent_nonces.append(nonce)
+        await self.release.wait()
+        return await super().sign_and_send_extrinsic(call, wallet, **kwargs)
+
+
+class TargetedRefreshStorageKey:
+    def __init__(self, storage_function, netuid):
+        self.storage_function = storage_function
+        self.netuid = netuid
+
+    def to_hex(self):
+        return f'{self.storage_function}:{self.netuid}'
+
+
+class TargetedRefreshSubstrate:
+    def __init__(self, pools):
+        self.pools = pools
+
+    async def create_storage_key(self, pallet, storage_function, params, block_hash=None):
+        return TargetedRefreshStorageKey(storage_function, params[0])
+
+    async def query_multi(self, storage_keys, block_hash=None):
+        pairs = []
+        for key in storage_keys:
+            _, tao_in, alpha_in = self.pools[key.netuid]
+            pairs.append((key, int((tao_in if key.storage_function == 'SubnetTAO' else alpha_in) * 1e9)))
+        return pairs
+
+
+class TargetedRefreshSub:
+    def __init__(self, pools, stakes, balance):
+        self.pools = pools
+        self.stakes = stakes
+        self.balance = balance
+        self.price_calls = []
+        self.stake_calls = []
+        self.substrate = TargetedRefreshSubstrate(pools)
+
+    async def get_subnet_price(self, netuid, block_hash=None):
+        self.price_calls.append(netuid)
+        return bagbot.bt.utils.balance.tao(self.pools[netuid][0])
+
+    async def get_balance(self, address, block_hash=None):
+        return bagbot.bt.utils.balance.tao(self.balance)
+
+    async def get_stake_for_coldkey_and_hotkey(self, coldkey_ss58, hotkey_ss58, netuids, block_hash=None):
+        self.stake_calls.append((hotkey_ss58, list(netuids)))
+        held = self.stakes.get(hotkey_ss58, {})
+        return {netuid: MockStakeInfo(hotkey_ss58, netuid, held.get(netuid, 0.0)) for netuid in netuids}
+
+
+class PresignSubstrate:
+    def __init__(self, next_index):
+        self.next_index = next_index
+        self.signed = []
+        self.submitted = []
+        self.cleared = []
+
+    async def get_account_next_index(self, address, use_cache=True):
+        return self.next_index
+
+    async def create_signed_extrinsic(self, call, keypair, nonce=None, era=None):
+        self.signed.append((call, keypair, nonce, era))
+        return f'signed:{call}'
+
+    async def submit_extrinsic(self, extrinsic, wait_for_inclusion=False, wait_for_finalization=False):
+        self.submitted.append(extrinsic)
+        return None
+
+    def clear_nonce_cache_for_account(self, address):
+        self.cleared.append(address)
+
+
+class PresignSub(BatchStakeSub):
+    def __init__(self, next_index):
+        super().__init__(success=True, outcomes=[])
+        self.substrate = PresignSubstrate(next_index)
+
+
 class CloseOnlySub:
     async def close(self):
         return None
 
 
-class WaitStopSub(CloseOnlySub):
-    def __init__(self, exc_type):
+class StubScheduler:
+    def __init__(self, blocks, exc_type):
+        self.blocks = list(blocks)
         self.exc_type = exc_type
+        self.finished = []
+
+    async def next_tick(self):
+        if not self.blocks:
+            raise self.exc_type()
+        block = self.blocks.pop(0)
+        return {'block': block, 'block_hash': f'0x{block:x}', 'blocks_spanned': 1, 'head_age_seconds': 0.0}
+
+    def finish_tick(self):
+        self.finished.append(True)
+        return 0
 
-    async def wait_for_block(self):
-        raise self.exc_type()
+    def describe(self):
+        return 'stub scheduler'
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,253 @@
+import asyncio
+import unittest
+
+import chainHelpers
+
+
+class TestSubtensorConnection(unittest.TestCase):
+
+    def testEnsureHealthyReusesHealthyConnection(self):
+        opener = CountingOpener()
+        conn = chainHelpers.SubtensorConnection('test', opener=opener)
+
+        async def scenario():
+            first = await conn.ensure_healthy()
+            second = await conn.ensure_healthy()
+            return first, second
+
+        first, second = asyncio.run(scenario())
+
+        self.assertIs(first, second)
+        self.assertEqual(opener.calls, 1)
+        self.assertEqual(conn.connect_count, 1)
+        self.assertEqual(conn.reconnect_count, 0)
+        self.assertIsNotNone(conn.last_handshake_seconds)
+
+    def testMarkUnhealthyOnlyReconnectsWhenPingFails(self):
+        opener = CountingOpener()
+        conn = chainHelpers.SubtensorConnection('test', opener=opener)
+
+        async def scenario():
+            first = await conn.ensure_healthy()
+            conn.mark_unhealthy('timeout')
+            after_good_ping = await conn.ensure_healthy()
+            first.ping_ok = False
+            conn.mark_unhealthy('timeout')
+            after_bad_ping = await conn.ensure_healthy()
+            return first, after_good_ping, after_bad_ping
+
+        first, after_good_ping, after_bad_ping = asyncio.run(scenario())
+
+        self.assertIs(first, after_good_ping)
+        self.assertIsNot(first, after_bad_ping)
+        self.assertTrue(first.closed)
+        self.assertEqual(opener.calls, 2)
+        self.assertEqual(conn.reconnect_count, 1)
+        self.assertEqual(conn.failed_health_checks, 1)
+        self.assertTrue(conn.healthy)
+
+    def testAttachAdoptsExistingSubtensor(self):
+        conn = chainHelpers.SubtensorConnection('test', opener=CountingOpener())
+        sub = FakeSub()
+
+        conn.attach(sub)
+
+        self.assertIs(conn.sub, sub)
+        self.assertTrue(conn.healthy)
+        self.assertIs(asyncio.run(conn.ensure_healthy()), sub)
+
+
+class TestSubtensorPool(unittest.TestCase):
+
+    def testReadsUseFastestHealthyEndpointAndSubmitStaysPinned(self):
+        pool = chainHelpers.SubtensorPool(['public', 'lite', 'backup'], submit_endpoint='lite', opener=CountingOpener())
+
+        async def scenario():
+            await pool.connect()
+            await asyncio.gather(*pool._connect_tasks)
+            await pool.probe()
+            pool.connections['public'].last_ping_seconds = 0.30
+            pool.connections['lite'].last_ping_seconds = 0.08
+            pool.connections['backup'].last_ping_seconds = 0.02
+
+        asyncio.run(scenario())
+
+        self.assertIs(pool.sub, pool.connections['backup'].sub)
+        self.assertIs(pool.submit_sub, pool.connections['lite'].sub)
+
+    def testFailsOverToNextEndpointWithoutReconnecting(self):
+        opener = CountingOpener()
+        pool = chainHelpers.SubtensorPool(['public', 'backup'], opener=opener)
+
+        async def scenario():
+            await pool.connect()
+            await asyncio.gather(*pool._connect_tasks)
+            pool.connections['public'].last_ping_seconds = 0.01
+            pool.connections['backup'].last_ping_seconds = 0.05
+            failing = pool.sub
+            failing.ping_ok = False
+            pool.mark_unhealthy('timeout', sub=failing)
+            return failing, await pool.ensure_healthy()
+
+        failing, recovered = asyncio.run(scenario())
+
+        self.assertIs(failing, pool.connections['public'].sub)
+        self.assertIs(recovered, pool.connections['backup'].sub)
+        self.assertIs(pool.submit_sub, recovered)
+        self.assertEqual(opener.calls, 2)
+        self.assertFalse(pool.connections['public'].healthy)
+
+    def testAttachSetsPrimaryConnection(self):
+        pool = chainHelpers.SubtensorPool(['public', 'backup'], opener=CountingOpener())
+        sub = FakeSub()
+
+        pool.attach(sub)
+
+        self.assertIs(pool.sub, sub)
+        self.assertIs(pool.submit_sub, sub)
+
+
+class TestBlockScheduler(unittest.TestCase):
+
+    def testTickSkipsToLatestHeadAndRecordsSpan(self):
+        pool = chainHelpers.SubtensorPool(['public'], opener=CountingOpener())
+        sub = FakeSub()
+        pool.attach(sub)
+        scheduler = chainHelpers.BlockScheduler(pool)
+
+        async def scenario():
+            sub.headers = asyncio.Queue()
+            scheduler.start()
+            sub.headers.put_nowait(100)
+            first = await asyncio.wait_for(scheduler.next_tick(), timeout=1.0)
+            for number in (101, 102, 103):
+                sub.headers.put_nowait(number)
+            await drain_headers(sub)
+            overlap = scheduler.finish_tick()
+            second = await asyncio.wait_for(scheduler.next_tick(), timeout=1.0)
+            await scheduler.stop()
+            return first, overlap, second
+
+        first, overlap, second = asyncio.run(scenario())
+
+        self.assertEqual(first['block'], 100)
+        self.assertEqual(first['block_hash'], '0x64')
+        self.assertEqual(overlap, 3)
+        self.assertEqual(second['block'], 103)
+        self.assertEqual(second['blocks_spanned'], 3)
+        self.assertEqual(scheduler.blocks_skipped, 2)
+        self.assertEqual(scheduler.overlapped_ticks, 1)
+
+    def testNextTickWaitsForNewerHead(self):
+        pool = chainHelpers.SubtensorPool(['public'], opener=CountingOpener())
+        sub = FakeSub()
+        pool.attach(sub)
+        scheduler = chainHelpers.BlockScheduler(pool)
+
+        async def scenario():
+            sub.headers = asyncio.Queue()
+            scheduler.start()
+            sub.headers.put_nowait(100)
+            await asyncio.wait_for(scheduler.next_tick(), timeout=1.0)
+            sub.headers.put_nowait(99)
+            waiter = asyncio.create_task(scheduler.next_tick())
+            await drain_headers(sub)
+            self.assertFalse(waiter.done())
+            sub.headers.put_nowait('0x65')
+            stamp = await asyncio.wait_for(waiter, timeout=1.0)
+            await scheduler.stop()
+            self.assertTrue(pool.connections['public'].healthy)
+            return stamp
+
+        stamp = asyncio.run(scenario())
+
+        self.assertEqual(stamp['block'], 101)
+        self.assertEqual(stamp['blocks_spanned'], 1)
+
+
+class TestBlockReadCache(unittest.TestCase):
+
+    def testSharesResultsPerBlockAndSkipsFailures(self):
+        cache = chainHelpers.BlockReadCache(max_blocks=2)
+        calls = []
+
+        async def fetch_value(value):
+            calls.append(value)
+            await asyncio.sleep(0)
+            return value
+
+        async def fail():
+            calls.append('fail')
+            raise ConnectionError('boom')
+
+        async def scenario():
+            results = await asyncio.gather(
+                cache.get('all_subnets', {}, '0x1', lambda: fetch_value('a')),
+                cache.get('all_subnets', {}, '0x1', lambda: fetch_value('b')),
+            )
+            other_block = await cache.get('all_subnets', {}, '0x2', lambda: fetch_value('c'))
+            with self.assertRaises(ConnectionError):
+                await cache.get('get_balance', {'address': 'x'}, '0x2', fail)
+            retried = await cache.get('get_balance', {'address': 'x'}, '0x2', lambda: fetch_value('d'))
+            await cache.get('all_subnets', {}, '0x3', lambda: fetch_value('e'))
+            evicted = await cache.get('all_subnets', {}, '0x1', lambda: fetch_value('f'))
+            return results, other_block, retried, evicted
+
+        results, other_block, retried, evicted = asyncio.run(scenario())
+
+        self.assertEqual(results, ['a', 'a'])
+        self.assertEqual(other_block, 'c')
+        self.assertEqual(retried, 'd')
+        self.assertEqual(evicted, 'f')
+        self.assertEqual(calls, ['a', 'c', 'fail', 'd', 'e', 'f'])
+        self.assertEqual(cache.hits, 1)
+
+
+class CountingOpener:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, network):
+        self.calls += 1
+        return FakeSub()
+
+
+class FakeSubstrate:
+    def __init__(self, owner):
+        self.owner = owner
+
+    async def get_chain_head(self):
+        if not self.owner.ping_ok:
+            raise ConnectionError('socket closed')
+        return '0xhead'
+
+    async def get_block_hash(self, block_number):
+        return hex(block_number)
+
+    async def subscribe_block_headers(self, subscription_handler):
+        # Like async-substrate-interface: the handler gets only the decoded block.
+        while True:
+            number = await self.owner.headers.get()
+            result = await subscription_handler({'header': {'number': number}})
+            self.owner.headers.task_done()
+            if result is not None:
+                return result
+
+
+async def drain_headers(sub):
+    await asyncio.wait_for(sub.headers.join(), timeout=1.0)
+
+
+class FakeSub:
+    def __init__(self):
+        self.ping_ok = True
+        self.closed = False
+        self.headers = None
+        self.substrate = FakeSubstrate(self)
+
+    async def close(self):
+        self.closed = True
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+import asyncio
+import unittest
+
+import bagbot
+import poolHelpers
+
+
+class TestPoolStateReader(unittest.TestCase):
+
+    def testReadBuildsSnapshotFromBatchedReserves(self):
+        sub = FakePoolSub(
+            prices={0: 1.0, 5: 0.02, 7: 0.0, 9: 0.5},
+            reserves={5: (1000.0, 50000.0), 9: (300.0, 600.0)},
+            names={0: 'root', 5: 'five', 9: 'nine'},
+        )
+        reader = poolHelpers.PoolStateReader()
+
+        snapshot = asyncio.run(reader.read(sub, '0xblock'))
+
+        self.assertEqual(snapshot.netuids, [0, 5, 9])
+        self.assertEqual(snapshot.prices, [1.0, 0.02, 0.5])
+        self.assertEqual(snapshot.tao_in, [0.0, 1000.0, 300.0])
+        self.assertEqual(snapshot.alpha_in, [0.0, 50000.0, 600.0])
+        self.assertEqual(snapshot.to_stats()[5], {'name': 'five', 'price': 0.02, 'tao_in': 1000.0, 'alpha_in': 50000.0})
+        self.assertEqual(sub.query_multi_hashes, ['0xblock'])
+        self.assertEqual(sub.all_subnets_calls, 1)
+
+    def testMetadataAndStorageKeysAreReusedAcrossBlocks(self):
+        sub = FakePoolSub(
+            prices={5: 0.02},
+            reserves={5: (1000.0, 50000.0)},
+            names={5: 'five'},
+        )
+        reader = poolHelpers.PoolStateReader()
+
+        async def two_blocks():
+            await reader.read(sub, '0x1')
+            sub.reserves[5] = (1100.0, 48000.0)
+            return await reader.read(sub, '0x2')
+
+        snapshot = asyncio.run(two_blocks())
+
+        self.assertEqual(snapshot.tao_in, [1100.0])
+        self.assertEqual(sub.all_subnets_calls, 1)
+        self.assertEqual(sub.storage_keys_created, 2)
+        self.assertEqual(sub.query_multi_hashes, ['0x1', '0x2'])
+
+
+class TestPoolWatcher(unittest.TestCase):
+
+    def testApplyRepricesOnlyChangedSubnets(self):
+        sub = FakePoolSub(
+            prices={5: 0.02, 9: 0.5},
+            reserves={5: (1000.0, 50000.0), 9: (300.0, 600.0)},
+            names={5: 'five', 9: 'nine'},
+        )
+        reader = poolHelpers.PoolStateReader()
+        watcher = poolHelpers.PoolWatcher(reader, resync_blocks=10)
+
+        async def scenario():
+            snapshot = await reader.read(sub, '0x1')
+            watcher.seed(snapshot, block_number=100)
+            stats = snapshot.to_stats()
+            tao_key, alpha_key = reader._storage_keys[9]
+            await watcher._on_change(tao_key, int(310.0 * 1e9), 'sub')
+            await watcher._on_change(alpha_key, int(600.0 * 1e9), 'sub')
+            sub.prices[9] = 0.52
+            return stats, await watcher.apply(sub, stats, '0x2')
+
+        stats, (updated, changed) = asyncio.run(scenario())
+
+        self.assertEqual(changed, {9})
+        self.assertEqual(sub.price_calls, [(9, '0x2')])
+        self.assertIs(updated[5], stats[5])
+        self.assertEqual(updated[9], {'name': 'nine', 'price': 0.52, 'tao_in': 310.0, 'alpha_in': 600.0})
+        self.assertFalse(watcher.needs_resync(105))
+        self.assertTrue(watcher.needs_resync(110))
+
+    def testStartResubscribesWhenTheWatchedSubnetsChange(self):
+        sub = FakePoolSub(prices={}, reserves={}, names={})
+        connection = FakeWatchConnection(sub)
+        watcher = poolHelpers.PoolWatcher(poolHelpers.PoolStateReader())
+
+        async def scenario():
+            watcher.start(connection, [9, 5])
+            await asyncio.sleep(0.01)
+            first_task = watcher._task
+            watcher.start(connection, [5, 9])
+            await asyncio.sleep(0.01)
+            watcher.start(connection, [5, 9, 12])
+            await asyncio.sleep(0.01)
+            cancelled = first_task.cancelled()
+            await watcher.stop()
+            return cancelled
+
+        first_cancelled = asyncio.run(scenario())
+
+        self.assertTrue(first_cancelled)
+        self.assertEqual(watcher.netuids, [5, 9, 12])
+        self.assertEqual(
+            [sorted({key.netuid for key in keys}) for keys in sub.subscribed_keys],
+            [[5, 9], [5, 9, 12]],
+        )
+
+
+class TestLocalPoolSimulator(unittest.TestCase):
+
+    def testStakeAndUnstakeFollowConstantProduct(self):
+        alpha_out, fee_tao, impact = poolHelpers.simulate_stake(10.0, 1000.0, 100000.0, fee_rate=0.0)
+        self.assertAlmostEqual(float(alpha_out), 100000.0 * 10.0 / 1010.0)
+        self.assertEqual(float(fee_tao), 0.0)
+        self.assertAlmostEqual(float(impact), 10.0 / 1010.0)
+
+        tao_out, fee_alpha, _ = poolHelpers.simulate_unstake(1000.0, 1000.0, 100000.0, fee_rate=0.01)
+        self.assertAlmostEqual(float(fee_alpha), 10.0)
+        self.assertAlmostEqual(float(tao_out), 1000.0 * 990.0 / 100990.0)
+
+    def testSwapMatchesChainedLegsAndMatrix(self):
+        stats = {
+            1: {'price': 0.01, 'tao_in': 1000.0, 'alpha_in': 100000.0},
+            2: {'price': 0.02, 'tao_in': 4000.0, 'alpha_in': 200000.0},
+            3: {'price': 0.5, 'tao_in': 0.0, 'alpha_in': 10.0},
+        }
+        simulator = poolHelpers.LocalPoolSimulator(stats)
+
+        estimate = simulator.swap([1, 2], [2, 1], [500.0, 100.0])
+        tao_out, _, _ = poolHelpers.simulate_unstake(500.0, 1000.0, 100000.0)
+        expected_alpha, _, _ = poolHelpers.simulate_stake(tao_out, 4000.0, 200000.0)
+        matrix = simulator.swap_matrix([500.0, 100.0])
+
+        self.assertNotIn(3, simulator)
+        self.assertAlmostEqual(float(estimate['destination_alpha'][0]), float(expected_alpha))
+        self.assertAlmostEqual(float(matrix[0, 1]), float(expected_alpha))
+        self.assertAlmostEqual(float(matrix[1, 0]), float(estimate['destination_alpha'][1]))
+        self.assertTrue(all(0.0 < loss < 0.01 for loss in estimate['value_loss_pct']))
+
+
+class FakeStorageKey:
+    def __init__(self, storage_function, netuid):
+        self.storage_function = storage_function
+        self.netuid = netuid
+
+    def to_hex(self):
+        return f'{self.storage_function}:{self.netuid}'
+
+
+class FakePoolSubstrate:
+    def __init__(self, owner):
+        self.owner = owner
+
+    async def create_storage_key(self, pallet, storage_function, params, block_hash=None):
+        self.owner.storage_keys_created += 1
+        return FakeStorageKey(storage_function, params[0])
+
+    async def subscribe_storage(self, storage_keys, subscription_handler):
+        self.owner.subscribed_keys.append(storage_keys)
+        await asyncio.Event().wait()
+
+    async def query_multi(self, storage_keys, block_hash=None):
+        self.owner.query_multi_hashes.append(block_hash)
+        pairs = []
+        for key in storage_keys:
+            tao_in, alpha_in = self.owner.reserves.get(key.netuid, (0.0, 0.0))
+            value = tao_in if key.storage_function == 'SubnetTAO' else alpha_in
+            pairs.append((key, int(value * 1e9)))
+        return pairs
+
+
+class FakePoolSub:
+    def __init__(self, prices, reserves, names):
+        self.prices = prices
+        self.reserves = reserves
+        self.names = names
+        self.all_subnets_calls = 0
+        self.storage_keys_created = 0
+        self.query_multi_hashes = []
+        self.price_calls = []
+        self.subscribed_keys = []
+        self.substrate = FakePoolSubstrate(self)
+
+    async def get_subnet_prices(self, block_hash=None):
+        return {netuid: bagbot.bt.utils.balance.tao(price) for netuid, price in self.prices.items()}
+
+    async def get_subnet_price(self, netuid, block_hash=None):
+        self.price_calls.append((netuid, block_hash))
+        return bagbot.bt.utils.balance.tao(self.prices[netuid])
+
+    async def all_subnets(self, block_hash=None):
+        self.all_subnets_calls += 1
+        return [FakeSubnetInfo(netuid, name) for netuid, name in self.names.items()]
+
+
+class FakeWatchConnection:
+    def __init__(self, sub):
+        self.sub = sub
+
+    async def ensure_healthy(self):
+        return self.sub
+
+    def mark_unhealthy(self, reason, sub=None):
+        pass
+
+
+class FakeSubnetInfo:
+    def __init__(self, netuid, subnet_name):
+        self.netuid = netuid
+        self.subnet_name = subnet_name
+
+
+if __name__ == '__main__':
+    unittest.main()
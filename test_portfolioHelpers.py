@@ -0,0 +1,62 @@
+import unittest
+
+import portfolioHelpers
+
+
+class TestPortfolioSnapshot(unittest.TestCase):
+
+    def testBuildFiltersAlternateValidatorDust(self):
+        stake_info = {
+            'configured': {5: FakeStake(100.0), 9: FakeStake(2.0)},
+            'legacy': {5: FakeStake(0.5), 9: FakeStake(40.0), 12: FakeStake(3.0)},
+        }
+        stats = {5: {'price': 0.01}, 9: {'price': 0.5}}
+        grids = {9: {'stake_on_validator': 'configured'}}
+
+        snapshot = portfolioHelpers.PortfolioSnapshot.build(stake_info, stats, grids, 'configured', 0.01, version=3)
+
+        self.assertTrue(snapshot.is_dust('legacy', 5, 0.5))
+        self.assertEqual(snapshot.current_stake(5), 100.0)
+        self.assertEqual(snapshot.current_stake(9), 42.0)
+        self.assertEqual(snapshot.current_stake(12), 3.0)
+        self.assertEqual(snapshot.subnet_value(12), 0.0)
+        self.assertAlmostEqual(snapshot.total_value, 1.0 + 21.0)
+        self.assertTrue(snapshot.matches(3, 'configured', 0.01))
+        self.assertFalse(snapshot.matches(4, 'configured', 0.01))
+        self.assertFalse(snapshot.matches(3, 'configured', 0.05))
+
+    def testWithFillReturnsNewSnapshot(self):
+        stake_info = {'configured': {5: FakeStake(100.0)}, 'legacy': {5: FakeStake(0.5)}}
+        stats = {5: {'price': 0.01}}
+        grids = {}
+        snapshot = portfolioHelpers.PortfolioSnapshot.build(stake_info, stats, grids, 'configured', 0.01)
+
+        sold = snapshot.with_fill('configured', 5, -60.0)
+        grown = sold.with_fill('legacy', 5, 10.0, version=1)
+
+        self.assertEqual(snapshot.current_stake(5), 100.0)
+        self.assertEqual(sold.current_stake(5), 40.0)
+        self.assertAlmostEqual(grown.current_stake(5), 50.5)
+        self.assertAlmostEqual(grown.total_value, 0.505)
+        self.assertTrue(sold.matches(0, 'configured', 0.01))
+        self.assertTrue(grown.matches(1, 'configured', 0.01))
+
+    def testWithPriceRevaluesOneSubnet(self):
+        stake_info = {'configured': {5: FakeStake(100.0), 9: FakeStake(2.0)}}
+        stats = {5: {'price': 0.01}, 9: {'price': 0.5}}
+        snapshot = portfolioHelpers.PortfolioSnapshot.build(stake_info, stats, {}, 'configured', 0.01)
+
+        repriced = snapshot.with_fill('configured', 5, 10.0).with_price(5, 0.02)
+
+        self.assertAlmostEqual(repriced.subnet_value(5), 2.2)
+        self.assertAlmostEqual(repriced.total_value, 3.2)
+        self.assertAlmostEqual(snapshot.total_value, 2.0)
+
+
+class FakeStake:
+    def __init__(self, stake):
+        self.stake = stake
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,499 @@
+import asyncio
+import unittest
+
+import chainHelpers
+import tradeHelpers
+
+
+class TestTriggerEngine(unittest.TestCase):
+
+    def testNotifyDispatchesOnlyWhenBandIsCrossed(self):
+        quotes = {5: 0.009, 6: 0.05, 7: 0.031}
+        dispatched = []
+
+        async def quote_price(netuid):
+            return quotes[netuid]
+
+        async def dispatch(netuid, side, price):
+            dispatched.append((netuid, side, price))
+
+        engine = tradeHelpers.TriggerEngine(dispatch, quote_price)
+        engine.set_triggers({
+            5: {'buy_at': 0.01, 'sell_at': 0.03},
+            6: {'buy_at': 0.01, 'sell_at': 0.06},
+            7: {'buy_at': None, 'sell_at': 0.03},
+            8: {'buy_at': None, 'sell_at': None},
+        })
+
+        async def scenario():
+            for netuid in (5, 6, 7, 8, 99):
+                engine.notify(netuid)
+            await asyncio.sleep(0.01)
+
+        asyncio.run(scenario())
+
+        self.assertEqual(sorted(dispatched), [(5, 'buy', 0.009), (7, 'sell', 0.031)])
+        self.assertNotIn(8, engine.triggers)
+        self.assertEqual(engine.fired, 2)
+        self.assertIsNotNone(engine.last_reaction_seconds)
+
+    def testNotificationsFromOneBlockAreCoalesced(self):
+        quote_calls = []
+
+        async def quote_price(netuid):
+            quote_calls.append(netuid)
+            return 0.02
+
+        async def dispatch(netuid, side, price):
+            pass
+
+        engine = tradeHelpers.TriggerEngine(dispatch, quote_price)
+        engine.set_triggers({5: {'buy_at': 0.01, 'sell_at': 0.03}})
+
+        async def scenario():
+            engine.notify(5)
+            engine.notify(5)
+            await asyncio.sleep(0.01)
+
+        asyncio.run(scenario())
+
+        self.assertEqual(quote_calls, [5])
+        self.assertEqual(engine.fired, 0)
+
+
+
+class TestTradePlan(unittest.TestCase):
+
+    def testLegsAreBuiltOnceAndFillDropsTouchedLegs(self):
+        plan = tradeHelpers.TradePlan(version=3)
+        builds = []
+
+        def build(name):
+            def run():
+                builds.append(name)
+                return name
+            return run
+
+        plan.leg(5, 'buy', (False,), build('buy5'), portfolio_wide=True)
+        plan.leg(5, 'buy', (False,), build('buy5-again'), portfolio_wide=True)
+        plan.leg(6, 'sell', (False, None, None), build('sell6'))
+        plan.leg(7, 'buy', (True,), build('rotation-buy7'))
+        plan.leg(7, 'buy', (False,), build('buy7'), portfolio_wide=True)
+
+        plan.invalidate_fill(6, version=4)
+        plan.leg(6, 'sell', (False, None, None), build('sell6-refreshed'))
+        plan.leg(7, 'buy', (True,), build('rotation-buy7-again'))
+        plan.leg(7, 'buy', (False,), build('buy7-refreshed'), portfolio_wide=True)
+
+        self.assertEqual(builds, ['buy5', 'sell6', 'rotation-buy7', 'buy7', 'sell6-refreshed', 'buy7-refreshed'])
+        self.assertEqual(plan.hits, 2)
+        self.assertTrue(plan.matches(4))
+        self.assertFalse(plan.matches(3))
+
+
+
+class TestAllocateCash(unittest.TestCase):
+
+    def testFillsBestScoresFirstWithinCaps(self):
+        legs = [
+            {'netuid': 1, 'max_tao': 0.5, 'score': 2.0},
+            {'netuid': 2, 'max_tao': 0.4, 'score': 5.0},
+            {'netuid': 3, 'max_tao': 0.3, 'score': 1.0, 'min_tao': 0.25},
+            {'netuid': 4, 'max_tao': 0.3, 'score': 0.5},
+        ]
+
+        split = tradeHelpers.allocate_cash(legs, spendable_tao=1.0)
+        capped = tradeHelpers.allocate_cash(legs, spendable_tao=1.0, budget_tao=0.45)
+
+        self.assertEqual([netuid for netuid, _ in split], [2, 1, 4])
+        self.assertAlmostEqual(sum(amount for _, amount in split), 1.0)
+        self.assertAlmostEqual(split[2][1], 0.1)
+        self.assertEqual([netuid for netuid, _ in capped], [2, 1])
+        self.assertAlmostEqual(capped[1][1], 0.05)
+
+    def testHoldsTheFeeBufferBackForEveryLeg(self):
+        legs = [
+            {'netuid': 1, 'max_tao': 0.5, 'score': 2.0},
+            {'netuid': 2, 'max_tao': 0.4, 'score': 5.0},
+            {'netuid': 3, 'max_tao': 0.3, 'score': 1.0},
+        ]
+
+        split = tradeHelpers.allocate_cash(legs, spendable_tao=1.0, fee_per_leg_tao=0.01)
+        capped = tradeHelpers.allocate_cash(legs, spendable_tao=1.0, budget_tao=0.6, fee_per_leg_tao=0.01)
+
+        self.assertEqual([netuid for netuid, _ in split], [2, 1, 3])
+        self.assertAlmostEqual(split[2][1], 0.07)
+        self.assertAlmostEqual(sum(amount for _, amount in split) + 0.01 * len(split), 1.0)
+        self.assertEqual([(netuid, round(amount, 9)) for netuid, amount in capped], [(2, 0.4), (1, 0.2)])
+
+
+class TestRotationPairPlan(unittest.TestCase):
+
+    def testMasksFloorsAndListsPairsInRosterOrder(self):
+        plan = tradeHelpers.RotationPairPlan(
+            targets=[1, 2, 3, 4],
+            discounts=[0.05, 0.03, 0.01, 0.04],
+            target_hotkeys=['hk', 'hk', 'hk', 'other'],
+            sources=[2, 5, 6],
+            weaknesses=[0.04, 0.02, 0.015],
+            source_hotkeys=['hk', 'hk', 'hk'],
+            discount_floor=0.02,
+            weakness_floor=0.02,
+        )
+
+        pairs = plan.eligible_pairs()
+        misses = plan.near_misses(limit=1)
+        weaker_first = tradeHelpers.RotationPairPlan([1, 2], [0.02, 0.05], ['hk', 'hk'], [7], [0.03], ['hk'], 0.02, 0.02)
+
+        self.assertEqual([(target, source) for target, source, _, _ in pairs], [(1, 2), (1, 5), (2, 5)])
+        self.assertAlmostEqual(pairs[0][2] + pairs[0][3], 0.09)
+        self.assertEqual([(target, source) for target, source, _, _ in weaker_first.eligible_pairs()], [(1, 7), (2, 7)])
+        self.assertEqual([miss['priority'] for miss in misses], [1.0, 2.0, 2.5])
+        self.assertEqual(misses[0]['message'], 'sn3 target_discount 1.00% < 2.00%')
+        self.assertTrue(misses[1]['message'].startswith('sn6->sn1 source_weakness 1.50%'))
+        self.assertEqual(misses[2]['message'], 'sn2->sn4 hotkey mismatch (hk != other)')
+        self.assertEqual(plan.near_misses(limit=0), [])
+
+    def testEmptySidesProduceNoPairs(self):
+        plan = tradeHelpers.RotationPairPlan([], [], [], [7], [0.5], ['hk'], 0.02, 0.02)
+
+        self.assertEqual(plan.eligible_pairs(), [])
+        self.assertEqual(plan.near_misses(limit=3), [])
+
+
+
+class TestStakeBatch(unittest.TestCase):
+
+    def testBatchComposesLimitCallsAndDecodesEachOutcome(self):
+        sub = FakeBatchSub(events=[
+            utility_event('ItemCompleted'),
+            utility_event('ItemFailed', {'error': 'SlippageTooHigh'}),
+            utility_event('BatchCompletedWithErrors'),
+        ])
+        batch = tradeHelpers.StakeBatch(sub, wallet='wallet')
+
+        async def scenario():
+            await batch.add_stake('hk', 5, FakeBalance(0.5), limit_price=0.0105)
+            await batch.remove_stake('hk', 9, FakeBalance(20.0), limit_price=0.099)
+            await batch.swap_stake('hk', 9, 5, FakeBalance(1.0), limit_ratio=10.5)
+            return await batch.submit()
+
+        response, outcomes = asyncio.run(scenario())
+
+        self.assertEqual([call['call_function'] for call in sub.composed[:3]], ['add_stake_limit', 'remove_stake_limit', 'swap_stake_limit'])
+        self.assertEqual(sub.composed[0]['call_params']['limit_price'], 10500000)
+        self.assertEqual(sub.composed[3]['call_function'], 'force_batch')
+        self.assertEqual(len(sub.composed[3]['call_params']['calls']), 3)
+        self.assertEqual(sub.submitted, 1)
+        self.assertEqual(sub.periods, [tradeHelpers.ERA_PERIOD_BLOCKS])
+        self.assertEqual(outcomes, [(True, None), (False, 'SlippageTooHigh'), (False, 'not dispatched')])
+
+    def testRejectedBatchReturnsNoOutcomes(self):
+        sub = FakeBatchSub(events=[], success=False)
+        batch = tradeHelpers.StakeBatch(sub, wallet='wallet')
+
+        async def scenario():
+            await batch.add_stake('hk', 5, FakeBalance(0.5), limit_price=0.0105)
+            return await batch.submit()
+
+        response, outcomes = asyncio.run(scenario())
+
+        self.assertFalse(response.success)
+        self.assertIsNone(outcomes)
+
+
+class TestSubmissionPipeline(unittest.TestCase):
+
+    def testSubmitsBackToBackWithLocalNoncesAndBooksAsTheyLand(self):
+        sub = FakePipelineSub(next_index=40, rejected_nonces={41})
+        nonces = chainHelpers.NonceManager('coldkey')
+        pipeline = tradeHelpers.SubmissionPipeline(nonces)
+        landed = []
+
+        async def scenario():
+            for netuid in (5, 9, 12):
+                batch = tradeHelpers.StakeBatch(sub, wallet='wallet')
+                await batch.add_stake('hk', netuid, FakeBalance(0.1), limit_price=0.01)
+                await pipeline.submit(batch, lambda response, outcomes, netuid=netuid: landed.append((netuid, outcomes)))
+            in_flight = len(pipeline.pending)
+            sub.release.set()
+            await pipeline.drain()
+            return in_flight
+
+        in_flight = asyncio.run(scenario())
+
+        self.assertEqual(in_flight, 3)
+        self.assertEqual(sorted(sub.sent_nonces), [40, 41, 42])
+        self.assertEqual(sub.next_index_calls, 1)
+        self.assertEqual(sorted(landed, key=lambda item: item[0]), [(5, [(True, None)]), (9, None), (12, [(True, None)])])
+        self.assertEqual((pipeline.landed, pipeline.rejected), (2, 1))
+        self.assertIsNone(nonces._next)
+
+    def testTimedOutExtrinsicIsHeldUntilItsNonceIsConsumedOrItsEraEnds(self):
+        sub = FakePipelineSub(next_index=40)
+        sub.substrate.consume_nonce_at_head = 5
+        nonces = chainHelpers.NonceManager('coldkey')
+        pipeline = tradeHelpers.SubmissionPipeline(nonces, period=8, timeout=0.01, poll_interval=0)
+        results = []
+
+        async def scenario():
+            for netuid in (5, 9):
+                batch = tradeHelpers.StakeBatch(sub, wallet='wallet')
+                await batch.add_stake('hk', netuid, FakeBalance(0.1), limit_price=0.01)
+                await pipeline.submit(batch, lambda response, outcomes, netuid=netuid: results.append(
+                    (netuid, outcomes, sub.substrate.head, response),
+                ))
+            await pipeline.drain()
+
+        asyncio.run(scenario())
+
+        (first, first_outcomes, first_head, first_response), (second, second_outcomes, second_head, second_response) = results
+        self.assertEqual((first, first_outcomes), (5, None))
+        self.assertGreaterEqual(first_head, 5)
+        self.assertIn('nonce 40 was consumed later', first_response)
+        self.assertEqual((second, second_outcomes), (9, None))
+        self.assertGreater(second_head, 8)
+        self.assertIn('era ended', second_response)
+        self.assertEqual(sub.periods, [8, 8])
+        self.assertEqual((pipeline.landed_late, pipeline.expired, pipeline.rejected), (1, 1, 0))
+
+
+class TestFillReconciler(unittest.TestCase):
+
+    def testMatchesFillsToStakeEventsInTheBackground(self):
+        receipt = FakeReconcileReceipt(events=[
+            stake_event('StakeRemoved', tao=0.19, alpha=10.0, netuid=91, fee=0.02),
+            stake_event('StakeAdded', tao=0.5, alpha=48.0, netuid=90, fee=0.0005),
+            utility_event('ItemCompleted'),
+        ])
+        realized = {}
+        reconciler = tradeHelpers.FillReconciler(lambda fill_id, fill: realized.__setitem__(fill_id, fill))
+
+        async def scenario():
+            reconciler.submit(receipt, [
+                {'fill_id': 1, 'netuid': 90, 'side': 'buy'},
+                {'fill_id': 2, 'netuid': 91, 'side': 'sell'},
+                {'fill_id': 3, 'netuid': 12, 'side': 'buy'},
+            ])
+            queued = dict(realized)
+            await reconciler.drain()
+            return queued
+
+        queued = asyncio.run(scenario())
+
+        self.assertEqual(queued, {})
+        self.assertEqual(sorted(realized), [1, 2])
+        self.assertAlmostEqual(realized[1]['alpha_amount'], 48.0)
+        self.assertAlmostEqual(realized[1]['price'], 0.5 / 48.0)
+        self.assertAlmostEqual(realized[1]['fee_tao'], 0.0005)
+        self.assertAlmostEqual(realized[2]['fee_tao'], 0.02 * 0.019)
+        self.assertEqual((realized[2]['tx_hash'], realized[2]['block_number']), ('0xabc', 4321))
+        self.assertEqual((reconciler.reconciled, reconciler.unmatched, reconciler.failed), (2, 1, 0))
+
+    def testLocatesUnwaitedExtrinsicByHashBeforeReconciling(self):
+        substrate = FakeChainSubstrate(head=100, blocks={100: [b'\xaa'], 101: [b'\xcc', b'\xbb']}, events=[
+            stake_event('StakeAdded', tao=0.5, alpha=48.0, netuid=90, fee=0.0005),
+        ])
+        realized = {}
+        reconciler = tradeHelpers.FillReconciler(
+            lambda fill_id, fill: realized.__setitem__(fill_id, fill), search_blocks=2, poll_interval=0,
+        )
+
+        async def scenario():
+            reconciler.submit_pending(substrate, '0xbb', [{'fill_id': 7, 'netuid': 90, 'side': 'buy'}], from_block=100)
+            reconciler.submit_pending(substrate, '0xdd', [{'fill_id': 8, 'netuid': 90, 'side': 'buy'}], from_block=100)
+            await reconciler.drain()
+
+        asyncio.run(scenario())
+
+        self.assertEqual(list(realized), [7])
+        self.assertAlmostEqual(realized[7]['alpha_amount'], 48.0)
+        self.assertEqual((realized[7]['tx_hash'], realized[7]['block_number']), ('0xbb', 101))
+        self.assertEqual(substrate.retrieved, [('0x65', '0xbb')])
+        self.assertEqual((reconciler.reconciled, reconciler.not_included, reconciler.failed), (1, 1, 0))
+        self.assertEqual(
+            tradeHelpers.extrinsic_hash_of(FakeResponseWithExtrinsic(FakeSignedExtrinsic(b'\x01\x02'))), '0x0102',
+        )
+        self.assertIsNone(tradeHelpers.extrinsic_hash_of(FakeResponseWithExtrinsic(None)))
+
+    def testSlowSearchDoesNotHoldUpLaterReceipts(self):
+        substrate = StalledChainSubstrate(head=100, blocks={}, events=[])
+        receipt = FakeReconcileReceipt(events=[stake_event('StakeAdded', tao=0.5, alpha=48.0, netuid=90, fee=0.0005)])
+        realized = {}
+        reconciler = tradeHelpers.FillReconciler(
+            lambda fill_id, fill: realized.__setitem__(fill_id, fill), search_blocks=0, poll_interval=0,
+        )
+
+        async def scenario():
+            reconciler.submit_pending(substrate, '0xbb', [{'fill_id': 7, 'netuid': 90, 'side': 'buy'}], from_block=100)
+            reconciler.submit(receipt, [{'fill_id': 8, 'netuid': 90, 'side': 'buy'}])
+            await asyncio.wait_for(reconciler._task, timeout=1.0)
+            reconciled_while_searching = list(realized)
+            substrate.release.set()
+            await reconciler.drain()
+            return reconciled_while_searching
+
+        reconciled_while_searching = asyncio.run(scenario())
+
+        self.assertEqual(reconciled_while_searching, [8])
+        self.assertEqual((reconciler.reconciled, reconciler.not_included, reconciler.failed), (1, 1, 0))
+
+
+def stake_event(event_id, tao, alpha, netuid, fee):
+    attributes = ('coldkey', 'hotkey', int(tao * 1e9), int(alpha * 1e9), netuid, int(fee * 1e9))
+    return {'event': {'module_id': 'SubtensorModule', 'event_id': event_id, 'attributes': attributes}}
+
+
+def utility_event(event_id, attributes=None):
+    return {'event': {'module_id': 'Utility', 'event_id': event_id, 'attributes': attributes or {}}}
+
+
+class FakeBalance:
+    def __init__(self, tao):
+        self.rao = int(tao * 1e9)
+
+
+class FakeReceipt:
+    def __init__(self, events):
+        self.events = events
+
+    @property
+    async def triggered_events(self):
+        return self.events
+
+
+class FakeBatchResponse:
+    def __init__(self, success, events):
+        self.success = success
+        self.extrinsic_receipt = FakeReceipt(events)
+
+
+class FakeBatchSub:
+    def __init__(self, events, success=True):
+        self.events = events
+        self.success = success
+        self.composed = []
+        self.submitted = 0
+        self.periods = []
+
+    async def compose_call(self, call_module, call_function, call_params):
+        call = {'call_module': call_module, 'call_function': call_function, 'call_params': call_params}
+        self.composed.append(call)
+        return call
+
+    async def sign_and_send_extrinsic(self, call, wallet, **kwargs):
+        self.submitted += 1
+        self.periods.append(kwargs.get('period'))
+        return FakeBatchResponse(self.success, self.events)
+
+
+class FakePipelineResponse:
+    def __init__(self, included):
+        self.success = included
+        self.message = 'Success' if included else 'Invalid Transaction'
+        self.extrinsic_receipt = FakeReceipt([]) if included else None
+
+
+class FakePipelineSubstrate:
+    def __init__(self, owner):
+        self.owner = owner
+        self.head = 0
+        self.consume_nonce_at_head = None
+
+    async def get_account_next_index(self, address, use_cache=True):
+        self.owner.next_index_calls += 1
+        return self.owner.next_index
+
+    async def get_block_number(self, block_hash):
+        self.head += 1
+        return self.head
+
+    async def get_account_nonce(self, address):
+        return self.owner.next_index + (self.head >= self.consume_nonce_at_head)
+
+
+class FakePipelineSub(FakeBatchSub):
+    def __init__(self, next_index, rejected_nonces=()):
+        super().__init__(events=[])
+        self.next_index = next_index
+        self.rejected_nonces = set(rejected_nonces)
+        self.next_index_calls = 0
+        self.sent_nonces = []
+        self.release = asyncio.Event()
+        self.substrate = FakePipelineSubstrate(self)
+
+    async def sign_and_send_extrinsic(self, call, wallet, nonce=None, **kwargs):
+        self.sent_nonces.append(nonce)
+        self.periods.append(kwargs.get('period'))
+        await self.release.wait()
+        return FakePipelineResponse(nonce not in self.rejected_nonces)
+
+
+class FakeReconcileSubstrate:
+    async def get_block_number(self, block_hash):
+        return 4321
+
+
+class FakeReconcileReceipt(FakeReceipt):
+    def __init__(self, events):
+        super().__init__(events)
+        self.extrinsic_hash = '0xabc'
+        self.block_hash = '0xblock'
+        self.block_number = None
+        self.substrate = FakeReconcileSubstrate()
+
+
+class FakeSignedExtrinsic:
+    def __init__(self, extrinsic_hash):
+        self.extrinsic_hash = extrinsic_hash
+
+
+class FakeResponseWithExtrinsic:
+    def __init__(self, extrinsic):
+        self.extrinsic = extrinsic
+        self.extrinsic_receipt = None
+
+
+class FakeChainSubstrate:
+    """Blocks appear one poll after they are first asked for, like a live head."""
+
+    def __init__(self, head, blocks, events):
+        self.head = head
+        self.blocks = blocks
+        self.events = events
+        self.retrieved = []
+
+    async def get_block_number(self, block_hash):
+        return self.head
+
+    async def get_block_hash(self, number):
+        if number > self.head:
+            self.head += 1
+            return None
+        return hex(number)
+
+    async def get_block(self, block_hash):
+        return {'extrinsics': [FakeSignedExtrinsic(h) for h in self.blocks.get(int(block_hash, 16), [])]}
+
+    def retrieve_extrinsic_by_hash(self, block_hash, extrinsic_hash):
+        self.retrieved.append((block_hash, extrinsic_hash))
+        receipt = FakeReconcileReceipt(self.events)
+        receipt.extrinsic_hash = extrinsic_hash
+        receipt.block_hash = block_hash
+        return receipt
+
+
+class StalledChainSubstrate(FakeChainSubstrate):
+    """A node that does not answer block lookups until released."""
+
+    def __init__(self, head, blocks, events):
+        super().__init__(head, blocks, events)
+        self.release = asyncio.Event()
+
+    async def get_block_hash(self, number):
+        await self.release.wait()
+        return await super().get_block_hash(number)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,699 @@
+"""Trade helpers: intra-block trade triggers, the per-tick trade plan, rotation pair planning and batched or pipelined staking calls and fill reconciliation."""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TriggerEngine:
+    """Fires a trade as soon as a roster pool crosses its buy or sell trigger.
+
+    The bot publishes each live subnet's current trigger prices once per tick
+    via set_triggers(). notify(netuid) is hooked to pool storage updates; it
+    re-quotes the spot price for that subnet and, if the price is at or below
+    buy_at or above sell_at, awaits dispatch(netuid, side, price) without
+    waiting for the next tick. Notifications for a subnet that is already
+    being checked are coalesced into one more check.
+    """
+
+    def __init__(self, dispatch, quote_price):
+        self._dispatch = dispatch
+        self._quote_price = quote_price
+        self.triggers = {}
+        self.fired = 0
+        self.checks = 0
+        self.last_reaction_seconds = None
+        self._checking = set()
+        self._recheck = set()
+        self._tasks = set()
+
+    def set_triggers(self, triggers):
+        """Replace the trigger table: {netuid: {'buy_at': float|None, 'sell_at': float|None}}."""
+        self.triggers = {
+            netuid: band for netuid, band in triggers.items()
+            if band.get('buy_at') is not None or band.get('sell_at') is not None
+        }
+
+    def crossed_side(self, netuid, price):
+        band = self.triggers.get(netuid)
+        if band is None or price <= 0:
+            return None
+        if band.get('buy_at') is not None and price < band['buy_at']:
+            return 'buy'
+        if band.get('sell_at') is not None and price > band['sell_at']:
+            return 'sell'
+        return None
+
+    def notify(self, netuid):
+        if netuid not in self.triggers:
+            return
+        if netuid in self._checking:
+            self._recheck.add(netuid)
+            return
+        self._checking.add(netuid)
+        task = asyncio.create_task(self._check(netuid, time.monotonic()))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _check(self, netuid, noticed_at):
+        try:
+            while True:
+                # Let the paired reserve update from the same block land first.
+                await asyncio.sleep(0)
+                self._recheck.discard(netuid)
+                self.checks += 1
+                price = float(await self._quote_price(netuid))
+                side = self.crossed_side(netuid, price)
+                if side is not None:
+                    self.fired += 1
+                    logger.info(f'Trigger sn{netuid}: {side} at price {price} ({self.triggers[netuid]})')
+                    await self._dispatch(netuid, side, price)
+                    self.last_reaction_seconds = time.monotonic() - noticed_at
+                if netuid not in self._recheck:
+                    return
+                noticed_at = time.monotonic()
+        except Exception as e:
+            logger.error(f'Trigger check for sn{netuid} failed: {type(e).__name__} {e}')
+        finally:
+            self._checking.discard(netuid)
+            self._recheck.discard(netuid)
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def describe(self):
+        reaction = f'{self.last_reaction_seconds:.2f}s' if self.last_reaction_seconds is not None else 'n/a'
+        return f'triggers={len(self.triggers)}, fired={self.fired}, last_reaction={reaction}'
+
+
+class TradePlan:
+    """Per-tick memo of the candidate buy and sell legs for each subnet.
+
+    Preview checks, execution, rotation and the table all ask the bot for the
+    same legs several times per tick; the plan computes each (subnet, side,
+    options) leg once and hands back the stored result. Per-subnet inputs such
+    as the live patch and thresholds are memoized through subnet().
+
+    A plan belongs to the bot's state version it was started at; matches()
+    tells the bot when to start a new one. After a fill, invalidate_fill(netuid)
+    drops that subnet's legs plus every leg marked portfolio_wide (sized against
+    budget or allocation caps that the fill moved); invalidate_quote(netuid)
+    does the same after one pool is re-quoted. Both move the plan to the
+    version the bot bumped to for that change, so the rest of it is kept.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.subnets = {}
+        self.legs = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.requotes = 0
+
+    def matches(self, version):
+        return self.version == version
+
+    def subnet(self, netuid, build):
+        if netuid not in self.subnets:
+            self.subnets[netuid] = build()
+        return self.subnets[netuid]
+
+    def leg(self, netuid, side, options, build, portfolio_wide=False):
+        """Return the memoized build() result for this leg; exceptions are not cached."""
+        key = (netuid, side, options)
+        entry = self.legs.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        result = build()
+        self.legs[key] = (result, portfolio_wide)
+        return result
+
+    def invalidate_fill(self, netuid, version=None):
+        self.invalidations += 1
+        self._drop(netuid, version)
+
+    def invalidate_quote(self, netuid, version=None):
+        self.requotes += 1
+        self._drop(netuid, version)
+
+    def _drop(self, netuid, version):
+        if version is not None:
+            self.version = version
+        self.subnets.pop(netuid, None)
+        self.legs = {
+            key: entry for key, entry in self.legs.items()
+            if key[0] != netuid and not entry[1]
+        }
+
+    def describe(self):
+        return (
+            f'plan {len(self.legs)} legs, {self.hits} hits/{self.misses} misses, '
+            f'{self.invalidations} fill invalidations, {self.requotes} requotes'
+        )
+
+
+def allocate_cash(legs, spendable_tao, budget_tao=None, min_order_tao=0.01, fee_per_leg_tao=0.0):
+    """Split spendable TAO across buy legs, best score first.
+
+    legs is a list of {'netuid', 'max_tao', 'score', 'min_tao'} dicts, where
+    max_tao already carries every per-subnet cap. Filling legs greedily in
+    score order is the exact split for a linear score under a shared budget,
+    so one pass is enough. A leg that cannot get at least
+    max(min_order_tao, min_tao) is skipped and the cash stays for the next.
+    Every leg that is placed also holds fee_per_leg_tao of the cash back for
+    its fee; budget_tao only counts the staked amounts.
+    Returns [(netuid, tao_amount)] in execution order.
+    """
+    cash = max(0.0, float(spendable_tao))
+    budget = None if budget_tao is None else max(0.0, float(budget_tao))
+
+    split = []
+    for leg in sorted(legs, key=lambda leg: leg['score'], reverse=True):
+        room = cash - fee_per_leg_tao if budget is None else min(cash - fee_per_leg_tao, budget)
+        amount = min(float(leg['max_tao']), room)
+        if amount < max(min_order_tao, float(leg.get('min_tao', 0.0))):
+            continue
+        split.append((leg['netuid'], amount))
+        cash -= amount + fee_per_leg_tao
+        if budget is not None:
+            budget -= amount
+    return split
+
+
+class RotationPairPlan:
+    """Rotation edges for every (target, source) pair, computed as one matrix.
+
+    Targets are roster subnets with a buy leg; discount is how far each sits
+    below its buy threshold. Sources are held subnets with a sell leg; weakness
+    is how far each sits below its sell threshold. A pair is eligible when the
+    target clears discount_floor, the source clears weakness_floor, they are
+    different subnets and share a hotkey. Its gross edge is discount + weakness.
+
+    eligible_pairs() lists eligible pairs in roster order, targets first then
+    sources, which is the order the bot evaluated them in before the matrix
+    and so still breaks ties between equal net edges. near_misses() formats
+    diagnostics for rejected targets and pairs only when asked, and only the
+    closest `limit` of each kind.
+    """
+
+    def __init__(self, targets, discounts, target_hotkeys, sources, weaknesses, source_hotkeys,
+                 discount_floor, weakness_floor):
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self.sources = np.asarray(sources, dtype=np.int64)
+        self.discounts = np.asarray(discounts, dtype=float)
+        self.weaknesses = np.asarray(weaknesses, dtype=float)
+        self.discount_floor = discount_floor
+        self.weakness_floor = weakness_floor
+
+        self.target_ok = self.discounts >= discount_floor
+        source_ok = self.weaknesses >= weakness_floor
+        distinct = self.targets[:, None] != self.sources[None, :]
+        self.target_hotkeys = list(target_hotkeys)
+        self.source_hotkeys = list(source_hotkeys)
+        hotkey_codes = {}
+        target_codes = np.array([hotkey_codes.setdefault(hotkey, len(hotkey_codes)) for hotkey in self.target_hotkeys], dtype=np.int64)
+        source_codes = np.array([hotkey_codes.setdefault(hotkey, len(hotkey_codes)) for hotkey in self.source_hotkeys], dtype=np.int64)
+        same_hotkey = target_codes[:, None] == source_codes[None, :]
+        live = self.target_ok[:, None] & distinct
+        self.weak_source = live & ~source_ok[None, :]
+        self.hotkey_mismatch = live & source_ok[None, :] & ~same_hotkey
+        self.eligible = live & source_ok[None, :] & same_hotkey
+
+    def _closeness(self, values, floor):
+        if floor <= 0:
+            return np.zeros_like(values)
+        return np.maximum(0.0, values / floor)
+
+    def eligible_pairs(self):
+        """Eligible pairs as (target, source, discount, weakness), in roster order."""
+        rows, cols = np.nonzero(self.eligible)  # row-major: each target's sources in turn
+        return [
+            (int(self.targets[i]), int(self.sources[j]), float(self.discounts[i]), float(self.weaknesses[j]))
+            for i, j in zip(rows, cols)
+        ]
+
+    def near_misses(self, limit):
+        """Up to `limit` of the closest misses of each kind as {'priority', 'closeness', 'message'} dicts."""
+        if limit <= 0:
+            return []
+        misses = []
+        target_closeness = self._closeness(self.discounts, self.discount_floor)
+        for i in np.flatnonzero(~self.target_ok)[np.argsort(-target_closeness[~self.target_ok], kind='stable')][:limit]:
+            misses.append({
+                'priority': 1.0,
+                'closeness': float(target_closeness[i]),
+                'message': (
+                    f'sn{self.targets[i]} target_discount {self.discounts[i]:.2%} < '
+                    f'{self.discount_floor:.2%}'
+                ),
+            })
+
+        weakness_closeness = self._closeness(self.weaknesses, self.weakness_floor)
+        rows, cols = np.nonzero(self.weak_source)
+        for k in np.argsort(-weakness_closeness[cols], kind='stable')[:limit]:
+            i, j = rows[k], cols[k]
+            misses.append({
+                'priority': 2.0,
+                'closeness': float(weakness_closeness[j]),
+                'message': (
+                    f'sn{self.sources[j]}->sn{self.targets[i]} source_weakness {self.weaknesses[j]:.2%} < '
+                    f'{self.weakness_floor:.2%} (target_discount={self.discounts[i]:.2%})'
+                ),
+            })
+
+        rows, cols = np.nonzero(self.hotkey_mismatch)
+        pair_closeness = np.minimum(
+            target_closeness[rows] if self.discount_floor > 0 else np.ones(len(rows)),
+            weakness_closeness[cols] if self.weakness_floor > 0 else np.ones(len(cols)),
+        )
+        for k in np.argsort(-pair_closeness, kind='stable')[:limit]:
+            i, j = rows[k], cols[k]
+            misses.append({
+                'priority': 2.5,
+                'closeness': float(pair_closeness[k]),
+                'message': (
+                    f'sn{self.sources[j]}->sn{self.targets[i]} hotkey mismatch '
+                    f'({self.source_hotkeys[j]} != {self.target_hotkeys[i]})'
+                ),
+            })
+        return misses
+
+
+RAO_PER_TAO = 1e9
+ERA_PERIOD_BLOCKS = 64  # an extrinsic not included within ~13 minutes is dropped instead of landing late
+
+
+def decode_batch_outcomes(events, call_count):
+    """Map a Utility.force_batch receipt's events to one (ok, error) per call, in call order.
+
+    force_batch emits ItemCompleted or ItemFailed for every call it dispatched.
+    Calls with no item event were never reached and are reported as failed.
+    """
+    outcomes = []
+    for event in events:
+        data = event['event']
+        if data['module_id'] != 'Utility':
+            continue
+        if data['event_id'] == 'ItemCompleted':
+            outcomes.append((True, None))
+        elif data['event_id'] == 'ItemFailed':
+            attributes = data['attributes']
+            outcomes.append((False, attributes.get('error', attributes) if isinstance(attributes, dict) else attributes))
+    outcomes = outcomes[:call_count]
+    outcomes.extend((False, 'not dispatched') for _ in range(call_count - len(outcomes)))
+    return outcomes
+
+
+class StakeBatch:
+    """Packs stake, unstake and swap calls into one Utility.force_batch extrinsic.
+
+    Every call is the price-limited variant (add_stake_limit, remove_stake_limit,
+    swap_stake_limit) with its own limit, so one leg breaching its slippage bound
+    fails alone while the others still execute. The batch costs one signature,
+    one base fee and one inclusion wait.
+    """
+
+    def __init__(self, sub, wallet):
+        self.sub = sub
+        self.wallet = wallet
+        self.calls = []
+        self.limit_prices = []
+
+    def __len__(self):
+        return len(self.calls)
+
+    async def _add(self, function, params, limit):
+        self.calls.append(await self.sub.compose_call(
+            call_module='SubtensorModule', call_function=function, call_params=params,
+        ))
+        self.limit_prices.append(limit)
+
+    async def add_stake(self, hotkey, netuid, amount, limit_price, allow_partial=False):
+        """Stake `amount` (Balance) TAO, refusing to pay more than limit_price TAO per alpha."""
+        await self._add('add_stake_limit', {
+            'hotkey': hotkey, 'netuid': netuid, 'amount_staked': amount.rao,
+            'limit_price': int(limit_price * RAO_PER_TAO), 'allow_partial': allow_partial,
+        }, limit_price)
+
+    async def remove_stake(self, hotkey, netuid, amount, limit_price, allow_partial=False):
+        """Unstake `amount` (Balance) alpha, refusing to receive less than limit_price TAO per alpha."""
+        await self._add('remove_stake_limit', {
+            'hotkey': hotkey, 'netuid': netuid, 'amount_unstaked': amount.rao,
+            'limit_price': int(limit_price * RAO_PER_TAO), 'allow_partial': allow_partial,
+        }, limit_price)
+
+    async def swap_stake(self, hotkey, origin_netuid, destination_netuid, amount, limit_ratio, allow_partial=False):
+        """Swap `amount` (Balance) alpha between subnets, bounded by the origin/destination price ratio."""
+        await self._add('swap_stake_limit', {
+            'hotkey': hotkey, 'origin_netuid': origin_netuid, 'destination_netuid': destination_netuid,
+            'alpha_amount': amount.rao, 'limit_price': limit_ratio, 'allow_partial': allow_partial,
+        }, limit_ratio)
+
+    async def build_call(self):
+        """The call to sign: the bare call for a single leg, otherwise a force_batch of all legs."""
+        if len(self.calls) == 1:
+            return self.calls[0]
+        return await self.sub.compose_call(
+            call_module='Utility', call_function='force_batch', call_params={'calls': self.calls},
+        )
+
+    async def outcomes(self, response):
+        """Per-call (ok, error) for a response to build_call(), or None if it was never included."""
+        if response.extrinsic_receipt is None:
+            return None
+        if not response.success:
+            return [(False, response.message)] * len(self.calls)
+        if len(self.calls) == 1:
+            return [(True, None)]
+        events = await response.extrinsic_receipt.triggered_events
+        return decode_batch_outcomes(events, len(self.calls))
+
+    async def submit(self, wait_for_inclusion=True, period=ERA_PERIOD_BLOCKS):
+        """Sign and send the batch with a mortal era of `period` blocks.
+
+        Returns (response, outcomes); outcomes is None if the batch did not land.
+        """
+        batch_call = await self.sub.compose_call(
+            call_module='Utility', call_function='force_batch', call_params={'calls': self.calls},
+        )
+        response = await self.sub.sign_and_send_extrinsic(
+            call=batch_call,
+            wallet=self.wallet,
+            wait_for_inclusion=wait_for_inclusion,
+            wait_for_finalization=False,
+            nonce_key='coldkeypub',
+            use_nonce=True,
+            period=period,
+        )
+        if not response.success:
+            return response, None
+        events = await response.extrinsic_receipt.triggered_events
+        return response, decode_batch_outcomes(events, len(self.calls))
+
+
+class PreparedExtrinsic:
+    """A stake or unstake extrinsic composed and signed before the block it is meant for.
+
+    It carries the leg's amount (Balance), its price limit and the nonce it was
+    signed with. confirms() decides whether a freshly planned trade may reuse
+    it. The trade must be on the same side, subnet and hotkey. Its amount may
+    be at most amount_tolerance larger than the prepared one, never smaller.
+    The signed limit must still be reachable at the fresh price but no looser
+    than the fresh trade's own slippage bound.
+    """
+
+    __slots__ = ('side', 'netuid', 'hotkey', 'amount', 'limit_price', 'nonce', 'extrinsic', 'prepared_at')
+
+    def __init__(self, side, netuid, hotkey, amount, limit_price, nonce, extrinsic):
+        self.side = side
+        self.netuid = netuid
+        self.hotkey = hotkey
+        self.amount = amount
+        self.limit_price = limit_price
+        self.nonce = nonce
+        self.extrinsic = extrinsic
+        self.prepared_at = time.monotonic()
+
+    def confirms(self, trade, price, amount_tolerance=0.1):
+        side = 'buy' if 'tao_amount' in trade else 'sell'
+        if (side, trade['netuid'], trade['hotkey']) != (self.side, self.netuid, self.hotkey):
+            return False
+        fresh_rao = (trade['tao_amount'] if side == 'buy' else trade['alpha_amount']).rao
+        if not (1.0 - amount_tolerance) * fresh_rao <= self.amount.rao <= fresh_rao:
+            return False
+        if side == 'buy':
+            return price <= self.limit_price <= price * (1 + trade['max_slippage'])
+        return price * (1 - trade['max_slippage']) <= self.limit_price <= price
+
+
+class SubmissionPipeline:
+    """Signs and sends staking extrinsics back-to-back, tracking each one in the background.
+
+    submit() takes a nonce from the NonceManager, starts a task that sends the
+    extrinsic and waits for inclusion, and returns without waiting. When the
+    extrinsic lands (or is rejected) the task calls on_result(response,
+    outcomes) with the per-call outcomes from StakeBatch.outcomes(); outcomes
+    is None when no outcome is known. The nonce is resynced from the chain
+    whenever the pipeline is idle and after any rejection or timeout.
+
+    Extrinsics are signed with a mortal era of `period` blocks. One that is
+    not included within `timeout` may still land until its era ends, so the
+    task keeps polling the chain and only reports it once the account's
+    on-chain nonce has moved past it (it landed late, outcome unknown) or the
+    head has passed the era (it can no longer land).
+    """
+
+    def __init__(self, nonces, period=ERA_PERIOD_BLOCKS, timeout=60.0, poll_interval=12.0):
+        self.nonces = nonces
+        self.period = period
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.pending = set()
+        self.submitted = 0
+        self.landed = 0
+        self.landed_late = 0
+        self.expired = 0
+        self.rejected = 0
+
+    async def submit(self, batch, on_result):
+        call = await batch.build_call()
+        nonce = await self.nonces.next(batch.sub.substrate, resync=not self.pending)
+        task = asyncio.create_task(self._track(batch, call, nonce, on_result))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+        self.submitted += 1
+        return nonce
+
+    async def _track(self, batch, call, nonce, on_result):
+        timed_out = False
+        try:
+            response = await asyncio.wait_for(
+                batch.sub.sign_and_send_extrinsic(
+                    call=call,
+                    wallet=batch.wallet,
+                    nonce=nonce,
+                    wait_for_inclusion=True,
+                    wait_for_finalization=False,
+                    period=self.period,
+                ),
+                timeout=self.timeout,
+            )
+            outcomes = await batch.outcomes(response)
+        except asyncio.TimeoutError:
+            timed_out = True
+            response, outcomes = await self._await_era(batch.sub.substrate, nonce), None
+        except Exception as e:
+            logger.error(f'Pipelined extrinsic with nonce {nonce} failed: {e}')
+            response, outcomes = str(e), None
+        if outcomes is None:
+            # A nonce that never landed leaves a gap; later ones will wait behind it.
+            self.nonces.reset()
+            if not timed_out:
+                self.rejected += 1
+        else:
+            self.landed += 1
+        try:
+            on_result(response, outcomes)
+        except Exception as e:
+            logger.error(f'Error booking pipelined extrinsic with nonce {nonce}: {e}')
+
+    async def _await_era(self, substrate, nonce):
+        """Poll until a timed-out extrinsic's nonce is consumed or its era has passed; describe which."""
+        # The era was born at or before the current head, so this bounds its end from above.
+        expires_after = None
+        while True:
+            try:
+                if await substrate.get_account_nonce(self.nonces.address) > nonce:
+                    self.landed_late += 1
+                    return f'not included within {self.timeout:.0f}s but nonce {nonce} was consumed later'
+                head = await substrate.get_block_number(None)
+                if expires_after is None:
+                    expires_after = head + self.period
+                elif head > expires_after:
+                    self.expired += 1
+                    return f'not included within {self.timeout:.0f}s and its era ended by block {expires_after}'
+            except Exception as e:
+                logger.warning(f'Error checking pipelined nonce {nonce} after its inclusion timeout: {e}')
+            await asyncio.sleep(self.poll_interval)
+
+    async def drain(self):
+        """Wait for every in-flight extrinsic to land or fail."""
+        while self.pending:
+            await asyncio.gather(*list(self.pending), return_exceptions=True)
+
+    def describe(self):
+        return (
+            f'pipeline submitted={self.submitted}, landed={self.landed}, landed_late={self.landed_late}, '
+            f'expired={self.expired}, rejected={self.rejected}, in_flight={len(self.pending)}, '
+            f'{self.nonces.describe()}'
+        )
+
+
+def decode_stake_events(events):
+    """Realized legs from SubtensorModule StakeAdded / StakeRemoved events, in event order.
+
+    Both events carry (coldkey, hotkey, tao, alpha, netuid, fee) in rao. The
+    swap fee is charged in the input token, so an unstake's fee is alpha and is
+    converted to TAO at the leg's effective price. A swap emits one of each.
+    """
+    legs = []
+    for record in events:
+        event = record.get('event', record)
+        if event.get('module_id') != 'SubtensorModule' or event.get('event_id') not in ('StakeAdded', 'StakeRemoved'):
+            continue
+        attributes = event.get('attributes')
+        values = list(attributes.values()) if isinstance(attributes, dict) else list(attributes or ())
+        if len(values) < 6:
+            continue
+        tao = int(values[2]) / RAO_PER_TAO
+        alpha = int(values[3]) / RAO_PER_TAO
+        price = tao / alpha if alpha > 0 else 0.0
+        fee = int(values[5]) / RAO_PER_TAO
+        side = 'buy' if event['event_id'] == 'StakeAdded' else 'sell'
+        legs.append({
+            'side': side, 'netuid': int(values[4]), 'tao_amount': tao, 'alpha_amount': alpha,
+            'price': price, 'fee_tao': fee if side == 'buy' else fee * price,
+        })
+    return legs
+
+
+def extrinsic_hash_of(response):
+    """0x-prefixed hash of the signed extrinsic an ExtrinsicResponse was built for, if any."""
+    extrinsic_hash = getattr(getattr(response, 'extrinsic', None), 'extrinsic_hash', None)
+    if not extrinsic_hash:
+        return None
+    return extrinsic_hash if isinstance(extrinsic_hash, str) else f'0x{extrinsic_hash.hex()}'
+
+
+class FillReconciler:
+    """Replaces estimated fills with what the chain actually moved, off the trading path.
+
+    submit() queues an extrinsic receipt with the fills booked from it; each
+    fill is {'fill_id', 'netuid', 'side'}. submit_pending() does the same for
+    an extrinsic sent without waiting for inclusion, from its hash: a task of
+    its own scans blocks forward from the submission block until it finds
+    the extrinsic, giving up after search_blocks blocks or locate_timeout
+    seconds, and only then queues its receipt, so a slow search never holds
+    up receipts behind it. The queue is worked through by one background
+    task, which reads each extrinsic's events, matches every fill to the
+    first unused stake event with the same side and netuid, and calls
+    on_realized(fill_id, realized) where realized holds tao_amount,
+    alpha_amount, price, fee_tao, tx_hash and block_number. Fills without a
+    matching event keep their estimate.
+    """
+
+    def __init__(self, on_realized, search_blocks=20, poll_interval=2.0, locate_timeout=300.0):
+        self.on_realized = on_realized
+        self.search_blocks = search_blocks
+        self.poll_interval = poll_interval
+        self.locate_timeout = locate_timeout
+        self.reconciled = 0
+        self.unmatched = 0
+        self.not_included = 0
+        self.failed = 0
+        self._queue = deque()
+        self._task = None
+        self._locating = set()
+
+    def submit(self, receipt, fills):
+        if receipt is None or not fills:
+            return
+        self._enqueue((receipt, fills, None))
+
+    def submit_pending(self, substrate, extrinsic_hash, fills, from_block=None):
+        if not extrinsic_hash or not fills:
+            return
+        task = asyncio.create_task(self._locate_and_enqueue(substrate, extrinsic_hash, fills, from_block))
+        self._locating.add(task)
+        task.add_done_callback(self._locating.discard)
+
+    def _enqueue(self, item):
+        self._queue.append(item)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._drain_queue())
+
+    async def _locate_and_enqueue(self, substrate, extrinsic_hash, fills, from_block):
+        try:
+            located = await asyncio.wait_for(self._locate(substrate, extrinsic_hash, from_block), timeout=self.locate_timeout)
+        except Exception as e:
+            self.failed += len(fills)
+            logger.warning(f'Could not locate extrinsic {extrinsic_hash} to reconcile fills: {type(e).__name__} {e}')
+            return
+        if located is None:
+            self.not_included += len(fills)
+            logger.info(f'Extrinsic {extrinsic_hash} not found in {self.search_blocks} blocks; keeping estimated fills')
+            return
+        receipt, block_number = located
+        self._enqueue((receipt, fills, block_number))
+
+    async def _drain_queue(self):
+        while self._queue:
+            receipt, fills, block_number = self._queue.popleft()
+            try:
+                await self._reconcile(receipt, fills, block_number)
+            except Exception as e:
+                self.failed += len(fills)
+                source = getattr(receipt, 'extrinsic_hash', None) or receipt
+                logger.warning(f'Could not reconcile fills from {source}: {type(e).__name__} {e}')
+
+    async def _locate(self, substrate, extrinsic_hash, from_block):
+        """Find the block that included extrinsic_hash; returns (receipt, block_number) or None."""
+        number = from_block if from_block is not None else await substrate.get_block_number(None)
+        last = number + self.search_blocks
+        while number <= last:
+            block_hash = await substrate.get_block_hash(number)
+            if block_hash is None:  # not produced yet
+                await asyncio.sleep(self.poll_interval)
+                continue
+            block = await substrate.get_block(block_hash=block_hash)
+            for extrinsic in block['extrinsics']:
+                found = getattr(extrinsic, 'extrinsic_hash', None)
+                if found and f'0x{found.hex()}' == extrinsic_hash:
+                    return substrate.retrieve_extrinsic_by_hash(block_hash, extrinsic_hash), number
+            number += 1
+        return None
+
+    async def _reconcile(self, receipt, fills, block_number=None):
+        events = decode_stake_events(await receipt.triggered_events)
+        if block_number is None:
+            block_number = receipt.block_number
+        if block_number is None:
+            block_number = await receipt.substrate.get_block_number(receipt.block_hash)
+        for fill in fills:
+            match = next(
+                (leg for leg in events if leg['side'] == fill['side'] and leg['netuid'] == fill['netuid']),
+                None,
+            )
+            if match is None:
+                self.unmatched += 1
+                continue
+            events.remove(match)
+            realized = dict(match, tx_hash=receipt.extrinsic_hash or '', block_number=int(block_number or 0))
+            del realized['side'], realized['netuid']
+            self.on_realized(fill['fill_id'], realized)
+            self.reconciled += 1
+
+    async def drain(self):
+        """Wait until every pending search has finished and every queued receipt has been processed."""
+        while self._locating or (self._task is not None and not self._task.done()):
+            if self._locating:
+                await asyncio.gather(*list(self._locating), return_exceptions=True)
+            if self._task is not None and not self._task.done():
+                await self._task
+
+    def describe(self):
+        return (
+            f'fills reconciled={self.reconciled}, unmatched={self.unmatched}, '
+            f'not included={self.not_included}, failed={self.failed}'
+        )